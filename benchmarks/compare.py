@@ -0,0 +1,76 @@
+"""Compare two benchmark results and flag regressions
+
+    python -m benchmarks.compare benchmarks/results/burst-old.json benchmarks/results/burst-new.json
+
+Exits with 1 when a metric got worse by more than --threshold percent.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# (path into "results", True if higher is better)
+METRICS: List[Tuple[str, bool]] = [
+    ("throughput_requests_per_second", True),
+    ("throughput_upload_bytes_per_second", True),
+    ("time_to_first_file.p50", False),
+    ("time_to_first_file.p99", False),
+    ("request_latency.p50", False),
+    ("request_latency.p99", False),
+    ("loop_lag.p99", False),
+    ("loop_lag.max", False),
+    ("loop_blocks.seconds", False),
+    ("peak_rss_bytes", False),
+    ("peak_disk_bytes", False),
+    ("failed", False),
+    ("timeout", False)
+]
+
+def _lookup(results: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = results
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float) -> Tuple[List[str], bool]:
+    """Return report lines and whether any metric regressed beyond `threshold` percent"""
+    lines = [f"{'metric':<36} {'baseline':>14} {'candidate':>14} {'change':>9}"]
+    regressed = False
+    for path, higher_is_better in METRICS:
+        old, new = _lookup(baseline["results"], path), _lookup(candidate["results"], path)
+        if old is None or new is None:
+            continue
+        if old:
+            change = (new - old) / old * 100
+        else:
+            change = 0.0 if not new else float("inf")
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        lines.append(f"{path:<36} {old:>14.4g} {new:>14.4g} {change:>+8.1f}%{flag}")
+    return lines, regressed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    candidate = json.loads(args.candidate.read_text())
+    if baseline["params"] != candidate["params"]:
+        print("Warning: the runs used different parameters")
+
+    print(f"{baseline['scenario']} @ {baseline['git_revision']} vs {candidate['scenario']} @ {candidate['git_revision']}")
+    lines, regressed = compare(baseline, candidate, args.threshold)
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
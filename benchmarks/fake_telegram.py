@@ -0,0 +1,259 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+# Methods that upload media, and the field the file or file_id goes in
+FILE_METHODS = {
+    "sendaudio": "audio",
+    "sendvideo": "video",
+    "senddocument": "document"
+}
+
+class Call:
+    """One Bot API request the bot made"""
+
+    def __init__(self, method: str, chat_id: Optional[int], params: Dict[str, Any], at: float):
+        self.method = method
+        self.chat_id = chat_id
+        self.params = params
+        self.at = at  # time.monotonic() when the request arrived
+        self.result: Any = None
+        self.upload_bytes = 0
+
+    @property
+    def is_file(self) -> bool:
+        return self.method in FILE_METHODS
+
+    @property
+    def text(self) -> str:
+        return self.params.get("text", "")
+
+class FakeBotAPI:
+    """Local stand-in for the Telegram Bot API server
+
+    Answers the methods the bot uses with well-formed results and records
+    every call per chat, so scenario drivers can wait for the bot's
+    replies. Uploads are read as they stream in and can be throttled to
+    `upload_bandwidth` bytes per second; every call is delayed by
+    `latency` seconds. Re-sent file_ids must be ones this server issued.
+
+    The server runs its own event loop on a background thread, so its work
+    doesn't show up as the bot's loop lag. The calls are owned by that
+    loop; read them through `wait_for` and `get_calls`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        upload_bandwidth: Optional[float] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.upload_bandwidth = upload_bandwidth
+
+        self.calls: Dict[Optional[int], List[Call]] = defaultdict(list)
+        self.method_counts: Dict[str, int] = defaultdict(int)
+        self.upload_bytes = 0
+        self._file_ids: Dict[str, Tuple[str, int]] = {}  # file_id: (kind, size)
+        self._message_ids = defaultdict(lambda: itertools.count(1))
+        self._changed: Dict[Optional[int], asyncio.Condition] = defaultdict(asyncio.Condition)
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for GamdlBot's base_url; the token is appended to it"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        """Start serving on the server's own thread"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        await self._on_server(self._start())
+        logger.info(f"Fake Bot API listening on {self.base_url}")
+
+    async def stop(self):
+        if self._loop is None:
+            return
+        await self._on_server(self._stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        await asyncio.to_thread(self._thread.join)
+        self._loop.close()
+        self._loop = None
+
+    async def _on_server(self, coro: Awaitable) -> Any:
+        """Run a coroutine on the server's loop and await it from the caller's"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def _start(self):
+        app = web.Application(client_max_size=2 * 1024 ** 3)  # Local Bot API server upload limit
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def _stop(self):
+        await self._runner.cleanup()
+        self._runner = None
+
+    async def wait_for(
+        self,
+        chat_id: int,
+        predicate: Callable[[Call], bool],
+        start: int = 0,
+        timeout: Optional[float] = None
+    ) -> Tuple[int, Call]:
+        """Wait for a call to `chat_id` matching `predicate`, from the `start`-th on
+
+        Returns the call and its index, so the next wait can resume after it.
+        """
+        return await asyncio.wait_for(self._on_server(self._find(chat_id, predicate, start)), timeout)
+
+    async def get_calls(self, chat_id: int, start: int = 0, end: Optional[int] = None) -> List[Call]:
+        """Calls to `chat_id` from the `start`-th up to the `end`-th"""
+        async def read() -> List[Call]:
+            return self.calls[chat_id][start:end]
+
+        return await self._on_server(read())
+
+    async def _find(self, chat_id: int, predicate: Callable[[Call], bool], position: int) -> Tuple[int, Call]:
+        calls = self.calls[chat_id]
+        condition = self._changed[chat_id]
+        async with condition:
+            while True:
+                for index in range(position, len(calls)):
+                    if predicate(calls[index]):
+                        return index, calls[index]
+                position = len(calls)
+                await condition.wait()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        call = Call(method, None, {}, time.monotonic())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if request.content_type.startswith("multipart/"):
+            await self._read_multipart(request, call)
+        else:
+            call.params = await self._read_params(request)
+        call.chat_id = _to_int(call.params.get("chat_id"))
+        self.method_counts[method] += 1
+
+        try:
+            call.result = self._answer(call)
+        except _BadRequest as e:
+            return web.json_response({"ok": False, "error_code": 400, "description": str(e)})
+
+        condition = self._changed[call.chat_id]
+        async with condition:
+            self.calls[call.chat_id].append(call)
+            condition.notify_all()
+        return web.json_response({"ok": True, "result": call.result})
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    async def _read_multipart(self, request: web.Request, call: Call):
+        """Read form fields and count (and throttle) uploaded file bytes"""
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename is None:
+                call.params[part.name] = await part.text()
+                continue
+            call.params[part.name] = {"filename": part.filename}
+            started = time.monotonic()
+            while True:
+                chunk = await part.read_chunk(256 * 1024)
+                if not chunk:
+                    break
+                call.upload_bytes += len(chunk)
+                if self.upload_bandwidth:
+                    ahead = call.upload_bytes / self.upload_bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+        self.upload_bytes += call.upload_bytes
+
+    def _message(self, chat_id: int, message_id: Optional[int] = None, **fields) -> Dict[str, Any]:
+        return {
+            "message_id": message_id or next(self._message_ids[chat_id]),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            **fields
+        }
+
+    def _answer(self, call: Call) -> Any:
+        params = call.params
+        if call.method == "getme":
+            return BOT_USER
+        if call.method == "getupdates":
+            return []  # Updates are pushed into the application directly
+        if call.method == "sendmessage":
+            fields = {"text": params.get("text", "")}
+            if params.get("reply_markup"):
+                fields["reply_markup"] = _json(params["reply_markup"])
+            return self._message(call.chat_id, **fields)
+        if call.method in ("editmessagetext", "editmessagereplymarkup"):
+            fields = {"text": params.get("text", "")}
+            if params.get("reply_markup"):
+                fields["reply_markup"] = _json(params["reply_markup"])
+            return self._message(
+                call.chat_id, _to_int(params.get("message_id")), edit_date=int(time.time()), **fields
+            )
+        if call.method in FILE_METHODS:
+            return self._message(call.chat_id, **{FILE_METHODS[call.method]: self._attachment(call)})
+        # answerCallbackQuery, deleteMessage, sendChatAction, setWebhook, ...
+        return True
+
+    def _attachment(self, call: Call) -> Dict[str, Any]:
+        kind = FILE_METHODS[call.method]
+        media = call.params.get(kind)
+        if isinstance(media, dict):
+            file_id = f"{kind}-{len(self._file_ids) + 1}"
+            self._file_ids[file_id] = (kind, call.upload_bytes)
+        elif media in self._file_ids:
+            file_id = media
+        else:
+            raise _BadRequest("Bad Request: wrong file identifier/http url specified")
+
+        attachment = {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": self._file_ids[file_id][1]
+        }
+        if kind in ("audio", "video"):
+            attachment["duration"] = 0
+        if kind == "video":
+            attachment.update(width=0, height=0)
+        return attachment
+
+class _BadRequest(Exception):
+    pass
+
+def _to_int(value: Any) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+def _json(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, str) else value
@@ -0,0 +1,290 @@
+import asyncio
+import itertools
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+from bot.bot import GamdlBot
+from bot.handlers import auth_handler
+from bot.utils.metadata_cache import CachedDownloader, MetadataCache
+from bot.utils.profiling import percentile
+
+from .fake_telegram import Call, FakeBotAPI
+from .synthetic import SyntheticDownloader
+
+logger = logging.getLogger(__name__)
+
+ADMIN_ID = 1
+LOG_CHANNEL_ID = -1001
+FIRST_USER_ID = 10000
+
+def _distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None
+    }
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes up a sleeping task"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.monotonic() - started - self.interval))
+
+class DiskSampler:
+    """Tracks the peak size of a directory tree from a background thread"""
+
+    def __init__(self, path: Path, interval: float = 0.5):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="disk-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass  # Moved or removed while walking
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+class BenchmarkRun:
+    """Replays users pasting links against the real bot, a FakeBotAPI and a SyntheticDownloader
+
+    Updates go through the application's update queue, so they reach
+    handle_download and handle_callback exactly as polled updates would.
+    Each user sends their links one after another: paste the link, press
+    the download button on the bot's reply, wait for the final status.
+    """
+
+    def __init__(self, params: Dict[str, Any], workdir: Path):
+        self.params = params
+        self.workdir = workdir
+        self.api = FakeBotAPI(latency=params["api_latency"], upload_bandwidth=params["upload_bandwidth"])
+        self.downloader = SyntheticDownloader(
+            tracks_per_release=params["tracks_per_release"],
+            track_size=params["track_size"],
+            resolve_latency=params["resolve_latency"],
+            track_latency=params["track_latency"],
+            jitter=params["jitter"],
+            seed=params["seed"]
+        )
+        self.requests: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._bot: Optional[GamdlBot] = None
+
+    def _plan(self) -> Dict[int, List[Tuple[str, bool]]]:
+        """Pick each user's (url, zip) requests from the catalog"""
+        rng = random.Random(self.params["seed"])
+        catalog = []
+        for index in range(self.params["catalog"]):
+            if rng.random() < self.params["album_ratio"]:
+                catalog.append(f"https://music.apple.com/us/album/benchmark-{index}/{1000 + index}")
+            else:
+                catalog.append(f"https://music.apple.com/us/song/benchmark-{index}/{1000 + index}")
+
+        return {
+            FIRST_USER_ID + user: [
+                (rng.choice(catalog), rng.random() < self.params["zip_ratio"])
+                for _ in range(self.params["links"])
+            ]
+            for user in range(self.params["users"])
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        plan = self._plan()
+        auth_handler.authorized_users.update(plan)
+
+        await self.api.start()
+        self._bot = GamdlBot(
+            token="123456:BENCHMARK",
+            admin_users=[ADMIN_ID],
+            auth_channels=[],
+            log_channel=LOG_CHANNEL_ID,
+            cache_cleanup_interval=3600,
+            downloader=CachedDownloader(self.downloader, MetadataCache()),
+            base_url=self.api.base_url
+        )
+        lag = LoopLagSampler()
+        disk = DiskSampler(self.workdir)
+        rss_before = _peak_rss()
+
+        await self._bot.start()
+        try:
+            lag.start()
+            disk.start()
+            started = time.monotonic()
+            await asyncio.gather(*[
+                self._run_user(user_id, links, index * self.params["ramp"] / len(plan))
+                for index, (user_id, links) in enumerate(plan.items())
+            ])
+            wall = time.monotonic() - started
+        finally:
+            await lag.stop()
+            disk.stop()
+            await self._bot.stop()
+            await self.api.stop()
+
+        return self._report(wall, lag, disk, rss_before)
+
+    async def _push(self, data: Dict[str, Any]):
+        app = self._bot.app
+        await app.update_queue.put(Update.de_json({"update_id": next(self._update_ids), **data}, app.bot))
+
+    async def _run_user(self, user_id: int, links: List[Tuple[str, bool]], delay: float):
+        await asyncio.sleep(delay)
+        for number, (url, zip_file) in enumerate(links):
+            if number:
+                await asyncio.sleep(self.params["think_time"])
+            self.requests.append(await self._request(user_id, url, zip_file))
+
+    async def _request(self, user_id: int, url: str, zip_file: bool) -> Dict[str, Any]:
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        timeout = self.params["timeout"]
+        start = len(await self.api.get_calls(user_id))
+        record = {"user_id": user_id, "url": url, "zip": zip_file, "status": "timeout"}
+
+        pasted = time.monotonic()
+        await self._push({"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": url
+        }})
+        try:
+            index, options = await self.api.wait_for(
+                user_id, lambda call: bool(call.params.get("reply_markup")), start, timeout
+            )
+            prefix = "dl_zip_" if zip_file else "dl_file_"
+            data = next(
+                button["callback_data"]
+                for row in options.result["reply_markup"]["inline_keyboard"]
+                for button in row
+                if button.get("callback_data", "").startswith(prefix)
+            )
+            message_id = options.result["message_id"]
+
+            await self._push({"callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": user,
+                "chat_instance": str(user_id),
+                "message": options.result,
+                "data": data
+            }})
+            done_index, done = await self.api.wait_for(
+                user_id,
+                lambda call: _is_final_status(call, message_id),
+                index + 1,
+                timeout - (time.monotonic() - pasted)
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"User {user_id} timed out on {url}")
+            return record
+
+        files = [call for call in await self.api.get_calls(user_id, index + 1, done_index) if call.is_file]
+        record.update(
+            status="completed" if done.text.startswith("✅") else "failed",
+            latency=done.at - pasted,
+            time_to_first_file=files[0].at - pasted if files else None,
+            files=len(files),
+            bytes=sum(call.upload_bytes for call in files)
+        )
+        return record
+
+    def _loop_blocks(self) -> Dict[str, Any]:
+        """Blocks the bot's LoopWatchdog saw, worst call sites first"""
+        watchdog = self._bot.loop_watchdog
+        sites = sorted(
+            ({"site": site, **stats} for site, stats in watchdog.sites.items()),
+            key=lambda stats: stats["seconds"],
+            reverse=True
+        )
+        return {
+            "loop_blocks": {
+                "threshold": watchdog.threshold,
+                "count": sum(stats["count"] for stats in sites),
+                "seconds": sum(stats["seconds"] for stats in sites),
+                "sites": sites
+            },
+            "loop_budget_violations": watchdog.violations
+        }
+
+    def _report(self, wall: float, lag: LoopLagSampler, disk: DiskSampler, rss_before: int) -> Dict[str, Any]:
+        by_status = {"completed": 0, "failed": 0, "timeout": 0}
+        for request in self.requests:
+            by_status[request["status"]] += 1
+        completed = [request for request in self.requests if request["status"] == "completed"]
+
+        return {
+            "requests": len(self.requests),
+            **by_status,
+            "wall_seconds": wall,
+            "throughput_requests_per_second": len(completed) / wall if wall else 0.0,
+            "throughput_upload_bytes_per_second": self.api.upload_bytes / wall if wall else 0.0,
+            "time_to_first_file": _distribution(
+                [r["time_to_first_file"] for r in completed if r["time_to_first_file"] is not None]
+            ),
+            "request_latency": _distribution([r["latency"] for r in completed]),
+            "loop_lag": _distribution(lag.samples),
+            **self._loop_blocks(),
+            "peak_rss_bytes": _peak_rss(),
+            "peak_rss_growth_bytes": _peak_rss() - rss_before,
+            "peak_disk_bytes": disk.peak,
+            "upload_bytes": self.api.upload_bytes,
+            "api_calls": dict(sorted(self.api.method_counts.items())),
+            "downloader": {"resolved": self.downloader.resolved, "downloaded": self.downloader.downloaded}
+        }
+
+def _is_final_status(call: Call, message_id: int) -> bool:
+    return (
+        call.method == "editmessagetext"
+        and str(call.params.get("message_id")) == str(message_id)
+        and call.text.startswith(("✅", "❌"))
+    )
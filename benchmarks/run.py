@@ -0,0 +1,176 @@
+"""Offline load test of the bot against a fake Bot API and a synthetic downloader
+
+Run from the repository root:
+
+    python -m benchmarks.run smoke
+    python -m benchmarks.run burst --users 100 --set track_latency=2
+    python -m benchmarks.run shared --strict 0.1
+
+Each run gets a scratch data directory, so it never touches data/. The
+results are printed and written as JSON to benchmarks/results/ (or
+--output); compare two runs with `python -m benchmarks.compare`. With
+--strict, the run fails if the bot blocks its event loop for longer than
+the given number of seconds at once; the offending stacks are reported.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+import config.config as config
+
+from .scenarios import SCENARIOS, get_scenario
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def isolate_config(workdir: Path, overrides: Dict[str, Any]):
+    """Point the bot's data paths at `workdir` and apply config overrides
+
+    Must run before the bot modules are imported, since they copy the
+    settings they use at import time.
+    """
+    data = workdir / "data"
+    settings = {
+        "DB_PATH": data / "bot.db",
+        "DOWNLOAD_DIR": data / "downloads",
+        "PARTIAL_DOWNLOAD_DIR": data / "downloads" / "partial",
+        "CACHE_DIR": data / "cache",
+        "TRACK_CACHE_DIR": data / "cache" / "tracks",
+        "CACHE_INDEX_PATH": data / "cache" / "index.db",
+        "METADATA_CACHE_PATH": data / "cache" / "metadata.db",
+        "JOB_QUEUE_PATH": data / "jobs.db",
+        "WORKER_PROCESSES": 0,
+        "METRICS_ENABLED": False,
+        "WEBHOOK_ENABLED": False,
+        "LOOP_WATCHDOG_ENABLED": True,
+        "MIN_FREE_DISK": 0,  # Don't let the host's free space drive cache eviction
+        **overrides
+    }
+    for name, value in settings.items():
+        if not hasattr(config, name):
+            raise KeyError(f"Unknown config setting {name}")
+        setattr(config, name, value)
+    for path in (config.DOWNLOAD_DIR, config.CACHE_DIR):
+        path.mkdir(parents=True, exist_ok=True)
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _parse_value(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def _summary(results: Dict[str, Any]) -> str:
+    def seconds(value):
+        return f"{value:.3f}s" if value is not None else "n/a"
+
+    first_file = results["time_to_first_file"]
+    lag = results["loop_lag"]
+    blocks = results["loop_blocks"]
+    worst = blocks["sites"][0]["site"] if blocks["sites"] else None
+    violations = len(results["loop_budget_violations"])
+    return (
+        f"Requests: {results['requests']} ({results['completed']} completed, "
+        f"{results['failed']} failed, {results['timeout']} timed out) in {results['wall_seconds']:.1f}s\n"
+        f"Throughput: {results['throughput_requests_per_second']:.2f} requests/s, "
+        f"{results['throughput_upload_bytes_per_second'] / 1024 ** 2:.1f} MB/s uploaded\n"
+        f"Time to first file: p50 {seconds(first_file['p50'])}, p99 {seconds(first_file['p99'])}\n"
+        f"Loop lag: p50 {seconds(lag['p50'])}, p99 {seconds(lag['p99'])}, max {seconds(lag['max'])}\n"
+        f"Loop blocks: {blocks['count']} ({blocks['seconds']:.3f}s)"
+        f"{f', worst at {worst}' if worst else ''}"
+        f"{f', {violations} over the budget' if violations else ''}\n"
+        f"Peak RSS: {results['peak_rss_bytes'] / 1024 ** 2:.0f} MB, "
+        f"peak disk: {results['peak_disk_bytes'] / 1024 ** 2:.0f} MB"
+    )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", nargs="?", default="smoke", choices=sorted(SCENARIOS))
+    parser.add_argument("--users", type=int, help="Override the number of users")
+    parser.add_argument("--links", type=int, help="Override the links per user")
+    parser.add_argument("--seed", type=int, help="Override the random seed")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="NAME=VALUE",
+        help="Override any scenario parameter; values are parsed as JSON when possible"
+    )
+    parser.add_argument(
+        "--strict", type=float, metavar="SECONDS",
+        help="Fail if the event loop is blocked for longer than this at once"
+    )
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR, help="Directory for the JSON results")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the scratch data directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's logs")
+    args = parser.parse_args()
+
+    overrides = {
+        name: value for name, value in
+        (("users", args.users), ("links", args.links), ("seed", args.seed))
+        if value is not None
+    }
+    for item in args.set:
+        name, _, value = item.partition("=")
+        overrides[name] = _parse_value(value)
+    params = get_scenario(args.scenario, **overrides)
+    if args.strict is not None:
+        params["config"] = {**params["config"], "LOOP_WATCHDOG_BUDGET": args.strict}
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO if args.verbose else logging.WARNING
+    )
+
+    workdir = Path(tempfile.mkdtemp(prefix="gamdl-bench-"))
+    started_at = datetime.utcnow()
+    try:
+        isolate_config(workdir, params["config"])
+        # Only now, with the config in place
+        from .harness import BenchmarkRun
+
+        results = asyncio.run(BenchmarkRun(params, workdir).run())
+    finally:
+        if args.keep_workdir:
+            print(f"Scratch data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "scenario": args.scenario,
+        "params": params,
+        "started_at": started_at.isoformat() + "Z",
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    path = args.output / f"{args.scenario}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.write_text(json.dumps(report, indent=2))
+
+    print(_summary(results))
+    print(f"Results written to {path}")
+    for violation in results["loop_budget_violations"]:
+        print(f"\nBlocked {violation['seconds']:.3f}s at {violation['site']}, task {violation['task']}:")
+        print(violation["stack"], end="")
+    if results["loop_budget_violations"] or results["completed"] != results["requests"]:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
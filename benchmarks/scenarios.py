@@ -0,0 +1,41 @@
+from typing import Any, Dict
+
+# Parameters every scenario starts from
+DEFAULTS: Dict[str, Any] = {
+    "users": 10,  # Simulated users, each pasting `links` links one after another
+    "links": 3,
+    "catalog": 20,  # Distinct releases the links are drawn from
+    "album_ratio": 0.5,  # Share of album links; the rest are songs
+    "zip_ratio": 0.0,  # Share of requests that pick "Download ZIP"
+    "ramp": 1.0,  # Seconds over which the users start
+    "think_time": 0.5,  # Seconds a user waits between links
+    "tracks_per_release": 10,
+    "track_size": 4 * 1024 * 1024,
+    "resolve_latency": 0.3,
+    "track_latency": 0.5,
+    "jitter": 0.2,
+    "api_latency": 0.0,  # Seconds added to every Bot API call
+    "upload_bandwidth": None,  # Upload bytes per second per request; None is unthrottled
+    "timeout": 600,  # Seconds a single link may take before it counts as timed out
+    "seed": 0,
+    "config": {}  # config.config overrides, e.g. {"MAX_CONCURRENT_DOWNLOADS": 10}
+}
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    # Quick end-to-end check of the harness and the bot
+    "smoke": {"users": 2, "links": 2, "catalog": 4, "tracks_per_release": 3, "track_size": 512 * 1024},
+    # Many users at once, mostly distinct releases: download slots and upload pacing
+    "burst": {"users": 50, "links": 2, "catalog": 200, "ramp": 0.5},
+    # Many users, few releases: in-flight dedup, track cache and file_id reuse
+    "shared": {"users": 50, "links": 3, "catalog": 5, "ramp": 2.0},
+    # ZIP delivery: archive building off the event loop and part uploads
+    "zip": {"users": 10, "links": 2, "catalog": 20, "album_ratio": 1.0, "zip_ratio": 1.0},
+    # Slow Bot API: rate limiting, retries and progress edits under latency
+    "slow-api": {"users": 20, "links": 2, "api_latency": 0.2, "upload_bandwidth": 2 * 1024 * 1024}
+}
+
+def get_scenario(name: str, **overrides) -> Dict[str, Any]:
+    """Parameters of a named scenario with `overrides` applied"""
+    if name not in SCENARIOS:
+        raise KeyError(f"Unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+    return {**DEFAULTS, **SCENARIOS[name], **overrides}
@@ -0,0 +1,79 @@
+import os
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bot.utils.apple_music import parse_url
+
+# Filler repeated into track files; random, so ZIP can't shrink it (nor real audio)
+_BLOCK = os.urandom(1024 * 1024)
+
+class SyntheticDownloader:
+    """Stand-in for gamdl's Downloader with configurable sizes and latencies
+
+    `get_tracks` sleeps `resolve_latency` and returns one track for songs and
+    music videos, `tracks_per_release` for albums and playlists.
+    `download_track` sleeps `track_latency` and writes `track_size` bytes of
+    filler, reporting each block to `on_bytes`. Both vary by up to ±`jitter` (a fraction), deterministically
+    per track for a given `seed`, so runs are comparable. The methods block
+    like gamdl's, so the bot runs them in threads.
+    """
+
+    def __init__(
+        self,
+        tracks_per_release: int = 10,
+        track_size: int = 8 * 1024 * 1024,
+        resolve_latency: float = 0.5,
+        track_latency: float = 1.0,
+        jitter: float = 0.2,
+        seed: int = 0
+    ):
+        self.tracks_per_release = tracks_per_release
+        self.track_size = track_size
+        self.resolve_latency = resolve_latency
+        self.track_latency = track_latency
+        self.jitter = jitter
+        self.seed = seed
+        self.resolved = 0
+        self.downloaded = 0
+
+    def _vary(self, value: float, key: str) -> float:
+        rng = random.Random(f"{self.seed}:{key}")
+        return value * (1 + rng.uniform(-self.jitter, self.jitter))
+
+    def get_tracks(self, url: str) -> List[Dict]:
+        info = parse_url(url)
+        if info is None:
+            raise ValueError(f"Not an Apple Music URL: {url}")
+        time.sleep(self._vary(self.resolve_latency, url))
+        self.resolved += 1
+
+        count = self.tracks_per_release if info['type'] in ('album', 'playlist') else 1
+        extension = '.mp4' if info['type'] == 'music-video' else '.m4a'
+        return [
+            {'id': f"{info['id']}-{index:03d}", 'name': f"{info['id']}-{index:03d}{extension}"}
+            for index in range(count)
+        ]
+
+    def download_track(
+        self,
+        track: Dict,
+        output_path: Path,
+        quality: str,
+        on_bytes: Optional[Callable[[int], None]] = None
+    ) -> Path:
+        time.sleep(self._vary(self.track_latency, track['id']))
+        size = int(self._vary(self.track_size, track['id']))
+
+        output_path.mkdir(parents=True, exist_ok=True)
+        path = output_path / track['name']
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                written = f.write(_BLOCK[:remaining])
+                remaining -= written
+                if on_bytes:
+                    on_bytes(written)
+        self.downloaded += 1
+        return path
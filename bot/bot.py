@@ -1,7 +1,7 @@
 import asyncio
 import logging
-from datetime import datetime
-from typing import List, Optional
+import signal
+from typing import Any, List, Optional
 
 from telegram import Update
 from telegram.ext import (
@@ -19,11 +19,42 @@ from .handlers import (
     download_handler
 )
 from .utils.cache import CacheManager
-from .utils.formatter import format_message
-from gamdl.downloader import Downloader
+from .utils.database import DatabaseManager
+from .utils.job_store import JobStore
+from .utils.process_pool import DownloaderPool
+from .utils.queue_manager import DownloadQueue
+from .utils.rate_limiter import TelegramRateLimiter
+from .utils.error_handler import ErrorNotifier
+from .utils.metadata_cache import CachedDownloader, MetadataCache
+from .utils.metrics import MetricsServer
+from .utils.logger import LogChannelHandler
+from .utils.loop_watchdog import LoopWatchdog
+from .utils.webhook import WebhookServer
+from config.config import (
+    DB_PATH,
+    DOWNLOAD_PROCESSES,
+    JOB_QUEUE_PATH,
+    LOOP_WATCHDOG_ENABLED,
+    MAX_CONCURRENT_DOWNLOADS,
+    METRICS_ENABLED,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    UPDATE_CONCURRENCY,
+    WEBHOOK_ENABLED,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_URL,
+    WORKER_PROCESSES
+)
 
 logger = logging.getLogger(__name__)
 
+# The only update types the handlers below react to
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
 class GamdlBot:
     def __init__(
         self,
@@ -31,7 +62,9 @@ class GamdlBot:
         admin_users: List[int],
         auth_channels: List[int],
         log_channel: int,
-        cache_cleanup_interval: int
+        cache_cleanup_interval: int,
+        downloader: Optional[Any] = None,
+        base_url: Optional[str] = None
     ):
         self.token = token
         self.admin_users = admin_users
@@ -39,13 +72,66 @@ class GamdlBot:
         self.log_channel = log_channel
         
         # Initialize the application
-        self.app = Application.builder().token(self.token).build()
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .rate_limiter(TelegramRateLimiter())
+            .concurrent_updates(UPDATE_CONCURRENCY)
+        )
+        if base_url:
+            # Another Bot API server, e.g. the benchmarks' fake one
+            builder = builder.base_url(base_url).base_file_url(base_url)
+        self.app = builder.build()
         
         # Initialize cache manager
         self.cache_manager = CacheManager(cleanup_interval=cache_cleanup_interval)
         
-        # Initialize downloader
-        self.downloader = Downloader()
+        # Initialize database
+        self.db = DatabaseManager(DB_PATH)
+
+        # Initialize download scheduler
+        self.download_queue = DownloadQueue(
+            max_concurrent=MAX_CONCURRENT_DOWNLOADS,
+            admin_users=admin_users,
+            db=self.db
+        )
+
+        # Initialize log channel
+        self.log_channel_handler = LogChannelHandler(self.app.bot, self.log_channel)
+
+        # Initialize admin error notifications
+        self.error_notifier = ErrorNotifier(self.app.bot, self.admin_users)
+
+        # Initialize downloader, or the queue shared with the worker processes
+        if downloader is not None:
+            self.downloader = downloader
+            self.job_store = None
+        elif WORKER_PROCESSES:
+            self.downloader = None
+            self.job_store = JobStore(JOB_QUEUE_PATH)
+        else:
+            if DOWNLOAD_PROCESSES:
+                downloader = DownloaderPool()
+            else:
+                # gamdl is only needed when this process downloads itself
+                from .utils.downloader import GamdlDownloader
+                downloader = GamdlDownloader()
+            self.downloader = CachedDownloader(downloader, MetadataCache())
+            self.job_store = None
+
+        # Initialize the event loop watchdog
+        self.loop_watchdog = LoopWatchdog() if LOOP_WATCHDOG_ENABLED else None
+
+        # Initialize the metrics endpoint
+        self.metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT) if METRICS_ENABLED else None
+
+        # Share long-lived services with the handlers
+        self.app.bot_data['cache_manager'] = self.cache_manager
+        self.app.bot_data['downloader'] = self.downloader
+        self.app.bot_data['job_store'] = self.job_store
+        self.app.bot_data['db'] = self.db
+        self.app.bot_data['download_queue'] = self.download_queue
+        self.app.bot_data['log_channel'] = self.log_channel_handler
         
         # Setup handlers
         self._setup_handlers()
@@ -56,6 +142,7 @@ class GamdlBot:
         self.app.add_handler(CommandHandler("help", command_handler.help))
         self.app.add_handler(CommandHandler("settings", command_handler.settings))
         self.app.add_handler(CommandHandler("stats", command_handler.stats))
+        self.app.add_handler(CommandHandler("profile", command_handler.profile))
         
         # Auth handlers
         self.app.add_handler(CommandHandler("auth", auth_handler.authorize))
@@ -73,33 +160,124 @@ class GamdlBot:
         # Error handler
         self.app.add_error_handler(self._error_handler)
 
+    async def _post_init(self, application: Application):
+        """Start background services once the event loop is running"""
+        if self.loop_watchdog:
+            self.loop_watchdog.start()
+        self.db.start()
+        await auth_handler.load_authorized_users(self.db)
+        await self.cache_manager.start_cleanup_task()
+        self.download_queue.start()
+        await download_handler.resume_downloads(application)
+        self.log_channel_handler.start()
+        self.error_notifier.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+
+    async def _post_shutdown(self, application: Application):
+        """Stop background services and flush pending writes"""
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.download_queue.stop()
+        await self.log_channel_handler.stop()
+        await self.error_notifier.stop()
+        await self.db.close()
+        if self.job_store:
+            self.job_store.close()
+        if self.downloader:
+            self.downloader.close()
+        if self.loop_watchdog:
+            await self.loop_watchdog.stop()
+
     async def _error_handler(
         self,
         update: Optional[Update],
         context: ContextTypes.DEFAULT_TYPE
     ):
-        """Log errors and send a message to admin users"""
+        """Log errors and notify admin users, grouped by fingerprint"""
         logger.error(
             f"Exception while handling an update: {context.error}",
             exc_info=context.error
         )
         
-        error_msg = (
-            f"❌ Error occurred at {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
-            f"Error: {str(context.error)}\n"
-        )
-        
-        # Notify admins
-        for admin_id in self.admin_users:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=error_msg
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id}: {e}")
+        if context.error is not None:
+            await self.error_notifier.notify(context.error)
+
+    async def start(self):
+        """Initialize the application and start the services, without receiving updates"""
+        await self.app.initialize()
+        try:
+            await self._post_init(self.app)
+            await self.app.start()
+        except BaseException:
+            await self.stop()
+            raise
+
+    async def stop(self):
+        """Stop the application and the services, flushing pending writes"""
+        if self.app.running:
+            await self.app.stop()
+        # Services still need the bot to flush, so stop them before shutdown
+        await self._post_shutdown(self.app)
+        await self.app.shutdown()
 
     def run(self):
         """Start the bot"""
         logger.info("Starting bot...")
-        self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        # Like Application.run_polling: before Python 3.10, the asyncio
+        # primitives PTB creates while building the application belong to
+        # the loop that was current then, so asyncio.run()'s new loop won't do
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self._run_webhook() if WEBHOOK_ENABLED else self._run_polling())
+
+    async def _run_polling(self):
+        """Poll for updates until SIGINT/SIGTERM
+
+        Driven through start()/stop() like the webhook, because
+        Application.run_polling only calls post_shutdown after the bot's
+        HTTP client is closed, when the services can no longer flush.
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.start()
+        try:
+            await self.app.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+            await stop.wait()
+        finally:
+            logger.info("Stopping bot...")
+            if self.app.updater.running:
+                await self.app.updater.stop()
+            await self.stop()
+
+    async def _run_webhook(self):
+        """Serve updates through the embedded webhook server until SIGINT/SIGTERM"""
+        server = WebhookServer(
+            self.app,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN or None
+        )
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.start()
+        try:
+            await server.start()
+            await self.app.bot.set_webhook(
+                url=WEBHOOK_URL,
+                allowed_updates=ALLOWED_UPDATES,
+                secret_token=WEBHOOK_SECRET_TOKEN or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+            await stop.wait()
+        finally:
+            logger.info("Stopping bot...")
+            await server.stop()
+            await self.stop()
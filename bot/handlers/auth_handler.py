@@ -1,7 +1,19 @@
+from typing import Optional, Set
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from ...config.config import ADMIN_USERS, AUTH_CHANNELS
+from config.config import ADMIN_USERS, AUTH_CHANNELS
+
+# In-memory hot set of authorized IDs; the database is the source of truth
+# for grants made with /authorize, and channels only come from the config
+admin_users: Set[int] = set(ADMIN_USERS)
+authorized_users: Set[int] = set()
+authorized_channels: Set[int] = set(AUTH_CHANNELS)
+
+async def load_authorized_users(db):
+    """Load persisted grants into the in-memory set at startup"""
+    authorized_users.update(await db.get_authorized_users())
 
 async def authorize(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user authorization"""
@@ -11,7 +23,7 @@ async def authorize(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check if user is admin
-    if user_id not in ADMIN_USERS:
+    if user_id not in admin_users:
         await update.message.reply_text(
             "❌ You are not authorized to use this command."
         )
@@ -27,8 +39,10 @@ async def authorize(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Add user to authorized users
-    if target_user not in AUTH_CHANNELS:
-        AUTH_CHANNELS.append(target_user)
+    if target_user not in authorized_users:
+        await context.bot_data['db'].set_authorized(target_user, True)
+        authorized_users.add(target_user)
+        await context.bot_data['log_channel'].log_auth_event(user_id, target_user, "authorized")
         await update.message.reply_text(
             f"✅ User {target_user} has been authorized."
         )
@@ -46,7 +60,7 @@ async def revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check if user is admin
-    if user_id not in ADMIN_USERS:
+    if user_id not in admin_users:
         await update.message.reply_text(
             "❌ You are not authorized to use this command."
         )
@@ -61,9 +75,17 @@ async def revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    if target_user in authorized_channels:
+        await update.message.reply_text(
+            f"ℹ️ {target_user} is authorized through AUTH_CHANNELS in the config."
+        )
+        return
+
     # Remove user from authorized users
-    if target_user in AUTH_CHANNELS:
-        AUTH_CHANNELS.remove(target_user)
+    if target_user in authorized_users:
+        await context.bot_data['db'].set_authorized(target_user, False)
+        authorized_users.discard(target_user)
+        await context.bot_data['log_channel'].log_auth_event(user_id, target_user, "revoked")
         await update.message.reply_text(
             f"✅ Authorization revoked for user {target_user}."
         )
@@ -72,6 +94,11 @@ async def revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"ℹ️ User {target_user} is not authorized."
         )
 
-async def check_auth(user_id: int) -> bool:
-    """Check if a user is authorized"""
-    return user_id in ADMIN_USERS or user_id in AUTH_CHANNELS
+async def check_auth(user_id: int, chat_id: Optional[int] = None) -> bool:
+    """Check if a user, or the chat they are writing in, is authorized"""
+    return (
+        user_id in admin_users
+        or user_id in authorized_users
+        or user_id in authorized_channels
+        or chat_id in authorized_channels
+    )
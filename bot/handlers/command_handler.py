@@ -1,8 +1,26 @@
-telegram import Update
+from telegram import Update
 from telegram.ext import ContextTypes
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from ...config.config import ADMIN_USERS, AUTH_CHANNELS
+from config.config import (
+    ADMIN_USERS,
+    PROFILE_MAX_WINDOW_HOURS,
+    PROFILE_SLOWEST_JOBS,
+    PROFILE_WINDOW_HOURS
+)
+from ..utils.formatter import format_duration, format_size
+from ..utils.metrics import (
+    ACTIVE_DOWNLOADS,
+    BYTES_IN,
+    BYTES_OUT,
+    LOOP_BLOCKS,
+    QUEUE_DEPTH,
+    QUEUE_WAIT_SECONDS,
+    TELEGRAM_ERRORS,
+    hit_ratio
+)
+from ..utils.profiling import STAGES, percentile
+from .auth_handler import authorized_users, check_auth
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -14,6 +32,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - Show help message\n"
         "/settings - Show current settings\n"
         "/stats - Show bot statistics (admin only)\n"
+        "/profile [hours] - Show pipeline stage timings (admin only)\n"
     )
     await update.message.reply_text(welcome_message)
 
@@ -35,6 +54,7 @@ async def help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - Show this help message\n"
         "/settings - Show current settings\n"
         "/stats - Show bot statistics (admin only)\n"
+        "/profile [hours] - Show pipeline stage timings (admin only)\n"
         "/auth <user_id> - Authorize user (admin only)\n"
         "/revoke <user_id> - Revoke authorization (admin only)\n"
     )
@@ -46,7 +66,7 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     settings_message = (
         "⚙️ Current Settings\n\n"
         f"User ID: {user_id}\n"
-        f"Authorization Status: {'Authorized' if await check_auth(user_id) else 'Unauthorized'}\n"
+        f"Authorization Status: {'Authorized' if await check_auth(user_id, update.effective_chat.id) else 'Unauthorized'}\n"
         f"Admin Status: {'Yes' if user_id in ADMIN_USERS else 'No'}\n"
         f"Max Download Quality: {context.user_data.get('quality', 'HIGH')}\n"
         f"Auto-ZIP large downloads: {context.user_data.get('auto_zip', 'Yes')}\n"
@@ -61,11 +81,83 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Get current stats
     current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    download_stats = await context.bot_data['db'].get_bot_stats()
+    all_time = download_stats['all_time']
+    today = download_stats['today']
+    waits, wait_total = QUEUE_WAIT_SECONDS.summary()
     stats_message = (
         "📊 Bot Statistics\n\n"
         f"Current Time: {current_time}\n"
-        f"Total Authorized Users: {len(AUTH_CHANNELS)}\n"
-        f"Active Downloads: {len(context.dispatcher.running_jobs)}\n"
-        f"Total Admins: {len(ADMIN_USERS)}\n"
+        f"Total Authorized Users: {len(authorized_users)}\n"
+        f"Active Downloads: {ACTIVE_DOWNLOADS.value():.0f}\n"
+        f"Queued Downloads: {QUEUE_DEPTH.value():.0f}\n"
+        f"Average Queue Wait: {format_duration(wait_total / waits) if waits else 'n/a'}\n"
+        f"Total Admins: {len(ADMIN_USERS)}\n\n"
+        f"Downloads Today: {today['successful_downloads']} ok, "
+        f"{today['failed_downloads']} failed, {format_size(today['total_bytes'])}\n"
+        f"Downloads All Time: {all_time['successful_downloads']} ok, "
+        f"{all_time['failed_downloads']} failed, {format_size(all_time['total_bytes'])}\n\n"
+        f"Since Start: {format_size(BYTES_IN.value())} in, {format_size(BYTES_OUT.value())} out, "
+        f"{TELEGRAM_ERRORS.value():.0f} Telegram errors, "
+        f"{LOOP_BLOCKS.value():.0f} event loop blocks\n"
     )
+    for cache in ('track', 'metadata', 'file_id'):
+        ratio = hit_ratio(cache)
+        if ratio is not None:
+            stats_message += f"Cache Hits ({cache}): {ratio:.0%}\n"
     await update.message.reply_text(stats_message)
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile command (admin only)"""
+    if update.effective_user.id not in ADMIN_USERS:
+        await update.message.reply_text("❌ This command is for admins only.")
+        return
+
+    try:
+        hours = float(context.args[0]) if context.args else PROFILE_WINDOW_HOURS
+        # Also rejects nan and inf, which timedelta can't take
+        if not 0 < hours <= PROFILE_MAX_WINDOW_HOURS:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text(
+            f"Please provide the window in hours, up to {PROFILE_MAX_WINDOW_HOURS}, e.g. /profile 6"
+        )
+        return
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    jobs = await context.bot_data['db'].get_download_profiles(since)
+    if not jobs:
+        await update.message.reply_text(f"No profiled downloads in the last {hours:g}h.")
+        return
+
+    profile_message = f"⏱ Pipeline Profile (last {hours:g}h, {len(jobs)} jobs)\n\n"
+    for stage in STAGES:
+        spans = [job['spans'][stage] for job in jobs if stage in job['spans']]
+        if not spans:
+            continue
+        seconds = [span['seconds'] for span in spans]
+        total_bytes = sum(span['bytes'] for span in spans)
+        profile_message += (
+            f"{stage}: p50 {percentile(seconds, 0.5):.1f}s, "
+            f"p95 {percentile(seconds, 0.95):.1f}s"
+            f"{f', {format_size(total_bytes)}' if total_bytes else ''} "
+            f"({len(spans)} jobs)\n"
+        )
+    durations = [job['duration'] for job in jobs]
+    profile_message += (
+        f"total: p50 {percentile(durations, 0.5):.1f}s, "
+        f"p95 {percentile(durations, 0.95):.1f}s\n\n"
+        "Slowest jobs:\n"
+    )
+
+    for job in sorted(jobs, key=lambda job: job['duration'], reverse=True)[:PROFILE_SLOWEST_JOBS]:
+        stages = ", ".join(
+            f"{stage} {job['spans'][stage]['seconds']:.1f}s"
+            for stage in STAGES if stage in job['spans']
+        )
+        profile_message += (
+            f"• {format_duration(job['duration'])} {job['status']} "
+            f"{job['file_type']}/{job['quality']}: {job['url']}\n"
+            f"  {stages}\n"
+        )
+    await update.message.reply_text(profile_message, disable_web_page_preview=True)
@@ -1,23 +1,42 @@
 import asyncio
-from typing import Optional
+import logging
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ContextTypes
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import Application, ContextTypes
 
-from ...config.config import (
+from config.config import (
     DOWNLOAD_DIR,
-    MAX_CONCURRENT_DOWNLOADS,
-    ALLOWED_TYPES
+    PARTIAL_DOWNLOAD_DIR,
+    AM_QUALITY_OPTIONS,
+    DEFAULT_QUALITY,
+    QUEUE_JOB_RETENTION
 )
-from ..utils.compress import create_zip
-from ..utils.formatter import format_progress
+from ..utils.apple_music import catalog_key, parse_url
+from ..utils.compress import ZipPartWriter
+from ..utils.formatter import format_duration, format_size
+from ..utils.metadata_cache import CachedDownloader
+from ..utils.metrics import BYTES_OUT, CACHE_REQUESTS
+from ..utils.pipeline import stream_remote_tracks, stream_tracks
+from ..utils.profiling import JobSpans
+from ..utils.progress import ProgressReporter
+from .auth_handler import check_auth
+from .quality_handler import handle_quality_selection, show_quality_options
 
-class DownloadStatus:
-    def __init__(self):
-        self.active_downloads = {}
-        self.download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+logger = logging.getLogger(__name__)
 
-download_status = DownloadStatus()
+# Telegram media type per file extension; anything else is sent as a document
+MEDIA_TYPES = {
+    '.m4a': 'audio',
+    '.mp3': 'audio',
+    '.mp4': 'video',
+    '.m4v': 'video'
+}
 
 async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle download requests from users"""
@@ -32,12 +51,21 @@ async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check if user is authorized
-    if not await is_user_authorized(message.from_user.id, context):
+    if not await is_user_authorized(message.from_user.id, update.effective_chat.id, context):
         await message.reply_text(
             "❌ You are not authorized to use this bot. Please contact an admin."
         )
         return
 
+    await context.bot_data['db'].add_user(
+        message.from_user.id, message.from_user.username
+    )
+
+    # Resolve the release while the user picks options
+    downloader = context.bot_data['downloader']
+    if isinstance(downloader, CachedDownloader):
+        context.application.create_task(downloader.prefetch(url))
+
     # Create download buttons
     keyboard = [
         [
@@ -58,9 +86,14 @@ async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle callback queries from inline buttons"""
     query = update.callback_query
-    await query.answer()
-    
     data = query.data
+    if data.startswith("setq_"):
+        # Answers the query itself
+        await handle_quality_selection(update, context)
+        return
+
+    await query.answer()
+
     if data.startswith("dl_file_"):
         url = data.replace("dl_file_", "")
         await start_download(update, context, url, zip_file=False)
@@ -75,41 +108,466 @@ async def start_download(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     url: str,
-    zip_file: bool = False
+    zip_file: bool = False,
+    quality: Optional[str] = None
 ):
-    """Start the download process"""
-    async with download_status.download_semaphore:
-        message = await update.effective_message.edit_text(
-            "⏳ Starting download..."
+    """Queue the download, or attach to an identical one already in flight"""
+    await submit_download(context, {
+        'user_id': update.effective_user.id,
+        'chat_id': update.effective_chat.id,
+        'message_id': update.effective_message.message_id,
+        'url': url,
+        'quality': quality or context.user_data.get('quality', DEFAULT_QUALITY),
+        'zip_file': zip_file
+    })
+
+async def submit_download(context: ContextTypes.DEFAULT_TYPE, request: Dict):
+    """Attach a download request to an identical job in flight, or queue it
+
+    `request` holds the user_id, chat_id, message_id (of the status
+    message), url, quality and zip_file of the download. A request handed
+    on by a waiter or restored after a restart also has its job_id and
+    checkpoint, and keeps both.
+    """
+    download_queue = context.bot_data['download_queue']
+    leader = download_queue.get_in_flight((catalog_key(request['url']), request['quality']))
+    if leader is None:
+        await queue_download(context, request)
+        return
+
+    try:
+        await context.bot.edit_message_text(
+            "⏳ This release is already being downloaded, "
+            "you'll get it as soon as it's ready...",
+            chat_id=request['chat_id'],
+            message_id=request['message_id']
+        )
+    except TelegramError as e:
+        # A restored waiter's message may already say so
+        logger.debug(f"Could not update status message: {e}")
+    await download_queue.add_waiter(
+        request['user_id'],
+        request['url'],
+        request['quality'],
+        request['message_id'],
+        lambda waiter: wait_for_download(context, leader, waiter),
+        chat_id=request['chat_id'],
+        zip_file=request['zip_file'],
+        job_id=request.get('job_id'),
+        checkpoint=request.get('checkpoint')
+    )
+
+async def queue_download(context: ContextTypes.DEFAULT_TYPE, request: Dict):
+    """Queue the download and tell the user where it stands"""
+    download_queue = context.bot_data['download_queue']
+
+    async def run(job: Dict):
+        await run_download(context, job, request['zip_file'])
+
+    job = await download_queue.add_to_queue(
+        request['user_id'],
+        request['url'],
+        request['quality'],
+        request['message_id'],
+        run,
+        chat_id=request['chat_id'],
+        key=(catalog_key(request['url']), request['quality']),
+        zip_file=request['zip_file'],
+        job_id=request.get('job_id'),
+        checkpoint=request.get('checkpoint')
+    )
+
+    # Tell the user only once the job is registered as in flight; awaiting
+    # before that let an identical request download the release a second time
+    if job['status'] != 'queued':
+        return
+    text = "⏳ Queued..."
+    position = download_queue.get_position(job['job_id'])
+    if position:
+        text = f"⏳ Queued at position {position}"
+        wait = download_queue.estimate_wait(job['job_id'])
+        if wait:
+            text += f" (about {format_duration(wait)})"
+    await context.bot.edit_message_text(
+        text, chat_id=request['chat_id'], message_id=request['message_id']
+    )
+
+async def resume_downloads(application: Application):
+    """Re-queue downloads persisted before a restart and update their messages
+
+    Jobs that were running go first and skip what they already delivered;
+    queued ones keep their place in line. Requests that were waiting on an
+    identical job are submitted again once every job is back, so they
+    attach to their leader or, if it is gone, join the queue.
+    """
+    download_queue = application.bot_data['download_queue']
+    db = application.bot_data['db']
+    await db.prune_queue_jobs(datetime.utcnow() - timedelta(seconds=QUEUE_JOB_RETENTION))
+
+    saved_jobs = await db.get_unfinished_queue_jobs()
+    waiting = [saved for saved in saved_jobs if saved['status'] == 'waiting']
+    for saved in saved_jobs:
+        if saved['status'] == 'waiting':
+            continue
+        resume = saved['status'] == 'downloading'
+        try:
+            await application.bot.edit_message_text(
+                "🔄 The bot restarted, resuming your download..." if resume
+                else "⏳ The bot restarted, your download is still queued...",
+                chat_id=saved['chat_id'],
+                message_id=saved['message_id']
+            )
+        except TelegramError as e:
+            logger.debug(f"Could not update status message of job {saved['job_id']}: {e}")
+
+        context = ContextTypes.DEFAULT_TYPE(
+            application, chat_id=saved['chat_id'], user_id=saved['user_id']
+        )
+
+        async def run(job: Dict, context=context, zip_file=saved['zip_file']):
+            await run_download(context, job, zip_file)
+
+        await download_queue.add_to_queue(
+            saved['user_id'],
+            saved['url'],
+            saved['quality'],
+            saved['message_id'],
+            run,
+            chat_id=saved['chat_id'],
+            key=(catalog_key(saved['url']), saved['quality']),
+            zip_file=saved['zip_file'],
+            job_id=saved['job_id'],
+            checkpoint=saved['checkpoint'],
+            resume=resume
+        )
+
+    for saved in waiting:
+        context = ContextTypes.DEFAULT_TYPE(
+            application, chat_id=saved['chat_id'], user_id=saved['user_id']
         )
-        
         try:
-            # Download using gamdl
-            download_path = DOWNLOAD_DIR / str(update.effective_user.id)
-            download_path.mkdir(parents=True, exist_ok=True)
-            
-            result = await download_content(url, download_path)
-            
-            if zip_file:
-                zip_path = await create_zip(download_path, result['files'])
-                await send_zip_file(update, context, zip_path)
-            else:
-                await send_individual_files(update, context, result['files'])
-                
-        except Exception as e:
-            await message.edit_text(f"❌ Download failed: {str(e)}")
+            await submit_download(context, saved)
+        except TelegramError as e:
+            logger.debug(f"Could not update status message of job {saved['job_id']}: {e}")
+
+    if saved_jobs:
+        logger.info(f"Restored {len(saved_jobs)} downloads from before the restart")
+
+async def wait_for_download(context: ContextTypes.DEFAULT_TYPE, leader: Dict, waiter: Dict):
+    """Deliver the result of another user's identical download once it is ready
+
+    Waiters skip the queue because the leader leaves the release in the
+    track cache and file_id registry, so delivery needs no download slot.
+    If the leader did not complete, or its result is already gone
+    (evicted, or it delivered the other mode and the release was not
+    cached), the request is submitted again: the first waiter to get
+    there queues a download and the others wait on it, since concurrent
+    jobs would share the release's partial downloads. An interrupted
+    leader means the bot is stopping; the waiter stays saved and both
+    resume on restart.
+    """
+    download_queue = context.bot_data['download_queue']
+    try:
+        status = await asyncio.shield(leader['done'])
+        if status == 'interrupted':
+            return
+        if status != 'completed' or not await _is_delivery_ready(context, waiter):
+            await submit_download(context, waiter)
+            return
+
+        await run_download(context, waiter, waiter['zip_file'])
+        await download_queue.finish_waiter(waiter, 'completed')
+    except Exception as e:
+        logger.error(f"Delivery of shared download {leader['job_id']} failed: {e}")
+        await download_queue.finish_waiter(waiter, 'failed', str(e))
+
+async def _is_delivery_ready(context: ContextTypes.DEFAULT_TYPE, request: Dict) -> bool:
+    """Whether the request can be delivered from file_ids or the track cache alone"""
+    key = catalog_key(request['url'])
+    mode = 'zip' if request['zip_file'] else 'file'
+    if await context.bot_data['db'].get_file_ids(key, request['quality'], mode):
+        return True
+    files = await context.bot_data['cache_manager'].get_cached_files(key, request['quality'])
+    return files is not None
+
+async def run_download(
+    context: ContextTypes.DEFAULT_TYPE,
+    job: Dict,
+    zip_file: bool = False
+):
+    """Run a queued download job, skipping items its checkpoint already delivered"""
+    cache_manager = context.bot_data['cache_manager']
+    downloader = context.bot_data['downloader']
+    job_store = context.bot_data['job_store']
+    url = job['url']
+    quality = job['quality']
+    key = catalog_key(url)
+    media_key = (key, quality)
+    download_path = DOWNLOAD_DIR / str(job['user_id']) / job['job_id']
+    # Tracks download per release, so a failed or interrupted attempt leaves
+    # finished tracks and segment checkpoints for the next one
+    partial_path = PARTIAL_DOWNLOAD_DIR / f"{key}-{quality}"
+    spans = JobSpans()
+
+    async def iter_files(skip: int = 0) -> AsyncIterator[Path]:
+        # Serve cache hits from links in the job's directory, which eviction
+        # can't pull away mid-upload; otherwise hand each track over as soon
+        # as it is downloaded and move it into the cache once it was sent
+        files = await cache_manager.get_cached_files(key, quality, link_dir=download_path / "cached")
+        CACHE_REQUESTS.inc(cache='track', result='miss' if files is None else 'hit')
+        if files is not None:
+            progress.set_items(len(files))
+            for size in await asyncio.to_thread(lambda: [f.stat().st_size for f in files]):
+                progress.item_ready(size)
+            for file in files[skip:]:
+                yield file
             return
-        finally:
-            # Cleanup
-            if download_path.exists():
-                shutil.rmtree(download_path)
+
+        if job_store is not None:
+            # Worker processes download; this process only uploads
+            tracks = stream_remote_tracks(
+                job_store, url, partial_path, AM_QUALITY_OPTIONS[quality],
+                progress=progress, spans=spans
+            )
+        else:
+            tracks = stream_tracks(
+                downloader, url, partial_path, AM_QUALITY_OPTIONS[quality],
+                progress=progress, spans=spans
+            )
+
+        entry = cache_manager.open_entry(key, quality)
+        try:
+            async for index, path in tracks:
+                if index >= skip:
+                    yield path
+                await entry.add(path)
+            await entry.commit()
+        except BaseException:
+            await entry.abort()
+            raise
+
+    async def iter_zip_parts(skip: int = 0) -> AsyncIterator[Tuple[Path, int]]:
+        # Parts are cut deterministically, so already delivered ones are
+        # rebuilt but not re-sent; each part is removed once it was sent
+        writer = ZipPartWriter(download_path)
+        index = 0
+        async for file in iter_files():
+            with spans.span('zip'):
+                parts = await writer.add(file)
+            for part in parts:
+                spans.add_bytes('zip', part.stat().st_size)
+                if index >= skip:
+                    yield part, writer.part_members[index]
+                part.unlink()
+                index += 1
+        with spans.span('zip'):
+            parts = await writer.close()
+        for part in parts:
+            spans.add_bytes('zip', part.stat().st_size)
+            if index >= skip:
+                yield part, writer.part_members[index]
+            part.unlink()
+            index += 1
+
+    checkpoint = job.get('checkpoint') or []
+    message = await context.bot.edit_message_text(
+        "⏳ Resuming download..." if checkpoint else "⏳ Starting download...",
+        chat_id=job['chat_id'],
+        message_id=job['message_id']
+    )
+    progress = ProgressReporter(message)
+
+    async def save_checkpoint(delivered: List[Tuple[str, str]]):
+        await context.bot_data['download_queue'].checkpoint(job['job_id'], delivered)
+
+    db = context.bot_data['db']
+    file_type = 'zip' if zip_file else 'file'
+    started = time.monotonic()
+    started_at = datetime.utcnow()
+
+    try:
+        download_path.mkdir(parents=True, exist_ok=True)
+        progress.start()
+
+        send = send_zip_file if zip_file else send_individual_files
+        sent_bytes = await send(
+            context, job['chat_id'], media_key,
+            iter_zip_parts if zip_file else iter_files,
+            progress, delivered=checkpoint, on_delivered=save_checkpoint, spans=spans
+        )
+
+        await progress.stop()
+        await asyncio.to_thread(shutil.rmtree, partial_path, True)
+        await message.edit_text(
+            f"✅ Download complete! {format_size(sent_bytes)} sent "
+            f"in {format_duration(time.monotonic() - started)}"
+            if sent_bytes else "✅ Download complete!"
+        )
+
+        await db.log_download(
+            job['user_id'], url, file_type, quality, 'completed',
+            file_size=sent_bytes or None, started_at=started_at, spans=spans.as_dict()
+        )
+        await context.bot_data['log_channel'].log_download(job['user_id'], url, 'completed')
+
+    except Exception as e:
+        await progress.stop()
+        await message.edit_text(f"❌ Download failed: {str(e)}")
+        await db.log_download(
+            job['user_id'], url, file_type, quality, 'failed',
+            error_message=str(e), started_at=started_at, spans=spans.as_dict()
+        )
+        await context.bot_data['log_channel'].log_download(
+            job['user_id'], url, 'failed', error=str(e)
+        )
+        raise
+    finally:
+        # Cleanup; partial_path is kept unless the download succeeded
+        await asyncio.to_thread(shutil.rmtree, download_path, True)
+
+def _media_type(path: Path) -> str:
+    """Pick the Telegram media type used to send a file"""
+    return MEDIA_TYPES.get(path.suffix.lower(), 'document')
+
+async def _send_media(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    media_type: str,
+    media: Any,
+    filename: Optional[str] = None,
+    spans: Optional[JobSpans] = None
+) -> str:
+    """Send a file or a registered file_id and return Telegram's file_id"""
+    with (spans or JobSpans()).span('upload'):
+        if media_type == 'audio':
+            message = await context.bot.send_audio(chat_id=chat_id, audio=media, filename=filename)
+        elif media_type == 'video':
+            message = await context.bot.send_video(chat_id=chat_id, video=media, filename=filename)
+        else:
+            message = await context.bot.send_document(chat_id=chat_id, document=media, filename=filename)
+    return message.effective_attachment.file_id
+
+async def _send_registered(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    media_key: Tuple[str, str],
+    mode: str,
+    delivered: List[Tuple[str, str]],
+    on_delivered: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+    spans: Optional[JobSpans] = None
+) -> Tuple[List[Tuple[str, str]], bool]:
+    """Re-send previously uploaded media by file_id after what was `delivered`
+
+    Returns the file_ids that were delivered and whether the registered
+    delivery was complete. A stale file_id drops the whole registration so
+    the caller falls back to uploading the remaining items.
+    """
+    db = context.bot_data['db']
+    registered = await db.get_file_ids(*media_key, mode)
+    CACHE_REQUESTS.inc(cache='file_id', result='hit' if registered else 'miss')
+    delivered = list(delivered)
+    if not registered:
+        return delivered, False
+
+    for media_type, file_id in registered[len(delivered):]:
+        try:
+            await _send_media(context, chat_id, media_type, file_id, spans=spans)
+        except BadRequest as e:
+            logger.warning(f"Stale file_id for {media_key} ({mode}): {e}")
+            await db.delete_file_ids(*media_key, mode)
+            return delivered, False
+        delivered.append((media_type, file_id))
+        if on_delivered:
+            await on_delivered(delivered)
+
+    return delivered, True
+
+async def send_individual_files(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    media_key: Tuple[str, str],
+    iter_files: Callable[[int], AsyncIterator[Path]],
+    progress: Optional[ProgressReporter] = None,
+    delivered: Optional[List[Tuple[str, str]]] = None,
+    on_delivered: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+    spans: Optional[JobSpans] = None
+) -> int:
+    """Send each file as its own message, re-using registered file_ids first
+
+    Files are uploaded as `iter_files` produces them, so the first track
+    reaches the user while the rest of the release is still downloading.
+    Items in `delivered` are skipped, and `on_delivered` is told about each
+    one sent. Returns the number of bytes uploaded.
+    """
+    delivered, complete = await _send_registered(
+        context, chat_id, media_key, 'file', delivered or [], on_delivered, spans
+    )
+    if complete:
+        return 0
+
+    sent_bytes = 0
+    async for file in iter_files(len(delivered)):
+        media_type = _media_type(file)
+        # The Bot API client reads file objects on the event loop; do it here in a thread
+        data = await asyncio.to_thread(file.read_bytes)
+        file_id = await _send_media(context, chat_id, media_type, data, file.name, spans)
+        size = len(data)
+        if spans:
+            spans.add_bytes('upload', size)
+        BYTES_OUT.inc(size)
+        sent_bytes += size
+        if progress:
+            progress.item_sent(size)
+        delivered.append((media_type, file_id))
+        if on_delivered:
+            await on_delivered(delivered)
+
+    await context.bot_data['db'].save_file_ids(*media_key, 'file', delivered)
+    return sent_bytes
+
+async def send_zip_file(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    media_key: Tuple[str, str],
+    iter_parts: Callable[[int], AsyncIterator[Tuple[Path, int]]],
+    progress: Optional[ProgressReporter] = None,
+    delivered: Optional[List[Tuple[str, str]]] = None,
+    on_delivered: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+    spans: Optional[JobSpans] = None
+) -> int:
+    """Send the download as ZIP parts, re-using registered file_ids first
+
+    Parts in `delivered` are skipped, and `on_delivered` is told about each
+    one sent. Returns the number of bytes uploaded.
+    """
+    delivered, complete = await _send_registered(
+        context, chat_id, media_key, 'zip', delivered or [], on_delivered, spans
+    )
+    if complete:
+        return 0
+
+    sent_bytes = 0
+    async for part, members in iter_parts(len(delivered)):
+        data = await asyncio.to_thread(part.read_bytes)
+        file_id = await _send_media(context, chat_id, 'document', data, part.name, spans)
+        size = len(data)
+        if spans:
+            spans.add_bytes('upload', size)
+        BYTES_OUT.inc(size)
+        sent_bytes += size
+        if progress:
+            progress.item_sent(size, items=members)
+        delivered.append(('document', file_id))
+        if on_delivered:
+            await on_delivered(delivered)
+
+    await context.bot_data['db'].save_file_ids(*media_key, 'zip', delivered)
+    return sent_bytes
 
 def is_valid_apple_music_url(url: str) -> bool:
     """Validate Apple Music URL"""
-    # Add URL validation logic
-    return True
+    return parse_url(url) is not None
 
-async def is_user_authorized(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Check if user is authorized"""
-    # Add authorization logic
-    return True
+async def is_user_authorized(user_id: int, chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Check if user, or the chat they wrote in, is authorized"""
+    return await check_auth(user_id, chat_id)
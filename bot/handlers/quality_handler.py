@@ -1,7 +1,7 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 
-from ...config.config import AM_QUALITY_OPTIONS
+from config.config import AM_QUALITY_OPTIONS
 
 async def show_quality_options(
     update: Update,
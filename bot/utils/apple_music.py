@@ -0,0 +1,42 @@
+import re
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from config.config import ALLOWED_TYPES
+
+APPLE_MUSIC_HOSTS = ("music.apple.com", "beta.music.apple.com")
+
+_PATH_RE = re.compile(
+    r"^/(?P<storefront>[a-z]{2})/(?P<type>[a-z-]+)(?:/[^/]+)?/(?P<id>[\w.-]+)/?$"
+)
+
+def parse_url(url: str) -> Optional[Dict[str, str]]:
+    """Parse an Apple Music URL into storefront, type and catalog ID"""
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return None
+
+    if parsed.scheme not in ("http", "https") or parsed.netloc not in APPLE_MUSIC_HOSTS:
+        return None
+
+    match = _PATH_RE.match(parsed.path)
+    if not match or match.group("type") not in ALLOWED_TYPES:
+        return None
+
+    info = match.groupdict()
+
+    # Album links with ?i=<id> point at a single song
+    track_id = parse_qs(parsed.query).get("i")
+    if info["type"] == "album" and track_id:
+        info["type"] = "song"
+        info["id"] = track_id[0]
+
+    return info
+
+def catalog_key(url: str) -> Optional[str]:
+    """Return a normalized key identifying the catalog item behind a URL"""
+    info = parse_url(url)
+    if not info:
+        return None
+    return f"{info['type']}-{info['id']}"
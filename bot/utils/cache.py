@@ -1,67 +1,357 @@
 import asyncio
+import json
 import logging
+import os
 import shutil
-from datetime import datetime, timedelta
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 
-from ...config.config import CACHE_DIR, MAX_CACHE_AGE
+from config.config import (
+    CACHE_DIR,
+    CACHE_INDEX_PATH,
+    EVICTION_SLICE_SIZE,
+    MAX_CACHE_AGE,
+    MAX_CACHE_SIZE,
+    MIN_FREE_DISK,
+    PARTIAL_DOWNLOAD_DIR,
+    TRACK_CACHE_DIR
+)
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_NAME = ".manifest.json"
+
 class CacheManager:
-    def __init__(self, cleanup_interval: int):
+    """Owns the track cache and its on-disk index
+
+    The index (CACHE_INDEX_PATH) records size, last access time and hit
+    count per entry, so lookups and eviction never walk the cache tree.
+    Index queries and file operations run on a dedicated cache thread;
+    eviction removes at most EVICTION_SLICE_SIZE entries per step and
+    yields to the event loop in between.
+    """
+
+    def __init__(self, cleanup_interval: int, max_size: int = MAX_CACHE_SIZE):
         self.cleanup_interval = cleanup_interval
         self.cache_dir = CACHE_DIR
+        self.track_cache_dir = TRACK_CACHE_DIR
+        self.index_path = CACHE_INDEX_PATH
+        self.max_size = max_size
+        self.min_free_disk = MIN_FREE_DISK
         self._cleanup_task: Optional[asyncio.Task] = None
+        self._evict_requested: Optional[asyncio.Event] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+        self._index: Optional[sqlite3.Connection] = None
+        self._total_size = 0
+
+    async def _run(self, func: Callable, *args):
+        """Run a function on the cache thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
 
     async def start_cleanup_task(self):
-        """Start the periodic cache cleanup task"""
+        """Open the cache index and start the background evictor"""
+        self._total_size = await self._run(self._open_index)
+        logger.info(f"Track cache holds {self._total_size} bytes")
+        self._evict_requested = asyncio.Event()
         self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
 
     async def _periodic_cleanup(self):
-        """Periodically clean up old cache files"""
+        """Evict on every interval, or as soon as a store pushes us over budget"""
         while True:
             try:
                 await self.cleanup_old_files()
-                await asyncio.sleep(self.cleanup_interval)
+                try:
+                    await asyncio.wait_for(self._evict_requested.wait(), self.cleanup_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._evict_requested.clear()
             except Exception as e:
                 logger.error(f"Error during cache cleanup: {e}")
                 await asyncio.sleep(60)  # Wait a minute before retrying
 
     async def cleanup_old_files(self):
-        """Clean up files older than MAX_CACHE_AGE"""
-        current_time = datetime.now()
-        cleanup_before = current_time - timedelta(seconds=MAX_CACHE_AGE)
-        
-        try:
-            for path in self.cache_dir.rglob("*"):
-                if path.is_file():
-                    mtime = datetime.fromtimestamp(path.stat().st_mtime)
-                    if mtime < cleanup_before:
-                        try:
-                            path.unlink()
-                            logger.info(f"Deleted old cache file: {path}")
-                        except Exception as e:
-                            logger.error(f"Failed to delete cache file {path}: {e}")
-                elif path.is_dir():
-                    try:
-                        # Remove empty directories
-                        if not any(path.iterdir()):
-                            path.rmdir()
-                            logger.info(f"Removed empty cache directory: {path}")
-                    except Exception as e:
-                        logger.error(f"Failed to remove directory {path}: {e}")
-        
-        except Exception as e:
-            logger.error(f"Error during cache cleanup: {e}")
+        """Evict idle entries, then LRU entries until size and free space are within limits"""
+        cutoff = time.time() - MAX_CACHE_AGE
+        evicted = freed = 0
+
+        while True:
+            count, size = await self._run(self._evict_slice, cutoff, self._total_size)
+            if not count:
+                break
+            self._total_size -= size
+            evicted += count
+            freed += size
+            # Let other work run between slices
+            await asyncio.sleep(0)
+
+        if evicted:
+            logger.info(f"Evicted {evicted} track cache entries ({freed} bytes)")
+
+        swept = await self._run(self._sweep_partial_downloads, cutoff)
+        if swept:
+            logger.info(f"Removed {swept} abandoned partial downloads")
+
+    @staticmethod
+    def _sweep_partial_downloads(cutoff: float) -> int:
+        """Remove partial downloads nobody retried since `cutoff`"""
+        if not PARTIAL_DOWNLOAD_DIR.exists():
+            return 0
+        swept = 0
+        for path in PARTIAL_DOWNLOAD_DIR.iterdir():
+            if path.is_dir() and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                swept += 1
+        return swept
 
     async def clear_user_cache(self, user_id: int):
         """Clear cache for a specific user"""
         user_cache_dir = self.cache_dir / str(user_id)
         if user_cache_dir.exists():
             try:
-                shutil.rmtree(user_cache_dir)
+                await self._run(shutil.rmtree, user_cache_dir)
                 logger.info(f"Cleared cache for user {user_id}")
             except Exception as e:
                 logger.error(f"Failed to clear cache for user {user_id}: {e}")
+
+    @staticmethod
+    def _entry_key(catalog_key: str, quality: str) -> str:
+        return f"{quality}/{catalog_key}"
+
+    def _open_index(self) -> int:
+        """Open (or build) the index and return the cached byte total"""
+        self.track_cache_dir.mkdir(parents=True, exist_ok=True)
+        rebuild = not self.index_path.exists()
+
+        self._index = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        with self._index:
+            self._index.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    path TEXT,
+                    size INTEGER,
+                    last_access REAL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            ''')
+            self._index.execute(
+                'CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)'
+            )
+
+        # Leftovers from interrupted stores are never valid entries
+        shutil.rmtree(self.track_cache_dir / ".staging", ignore_errors=True)
+
+        if rebuild:
+            self._rebuild_index()
+
+        return self._index.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def _rebuild_index(self):
+        """Index entries already on disk; only needed when the index is new"""
+        rows = []
+        for quality_dir in self.track_cache_dir.iterdir():
+            if not quality_dir.is_dir() or quality_dir.name.startswith("."):
+                continue
+            for entry_dir in quality_dir.iterdir():
+                if not (entry_dir / MANIFEST_NAME).exists():
+                    continue
+                rows.append((
+                    self._entry_key(entry_dir.name, quality_dir.name),
+                    str(entry_dir),
+                    sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file()),
+                    entry_dir.stat().st_mtime
+                ))
+        with self._index:
+            self._index.executemany(
+                'INSERT OR REPLACE INTO entries (key, path, size, last_access) VALUES (?, ?, ?, ?)',
+                rows
+            )
+        logger.info(f"Rebuilt track cache index with {len(rows)} entries")
+
+    async def get_cached_files(
+        self,
+        catalog_key: str,
+        quality: str,
+        link_dir: Optional[Path] = None
+    ) -> Optional[List[Path]]:
+        """Return the cached files for a catalog item, or None on a miss
+
+        With `link_dir`, the files are hardlinked (or copied) there and the
+        links are returned, so eviction or a re-store can't delete them
+        while they are in use. The caller removes `link_dir` when done.
+        """
+        key = self._entry_key(catalog_key, quality)
+        files, dropped = await self._run(self._lookup, key, link_dir)
+        self._total_size -= dropped
+        if files is not None:
+            logger.info(f"Track cache hit: {key}")
+        return files
+
+    def _lookup(self, key: str, link_dir: Optional[Path] = None) -> Tuple[Optional[List[Path]], int]:
+        """Read an entry and record the hit; drops entries whose files vanished
+
+        Runs on the cache thread like eviction and `_commit_entry`, so the
+        entry can't be removed between the lookup and linking its files.
+        """
+        row = self._index.execute(
+            'SELECT path, size FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None, 0
+
+        entry_path = Path(row[0])
+        try:
+            names = json.loads((entry_path / MANIFEST_NAME).read_text())
+            files = [entry_path / name for name in names]
+            if not all(f.exists() for f in files):
+                raise ValueError("missing files")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._delete_entry(key, entry_path)
+            return None, row[1]
+
+        with self._index:
+            self._index.execute(
+                'UPDATE entries SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?',
+                (time.time(), key)
+            )
+        if link_dir is not None:
+            files = self._link_files(files, link_dir)
+        return files, 0
+
+    @staticmethod
+    def _link_files(files: List[Path], link_dir: Path) -> List[Path]:
+        link_dir.mkdir(parents=True, exist_ok=True)
+        linked = []
+        for file in files:
+            target = link_dir / file.name
+            target.unlink(missing_ok=True)
+            try:
+                os.link(file, target)
+            except OSError:
+                shutil.copy2(file, target)  # Not on the cache's filesystem
+            linked.append(target)
+        return linked
+
+    def open_entry(self, catalog_key: str, quality: str) -> "CacheEntryWriter":
+        """Start staging files for a new track cache entry"""
+        return CacheEntryWriter(self, catalog_key, quality)
+
+    async def _publish_entry(
+        self,
+        catalog_key: str,
+        quality: str,
+        staging: Path,
+        names: List[str]
+    ) -> List[Path]:
+        """Publish a staged entry and account for it in the index"""
+        key = self._entry_key(catalog_key, quality)
+        entry_path = self.track_cache_dir / quality / catalog_key
+
+        stored, delta = await self._run(self._commit_entry, key, entry_path, staging, names)
+        self._total_size += delta
+
+        if self._total_size > self.max_size and self._evict_requested is not None:
+            self._evict_requested.set()
+        return stored
+
+    def _commit_entry(self, key: str, entry_path: Path, staging: Path, names: List[str]):
+        """Index a staged entry, then atomically rename it into place"""
+        staging.mkdir(parents=True, exist_ok=True)
+        (staging / MANIFEST_NAME).write_text(json.dumps(names))
+        size = sum((staging / name).stat().st_size for name in names)
+
+        # Indexing first means a crash leaves a row without files, which
+        # the next lookup drops, rather than files the index never evicts
+        previous = self._index.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        with self._index:
+            self._index.execute(
+                'INSERT OR REPLACE INTO entries (key, path, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, str(entry_path), size, time.time())
+            )
+
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        if entry_path.exists():
+            # A concurrent request already stored this item; keep the newer copy
+            shutil.rmtree(entry_path)
+        staging.rename(entry_path)
+
+        stored = [entry_path / name for name in names]
+        return stored, size - (previous[0] if previous else 0)
+
+    def _evict_slice(self, idle_cutoff: float, total_size: int) -> Tuple[int, int]:
+        """Evict one slice of entries; returns (entries, bytes) removed"""
+        evicted = freed = 0
+
+        # Entries idle for longer than MAX_CACHE_AGE go first, regardless of budget
+        rows = self._index.execute(
+            'SELECT key, path, size FROM entries WHERE last_access < ? ORDER BY last_access LIMIT ?',
+            (idle_cutoff, EVICTION_SLICE_SIZE)
+        ).fetchall()
+        for key, path, size in rows:
+            self._delete_entry(key, Path(path))
+            evicted += 1
+            freed += size
+        if evicted:
+            return evicted, freed
+
+        rows = self._index.execute(
+            'SELECT key, path, size FROM entries ORDER BY last_access LIMIT ?',
+            (EVICTION_SLICE_SIZE,)
+        ).fetchall()
+        for key, path, size in rows:
+            if not self._over_budget(total_size - freed):
+                break
+            self._delete_entry(key, Path(path))
+            evicted += 1
+            freed += size
+        return evicted, freed
+
+    def _over_budget(self, total_size: int) -> bool:
+        if total_size > self.max_size:
+            return True
+        return shutil.disk_usage(self.track_cache_dir).free < self.min_free_disk
+
+    def _delete_entry(self, key: str, entry_path: Path):
+        with self._index:
+            self._index.execute('DELETE FROM entries WHERE key = ?', (key,))
+        shutil.rmtree(entry_path, ignore_errors=True)
+
+class CacheEntryWriter:
+    """Stages files for one track cache entry as they become available"""
+
+    def __init__(self, cache_manager: CacheManager, catalog_key: str, quality: str):
+        self.cache_manager = cache_manager
+        self.catalog_key = catalog_key
+        self.quality = quality
+        self.staging = cache_manager.track_cache_dir / ".staging" / uuid.uuid4().hex
+        self.names: List[str] = []
+
+    async def add(self, file: Path) -> Path:
+        """Move a finished file out of the job's working directory into staging"""
+        target = self.staging / file.name
+        await asyncio.to_thread(self._move, file, target)
+        self.names.append(file.name)
+        return target
+
+    @staticmethod
+    def _move(file: Path, target: Path):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(file), str(target))
+
+    async def commit(self) -> List[Path]:
+        """Publish the staged files as a complete cache entry"""
+        return await self.cache_manager._publish_entry(
+            self.catalog_key, self.quality, self.staging, self.names
+        )
+
+    async def abort(self):
+        """Discard everything staged so far"""
+        await asyncio.to_thread(shutil.rmtree, self.staging, True)
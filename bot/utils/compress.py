@@ -1,28 +1,101 @@
+import asyncio
 import logging
+import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from config.config import MAX_UPLOAD_SIZE, ZIP_WORKERS
+from .error_handler import DownloadError
+from .formatter import format_size
 
 logger = logging.getLogger(__name__)
 
-async def create_zip(
-    base_path: Path,
-    files: List[Path],
-    chunk_size: int = 2048
-) -> Path:
-    """Create a ZIP file from the given files"""
-    zip_path = base_path / "download.zip"
-    
-    try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file in files:
-                if file.exists():
-                    arcname = file.relative_to(base_path)
-                    zip_file.write(file, arcname)
-        
-        logger.info(f"Created ZIP file: {zip_path}")
-        return zip_path
-    
-    except Exception as e:
-        logger.error(f"Failed to create ZIP file: {e}")
-        raise
+# Formats that are already compressed; deflating them only burns CPU
+STORED_SUFFIXES = {'.m4a', '.mp4', '.m4v', '.mp3', '.aac', '.flac', '.jpg', '.jpeg', '.png', '.webp'}
+
+# Local header + data descriptor + central directory record, incl. ZIP64 extras
+MEMBER_OVERHEAD = 30 + 16 + 46 + 2 * 28
+END_OF_ARCHIVE_OVERHEAD = 22 + 56 + 20
+
+_executor = ThreadPoolExecutor(max_workers=ZIP_WORKERS, thread_name_prefix="zip")
+
+class ZipPartWriter:
+    """Builds ZIP archives split into parts below Telegram's upload limit
+
+    Members are added one at a time on a worker thread and copied in
+    `chunk_size` blocks, so finished parts can be sent while later files
+    are still arriving. A file that can't fit in a part even on its own
+    raises DownloadError, since Telegram would reject that part.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        name: str = "download",
+        max_part_size: int = MAX_UPLOAD_SIZE,
+        chunk_size: int = 1024 * 1024
+    ):
+        self.output_dir = output_dir
+        self.name = name
+        self.max_part_size = max_part_size
+        self.chunk_size = chunk_size
+        self.parts: List[Path] = []
+        self.part_members: List[int] = []  # Files stored in each completed part
+        self._members = 0
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._part_size = 0
+
+    async def add(self, file: Path, arcname: Optional[str] = None) -> List[Path]:
+        """Add a file and return any parts that were completed by it"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, self._add, file, arcname or file.name)
+
+    async def close(self) -> List[Path]:
+        """Finish the archive and return the remaining completed parts"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, self._close)
+
+    def _add(self, file: Path, arcname: str) -> List[Path]:
+        finished = []
+        size = file.stat().st_size
+        estimate = size + MEMBER_OVERHEAD + 2 * len(arcname.encode())
+
+        if estimate + END_OF_ARCHIVE_OVERHEAD > self.max_part_size:
+            raise DownloadError(
+                f"{file.name} ({format_size(size)}) is too large to send, "
+                f"even in a ZIP part of its own (limit {format_size(self.max_part_size)})"
+            )
+        if self._zip and self._part_size + estimate + END_OF_ARCHIVE_OVERHEAD > self.max_part_size:
+            finished.extend(self._close())
+
+        if self._zip is None:
+            part_path = self.output_dir / f"{self.name}.part{len(self.parts) + 1}.zip"
+            self._zip = zipfile.ZipFile(part_path, 'w', allowZip64=True)
+            self.parts.append(part_path)
+            self._part_size = 0
+            self._members = 0
+
+        compress_type = (
+            zipfile.ZIP_STORED if file.suffix.lower() in STORED_SUFFIXES
+            else zipfile.ZIP_DEFLATED
+        )
+        info = zipfile.ZipInfo.from_file(file, arcname)
+        info.compress_type = compress_type
+
+        with open(file, 'rb') as src, self._zip.open(info, 'w', force_zip64=True) as dst:
+            shutil.copyfileobj(src, dst, self.chunk_size)
+
+        self._part_size = self._zip.fp.tell()
+        self._members += 1
+        return finished
+
+    def _close(self) -> List[Path]:
+        if self._zip is None:
+            return []
+        self._zip.close()
+        self._zip = None
+        self.part_members.append(self._members)
+        logger.info(f"Created ZIP file: {self.parts[-1]}")
+        return [self.parts[-1]]
@@ -1,20 +1,46 @@
+import asyncio
+import json
 import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from config.config import DB_FLUSH_BATCH_SIZE, DB_FLUSH_INTERVAL
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
+    """SQLite access through one long-lived WAL connection on a dedicated thread
+
+    Every query runs on the DB thread, so no coroutine blocks the event
+    loop on SQLite. `add_user` and `log_download` are buffered and written
+    in one transaction every DB_FLUSH_INTERVAL seconds or DB_FLUSH_BATCH_SIZE
+    events; call `close()` on shutdown to flush what is left.
+    """
+
     def __init__(self, db_path: Path):
         self.db_path = db_path
-        self._init_db()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+        # Write-behind buffers
+        self._pending_users: Dict[int, Tuple[str, datetime]] = {}
+        self._pending_downloads: List[Tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self._executor.submit(self._init_db).result()
 
     def _init_db(self):
-        """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        """Open the connection and initialize database tables"""
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        c = self._conn.cursor()
 
         # Create users table
         c.execute('''
@@ -45,26 +71,284 @@ class DatabaseManager:
             )
         ''')
 
-        conn.commit()
-        conn.close()
+        # Create Telegram file_id registry for re-sending uploaded media
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                catalog_key TEXT,
+                quality TEXT,
+                mode TEXT,
+                position INTEGER,
+                media_type TEXT,
+                file_id TEXT,
+                created_at DATETIME,
+                PRIMARY KEY (catalog_key, quality, mode, position)
+            )
+        ''')
+
+        self._conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """Apply schema migrations tracked by PRAGMA user_version"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # Incrementally maintained counters, backfilled once from history
+            self._conn.executescript('''
+                BEGIN;
+
+                CREATE INDEX IF NOT EXISTS idx_downloads_user_id ON downloads (user_id);
+                CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads (status);
+                CREATE INDEX IF NOT EXISTS idx_downloads_started_at ON downloads (started_at);
+
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    successful_downloads INTEGER DEFAULT 0,
+                    failed_downloads INTEGER DEFAULT 0,
+                    total_bytes INTEGER DEFAULT 0
+                );
+
+                CREATE TABLE IF NOT EXISTS daily_stats (
+                    day DATE PRIMARY KEY,
+                    successful_downloads INTEGER DEFAULT 0,
+                    failed_downloads INTEGER DEFAULT 0,
+                    total_bytes INTEGER DEFAULT 0
+                );
+
+                CREATE TABLE IF NOT EXISTS bot_stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    successful_downloads INTEGER DEFAULT 0,
+                    failed_downloads INTEGER DEFAULT 0,
+                    total_bytes INTEGER DEFAULT 0
+                );
+
+                INSERT OR REPLACE INTO user_stats
+                SELECT
+                    user_id,
+                    COUNT(CASE WHEN status = 'completed' THEN 1 END),
+                    COUNT(CASE WHEN status = 'failed' THEN 1 END),
+                    COALESCE(SUM(CASE WHEN status = 'completed' THEN file_size END), 0)
+                FROM downloads
+                GROUP BY user_id;
+
+                INSERT OR REPLACE INTO daily_stats
+                SELECT
+                    DATE(started_at),
+                    COUNT(CASE WHEN status = 'completed' THEN 1 END),
+                    COUNT(CASE WHEN status = 'failed' THEN 1 END),
+                    COALESCE(SUM(CASE WHEN status = 'completed' THEN file_size END), 0)
+                FROM downloads
+                GROUP BY DATE(started_at);
+
+                INSERT OR REPLACE INTO bot_stats
+                SELECT
+                    1,
+                    COUNT(CASE WHEN status = 'completed' THEN 1 END),
+                    COUNT(CASE WHEN status = 'failed' THEN 1 END),
+                    COALESCE(SUM(CASE WHEN status = 'completed' THEN file_size END), 0)
+                FROM downloads;
+
+                PRAGMA user_version = 1;
+
+                COMMIT;
+            ''')
+            logger.info("Migrated database to schema version 1")
+
+        if version < 2:
+            # Download queue state, so jobs survive restarts
+            self._conn.executescript('''
+                BEGIN;
+
+                CREATE TABLE IF NOT EXISTS queue_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    chat_id INTEGER,
+                    message_id INTEGER,
+                    url TEXT,
+                    quality TEXT,
+                    zip_file BOOLEAN,
+                    priority BOOLEAN,
+                    status TEXT,
+                    checkpoint TEXT,
+                    error_message TEXT,
+                    queued_at DATETIME,
+                    started_at DATETIME,
+                    finished_at DATETIME
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_queue_jobs_status ON queue_jobs (status);
+
+                PRAGMA user_version = 2;
+
+                COMMIT;
+            ''')
+            logger.info("Migrated database to schema version 2")
+
+        if version < 3:
+            # Per-job stage timings for /profile
+            self._conn.executescript('''
+                BEGIN;
+
+                ALTER TABLE downloads ADD COLUMN duration REAL;
+                ALTER TABLE downloads ADD COLUMN stage_spans TEXT;
+
+                PRAGMA user_version = 3;
+
+                COMMIT;
+            ''')
+            logger.info("Migrated database to schema version 3")
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """Run a function with the connection on the DB thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, self._conn, *args))
+
+    def start(self):
+        """Start the periodic write-behind flush"""
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._periodic_flush())
+
+    async def close(self):
+        """Flush buffered writes and close the connection"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        await self._run(lambda conn: conn.close())
+        self._executor.shutdown(wait=True)
+
+    async def _periodic_flush(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), DB_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush database writes: {e}")
+
+    def _schedule_flush(self):
+        """Wake the periodic flush early once a batch is buffered"""
+        if self._flush_requested is None:
+            return  # Not started; close() flushes what is left
+        if len(self._pending_users) + len(self._pending_downloads) >= DB_FLUSH_BATCH_SIZE:
+            self._flush_requested.set()
+
+    async def flush(self):
+        """Write all buffered users and downloads in one transaction"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending_users and not self._pending_downloads:
+                return
+            users, self._pending_users = self._pending_users, {}
+            downloads, self._pending_downloads = self._pending_downloads, []
+            try:
+                await self._run(self._write_batch, users, downloads)
+            except Exception:
+                # Keep the batch for the next attempt, behind anything newer
+                self._pending_users = {**users, **self._pending_users}
+                self._pending_downloads = downloads + self._pending_downloads
+                raise
+
+    @staticmethod
+    def _write_batch(
+        conn: sqlite3.Connection,
+        users: Dict[int, Tuple[str, datetime]],
+        downloads: List[Tuple]
+    ):
+        with conn:
+            conn.executemany('''
+                INSERT INTO users (user_id, username, first_seen, last_active)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    last_active = excluded.last_active
+            ''', [
+                (user_id, username, seen, seen)
+                for user_id, (username, seen) in users.items()
+            ])
+
+            conn.executemany('''
+                INSERT INTO downloads (
+                    user_id, url, file_type, quality, status,
+                    started_at, completed_at, file_size, error_message,
+                    duration, stage_spans
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', downloads)
+
+            conn.executemany('''
+                UPDATE users
+                SET total_downloads = total_downloads + 1,
+                    last_active = ?
+                WHERE user_id = ?
+            ''', [
+                (row[6], row[0]) for row in downloads if row[4] == 'completed'
+            ])
+
+            # Roll the batch up into the stats counters
+            per_user: Dict[int, List[int]] = {}
+            per_day: Dict[str, List[int]] = {}
+            total = [0, 0, 0]
+            for row in downloads:
+                user_id, status, started_at, file_size = row[0], row[4], row[5], row[7]
+                if status not in ('completed', 'failed'):
+                    continue
+                delta = (
+                    [1, 0, file_size or 0] if status == 'completed' else [0, 1, 0]
+                )
+                for counters in (
+                    per_user.setdefault(user_id, [0, 0, 0]),
+                    per_day.setdefault(started_at.date().isoformat(), [0, 0, 0]),
+                    total
+                ):
+                    for i, value in enumerate(delta):
+                        counters[i] += value
+
+            conn.executemany('''
+                INSERT INTO user_stats (
+                    user_id, successful_downloads, failed_downloads, total_bytes
+                )
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    successful_downloads = successful_downloads + excluded.successful_downloads,
+                    failed_downloads = failed_downloads + excluded.failed_downloads,
+                    total_bytes = total_bytes + excluded.total_bytes
+            ''', [(key, *counters) for key, counters in per_user.items()])
+
+            conn.executemany('''
+                INSERT INTO daily_stats (
+                    day, successful_downloads, failed_downloads, total_bytes
+                )
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (day) DO UPDATE SET
+                    successful_downloads = successful_downloads + excluded.successful_downloads,
+                    failed_downloads = failed_downloads + excluded.failed_downloads,
+                    total_bytes = total_bytes + excluded.total_bytes
+            ''', [(key, *counters) for key, counters in per_day.items()])
+
+            if any(total):
+                conn.execute('''
+                    INSERT INTO bot_stats (
+                        id, successful_downloads, failed_downloads, total_bytes
+                    )
+                    VALUES (1, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        successful_downloads = successful_downloads + excluded.successful_downloads,
+                        failed_downloads = failed_downloads + excluded.failed_downloads,
+                        total_bytes = total_bytes + excluded.total_bytes
+                ''', total)
 
     async def add_user(self, user_id: int, username: str):
         """Add or update user in database"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        now = datetime.utcnow()
-        c.execute('''
-            INSERT OR REPLACE INTO users 
-            (user_id, username, first_seen, last_active)
-            VALUES (?, ?, COALESCE(
-                (SELECT first_seen FROM users WHERE user_id = ?),
-                ?
-            ), ?)
-        ''', (user_id, username, user_id, now, now))
-        
-        conn.commit()
-        conn.close()
+        self._pending_users[user_id] = (username, datetime.utcnow())
+        self._schedule_flush()
 
     async def log_download(
         self,
@@ -74,65 +358,259 @@ class DatabaseManager:
         quality: str,
         status: str,
         file_size: Optional[int] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        started_at: Optional[datetime] = None,
+        spans: Optional[Dict[str, Dict[str, float]]] = None
     ):
-        """Log download attempt"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
+        """Log download attempt
+
+        `started_at` is when the job got its download slot (UTC), defaulting
+        to now; `spans` holds the job's per-stage seconds and bytes.
+        """
         now = datetime.utcnow()
-        
-        c.execute('''
-            INSERT INTO downloads (
-                user_id, url, file_type, quality, status,
-                started_at, completed_at, file_size, error_message
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        started_at = started_at or now
+        self._pending_downloads.append((
             user_id, url, file_type, quality, status,
-            now, now if status == 'completed' else None,
-            file_size, error_message
+            started_at, now if status == 'completed' else None,
+            file_size, error_message,
+            (now - started_at).total_seconds(),
+            json.dumps(spans) if spans else None
         ))
-        
-        if status == 'completed':
-            c.execute('''
-                UPDATE users 
-                SET total_downloads = total_downloads + 1,
-                    last_active = ?
-                WHERE user_id = ?
-            ''', (now, user_id))
-        
-        conn.commit()
-        conn.close()
+        self._schedule_flush()
 
     async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Get user statistics"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT 
-                u.total_downloads,
-                u.first_seen,
-                u.last_active,
-                COUNT(CASE WHEN d.status = 'completed' THEN 1 END) as successful_downloads,
-                COUNT(CASE WHEN d.status = 'failed' THEN 1 END) as failed_downloads
-            FROM users u
-            LEFT JOIN downloads d ON u.user_id = d.user_id
-            WHERE u.user_id = ?
-            GROUP BY u.user_id
-        ''', (user_id,))
-        
-        row = c.fetchone()
-        conn.close()
-        
+        await self.flush()
+        row = await self._run(self._query_user_stats, user_id)
+
         if not row:
             return {}
-            
+
         return {
             'total_downloads': row[0],
             'first_seen': row[1],
             'last_active': row[2],
             'successful_downloads': row[3],
-            'failed_downloads': row[4]
+            'failed_downloads': row[4],
+            'total_bytes': row[5]
         }
+
+    @staticmethod
+    def _query_user_stats(conn: sqlite3.Connection, user_id: int):
+        c = conn.cursor()
+        c.execute('''
+            SELECT
+                u.total_downloads,
+                u.first_seen,
+                u.last_active,
+                COALESCE(s.successful_downloads, 0),
+                COALESCE(s.failed_downloads, 0),
+                COALESCE(s.total_bytes, 0)
+            FROM users u
+            LEFT JOIN user_stats s ON u.user_id = s.user_id
+            WHERE u.user_id = ?
+        ''', (user_id,))
+        return c.fetchone()
+
+    async def get_bot_stats(self) -> Dict[str, Any]:
+        """Get all-time and today's download statistics"""
+        await self.flush()
+        return await self._run(self._query_bot_stats, datetime.utcnow().date().isoformat())
+
+    @staticmethod
+    def _query_bot_stats(conn: sqlite3.Connection, today: str) -> Dict[str, Any]:
+        c = conn.cursor()
+        stats = {}
+        for name, query, args in (
+            ('all_time', 'SELECT successful_downloads, failed_downloads, total_bytes FROM bot_stats WHERE id = 1', ()),
+            ('today', 'SELECT successful_downloads, failed_downloads, total_bytes FROM daily_stats WHERE day = ?', (today,))
+        ):
+            row = c.execute(query, args).fetchone() or (0, 0, 0)
+            stats[name] = {
+                'successful_downloads': row[0],
+                'failed_downloads': row[1],
+                'total_bytes': row[2]
+            }
+        return stats
+
+    async def get_authorized_users(self) -> List[int]:
+        """Get IDs of all users granted access with /auth"""
+        return await self._run(self._query_authorized_users)
+
+    @staticmethod
+    def _query_authorized_users(conn: sqlite3.Connection) -> List[int]:
+        c = conn.cursor()
+        c.execute('SELECT user_id FROM users WHERE is_authorized = 1')
+        return [row[0] for row in c.fetchall()]
+
+    async def set_authorized(self, user_id: int, authorized: bool):
+        """Grant or revoke access, written through immediately"""
+        await self._run(self._update_authorized, user_id, authorized)
+
+    @staticmethod
+    def _update_authorized(conn: sqlite3.Connection, user_id: int, authorized: bool):
+        with conn:
+            conn.execute('''
+                INSERT INTO users (user_id, first_seen, is_authorized)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    is_authorized = excluded.is_authorized
+            ''', (user_id, datetime.utcnow(), int(authorized)))
+
+    async def get_file_ids(
+        self,
+        catalog_key: str,
+        quality: str,
+        mode: str
+    ) -> List[Tuple[str, str]]:
+        """Get registered (media_type, file_id) pairs in delivery order"""
+        return await self._run(self._query_file_ids, catalog_key, quality, mode)
+
+    @staticmethod
+    def _query_file_ids(conn: sqlite3.Connection, catalog_key: str, quality: str, mode: str):
+        c = conn.cursor()
+        c.execute('''
+            SELECT media_type, file_id
+            FROM telegram_files
+            WHERE catalog_key = ? AND quality = ? AND mode = ?
+            ORDER BY position
+        ''', (catalog_key, quality, mode))
+        return c.fetchall()
+
+    async def save_file_ids(
+        self,
+        catalog_key: str,
+        quality: str,
+        mode: str,
+        file_ids: List[Tuple[str, str]]
+    ):
+        """Replace the registered file_ids for a delivery"""
+        await self._run(self._replace_file_ids, catalog_key, quality, mode, file_ids)
+
+    @staticmethod
+    def _replace_file_ids(
+        conn: sqlite3.Connection,
+        catalog_key: str,
+        quality: str,
+        mode: str,
+        file_ids: List[Tuple[str, str]]
+    ):
+        now = datetime.utcnow()
+        with conn:
+            conn.execute('''
+                DELETE FROM telegram_files
+                WHERE catalog_key = ? AND quality = ? AND mode = ?
+            ''', (catalog_key, quality, mode))
+            conn.executemany('''
+                INSERT INTO telegram_files (
+                    catalog_key, quality, mode, position,
+                    media_type, file_id, created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (catalog_key, quality, mode, position, media_type, file_id, now)
+                for position, (media_type, file_id) in enumerate(file_ids)
+            ])
+
+    async def delete_file_ids(self, catalog_key: str, quality: str, mode: str):
+        """Forget registered file_ids, e.g. after Telegram rejected one as stale"""
+        await self._run(self._delete_file_ids, catalog_key, quality, mode)
+
+    @staticmethod
+    def _delete_file_ids(conn: sqlite3.Connection, catalog_key: str, quality: str, mode: str):
+        with conn:
+            conn.execute('''
+                DELETE FROM telegram_files
+                WHERE catalog_key = ? AND quality = ? AND mode = ?
+            ''', (catalog_key, quality, mode))
+
+    async def save_queue_job(self, job: Dict[str, Any]):
+        """Write a download queue job's current state through immediately"""
+        await self._run(self._upsert_queue_job, job)
+
+    @staticmethod
+    def _upsert_queue_job(conn: sqlite3.Connection, job: Dict[str, Any]):
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO queue_jobs (
+                    job_id, user_id, chat_id, message_id, url, quality,
+                    zip_file, priority, status, checkpoint, error_message,
+                    queued_at, started_at, finished_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                job['job_id'], job['user_id'], job['chat_id'], job['message_id'],
+                job['url'], job['quality'], int(job['zip_file']), int(job['priority']),
+                job['status'], json.dumps(job['checkpoint']), job.get('error'),
+                job['queued_time'], job['start_time'], job['finish_time']
+            ))
+
+    async def get_unfinished_queue_jobs(self) -> List[Dict[str, Any]]:
+        """Get queued, running and waiting jobs in the order they were queued"""
+        return await self._run(self._query_unfinished_queue_jobs)
+
+    @staticmethod
+    def _query_unfinished_queue_jobs(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        c = conn.cursor()
+        c.execute('''
+            SELECT job_id, user_id, chat_id, message_id, url, quality,
+                   zip_file, priority, status, checkpoint
+            FROM queue_jobs
+            WHERE status IN ('queued', 'downloading', 'waiting')
+            ORDER BY queued_at
+        ''')
+        return [
+            {
+                'job_id': row[0],
+                'user_id': row[1],
+                'chat_id': row[2],
+                'message_id': row[3],
+                'url': row[4],
+                'quality': row[5],
+                'zip_file': bool(row[6]),
+                'priority': bool(row[7]),
+                'status': row[8],
+                'checkpoint': [tuple(item) for item in json.loads(row[9] or '[]')]
+            }
+            for row in c.fetchall()
+        ]
+
+    async def prune_queue_jobs(self, before: datetime):
+        """Forget finished queue jobs older than `before`"""
+        await self._run(self._delete_queue_jobs, before)
+
+    @staticmethod
+    def _delete_queue_jobs(conn: sqlite3.Connection, before: datetime):
+        with conn:
+            conn.execute('''
+                DELETE FROM queue_jobs
+                WHERE status NOT IN ('queued', 'downloading', 'waiting') AND finished_at < ?
+            ''', (before,))
+
+    async def get_download_profiles(self, since: datetime) -> List[Dict[str, Any]]:
+        """Get the stage timings of downloads started since `since`"""
+        await self.flush()
+        return await self._run(self._query_download_profiles, since)
+
+    @staticmethod
+    def _query_download_profiles(conn: sqlite3.Connection, since: datetime) -> List[Dict[str, Any]]:
+        c = conn.cursor()
+        c.execute('''
+            SELECT user_id, url, file_type, quality, status, started_at, duration, stage_spans
+            FROM downloads
+            WHERE started_at >= ? AND stage_spans IS NOT NULL
+            ORDER BY started_at
+        ''', (since,))
+        return [
+            {
+                'user_id': row[0],
+                'url': row[1],
+                'file_type': row[2],
+                'quality': row[3],
+                'status': row[4],
+                'started_at': row[5],
+                'duration': row[6],
+                'spans': json.loads(row[7])
+            }
+            for row in c.fetchall()
+        ]
@@ -0,0 +1,189 @@
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from gamdl.apple_music_api import AppleMusicApi
+from gamdl.downloader import Downloader
+from gamdl.downloader_music_video import DownloaderMusicVideo
+from gamdl.downloader_song_legacy import DownloaderSongLegacy
+from gamdl.enums import SongCodec
+from gamdl.itunes_api import ItunesApi
+
+from config.config import COOKIES_FILE
+from .error_handler import DownloadError
+from .hls import get_fetcher
+
+# gamdl's legacy AAC streams; there is no 128 kbps one, so MEDIUM gets HE-AAC too
+SONG_CODECS = {
+    "256": SongCodec.AAC_LEGACY,
+    "128": SongCodec.AAC_HE_LEGACY,
+    "64": SongCodec.AAC_HE_LEGACY
+}
+
+# gamdl's intermediate files, below the output path of a download
+TEMP_DIR_NAME = ".gamdl"
+
+class ResumableDownloader(Downloader):
+    """gamdl Downloader that fetches HLS streams through the SegmentFetcher"""
+
+    # Called on the fetcher thread with the size of every segment written
+    on_bytes: Optional[Callable[[int], None]] = None
+    # Stops the download before the next segment is written
+    cancel: Optional[threading.Event] = None
+
+    def download(self, path: Path, stream_url: str):
+        # gamdl calls this from a worker thread or pool process, never the event loop
+        get_fetcher().download(stream_url, Path(path), self.on_bytes, self.cancel)
+
+class GamdlDownloader:
+    """Resolves and downloads tracks one at a time with gamdl
+
+    gamdl has no per-track API; its CLI strings together the Apple Music
+    API lookups, `Downloader.download` and the song and music video
+    downloaders' decrypt and remux steps. This class does the same behind
+    the `get_tracks` / `download_track` interface that the pipeline, the
+    DownloaderPool and the worker processes call. Both methods block.
+
+    Every download gets its own gamdl Downloader whose output and temp
+    paths lie below the given `output_path`, so concurrent downloads
+    don't share temp files and a retry finds the last attempt's segments.
+    """
+
+    def __init__(
+        self,
+        cookies_path: Path = COOKIES_FILE,
+        apple_music_api: Optional[AppleMusicApi] = None,
+        itunes_api: Optional[ItunesApi] = None
+    ):
+        self.apple_music_api = apple_music_api or AppleMusicApi(cookies_path)
+        self.itunes_api = itunes_api or ItunesApi(
+            self.apple_music_api.storefront, self.apple_music_api.language
+        )
+        # Used for lookups, and shares its CDM with the per-download Downloaders
+        self.downloader = ResumableDownloader(self.apple_music_api, self.itunes_api, silent=True)
+        self.downloader.set_cdm()
+
+    def get_tracks(self, url: str) -> List[Dict]:
+        """Resolve a URL to the metadata of the tracks to download"""
+        url_info = self.downloader.get_url_info(url)
+        tracks = self.downloader.get_download_queue(url_info).tracks_metadata
+        # Like gamdl's CLI: skip what can't be streamed, and music videos on albums
+        return [
+            track for track in tracks
+            if track['attributes'].get('playParams')
+            and (track['type'] == 'songs' or (track['type'] == 'music-videos' and url_info.type != 'album'))
+        ]
+
+    def download_track(
+        self,
+        track: Dict,
+        output_path: Path,
+        quality: str,
+        on_bytes: Optional[Callable[[int], None]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Path:
+        """Download, decrypt, remux and tag one track below `output_path`
+
+        `on_bytes` gets the size of every stream segment as it is written,
+        on the SegmentFetcher's thread. Setting `cancel` stops the download
+        with a DownloadError before its next segment or step writes a file.
+        """
+        output_path = Path(output_path)
+        downloader = ResumableDownloader(
+            self.apple_music_api,
+            self.itunes_api,
+            output_path=output_path,
+            temp_path=output_path / TEMP_DIR_NAME,
+            silent=True
+        )
+        downloader.cdm = self.downloader.cdm
+        downloader.on_bytes = on_bytes
+        downloader.cancel = cancel
+
+        if track['type'] == 'songs':
+            return self._download_song(downloader, track, quality)
+        if track['type'] == 'music-videos':
+            return self._download_music_video(downloader, track)
+        raise DownloadError(f"Can't download {track['type']}")
+
+    def _download_song(self, downloader: ResumableDownloader, track: Dict, quality: str) -> Path:
+        song = DownloaderSongLegacy(downloader, SONG_CODECS.get(quality, SongCodec.AAC_LEGACY))
+        track_id = track['id']
+        webplayback = self.apple_music_api.get_webplayback(track_id)
+        tags = song.get_tags(webplayback, song.get_lyrics(track).unsynced)
+        final_path = downloader.get_final_path(tags, '.m4a')
+        if final_path.exists():
+            return final_path  # Finished by an earlier attempt
+
+        try:
+            stream_info = song.get_stream_info(webplayback)
+        except StopIteration:
+            raise DownloadError(f"{track['attributes']['name']} is not available in this quality")
+        decryption_key = song.get_decryption_key(stream_info.widevine_pssh, track_id)
+
+        encrypted_path = song.get_encrypted_path(track_id)
+        decrypted_path = song.get_decrypted_path(track_id)
+        remuxed_path = song.get_remuxed_path(track_id)
+        downloader.download(encrypted_path, stream_info.stream_url)
+        self._check_cancel(downloader)
+        song.remux(encrypted_path, decrypted_path, remuxed_path, decryption_key)
+        return self._finish(downloader, track, tags, remuxed_path, final_path, (encrypted_path, decrypted_path))
+
+    def _download_music_video(self, downloader: ResumableDownloader, track: Dict) -> Path:
+        music_video = DownloaderMusicVideo(downloader)
+        track_id = track['id']
+        id_alt = music_video.get_music_video_id_alt(track)
+        itunes_page = self.itunes_api.get_itunes_page("music-video", id_alt)
+        m3u8_master_data = music_video.get_m3u8_master_data(
+            music_video.get_stream_url_from_itunes_page(itunes_page)
+        )
+        tags = music_video.get_tags(id_alt, itunes_page, track)
+        final_path = downloader.get_final_path(tags, '.m4v')
+        if final_path.exists():
+            return final_path  # Finished by an earlier attempt
+
+        video = music_video.get_stream_info_video(m3u8_master_data)
+        audio = music_video.get_stream_info_audio(m3u8_master_data)
+        key_video = downloader.get_decryption_key(video.widevine_pssh, track_id)
+        key_audio = downloader.get_decryption_key(audio.widevine_pssh, track_id)
+
+        encrypted_video = music_video.get_encrypted_path_video(track_id)
+        encrypted_audio = music_video.get_encrypted_path_audio(track_id)
+        decrypted_video = music_video.get_decrypted_path_video(track_id)
+        decrypted_audio = music_video.get_decrypted_path_audio(track_id)
+        remuxed_path = music_video.get_remuxed_path(track_id)
+        downloader.download(encrypted_video, video.stream_url)
+        downloader.download(encrypted_audio, audio.stream_url)
+        self._check_cancel(downloader)
+        music_video.decrypt(encrypted_video, key_video, decrypted_video)
+        music_video.decrypt(encrypted_audio, key_audio, decrypted_audio)
+        self._check_cancel(downloader)
+        music_video.remux(decrypted_video, decrypted_audio, remuxed_path, video.codec, audio.codec)
+        return self._finish(
+            downloader, track, tags, remuxed_path, final_path,
+            (encrypted_video, encrypted_audio, decrypted_video, decrypted_audio)
+        )
+
+    @staticmethod
+    def _check_cancel(downloader: ResumableDownloader):
+        if downloader.cancel and downloader.cancel.is_set():
+            raise DownloadError("Download cancelled")
+
+    @classmethod
+    def _finish(
+        cls,
+        downloader: ResumableDownloader,
+        track: Dict,
+        tags: Dict,
+        remuxed_path: Path,
+        final_path: Path,
+        intermediate: Iterable[Path]
+    ) -> Path:
+        """Tag the remuxed file, move it into place and drop the intermediate files"""
+        cls._check_cancel(downloader)
+        downloader.apply_tags(remuxed_path, tags, downloader.get_cover_url(track))
+        cls._check_cancel(downloader)
+        downloader.move_to_output_path(remuxed_path, final_path)
+        for path in intermediate:
+            Path(path).unlink(missing_ok=True)
+        return final_path
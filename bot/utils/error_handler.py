@@ -1,9 +1,21 @@
+import asyncio
 import logging
-from typing import Optional, Callable
+import time
+import traceback
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Callable
 from functools import wraps
-from telegram import Update
+from telegram import Bot, Update
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
+from config.config import (
+    ERROR_ADMIN_MAX_MESSAGES,
+    ERROR_SUMMARY_INTERVAL,
+    MAX_MESSAGE_LENGTH
+)
+from .rate_limiter import PRIORITY_LOG
+
 logger = logging.getLogger(__name__)
 
 class BotError(Exception):
@@ -49,3 +61,116 @@ def handle_errors(func: Callable):
             )
     
     return wrapper
+
+def error_fingerprint(error: BaseException) -> str:
+    """Identify an error by its type and the frame that raised it"""
+    frames = traceback.extract_tb(error.__traceback__)
+    if not frames:
+        return type(error).__name__
+    top = frames[-1]
+    return f"{type(error).__name__} at {top.filename}:{top.lineno} in {top.name}"
+
+class ErrorNotifier:
+    """Fans errors out to admins, grouped by fingerprint
+
+    The first occurrence of a fingerprint is sent right away; repeats are
+    counted and reported in one summary per ERROR_SUMMARY_INTERVAL. Each
+    admin gets at most ERROR_ADMIN_MAX_MESSAGES messages per interval, and
+    anything over the cap is folded into the next summary.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        admin_users: Iterable[int],
+        interval: int = ERROR_SUMMARY_INTERVAL,
+        max_messages: int = ERROR_ADMIN_MAX_MESSAGES
+    ):
+        self.bot = bot
+        self.admin_users = list(admin_users)
+        self.interval = interval
+        self.max_messages = max_messages
+
+        self._groups: Dict[str, Dict] = {}  # fingerprint: {'error', 'last_seen', 'repeats'}
+        self._sent: Dict[int, int] = {}  # admin_id: messages this interval
+        self._dropped: Dict[int, int] = {}  # admin_id: messages over the cap
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the periodic summary"""
+        self._summary_task = asyncio.create_task(self._periodic_summary())
+
+    async def stop(self):
+        """Stop the periodic summary and send what is pending"""
+        if self._summary_task:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
+        await self.send_summary()
+
+    async def notify(self, error: BaseException):
+        """Report an error, suppressing repeats of a known fingerprint"""
+        fingerprint = error_fingerprint(error)
+        now = time.monotonic()
+
+        group = self._groups.get(fingerprint)
+        if group is not None and now - group['last_seen'] < self.interval:
+            group['last_seen'] = now
+            group['repeats'] += 1
+            return
+
+        self._groups[fingerprint] = {'error': str(error), 'last_seen': now, 'repeats': 0}
+        await self._broadcast(
+            f"❌ Error occurred at {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
+            f"Error: {str(error)}\n"
+            f"Where: {fingerprint}\n"
+        )
+
+    async def _periodic_summary(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.send_summary()
+            except Exception as e:
+                logger.error(f"Failed to send error summary: {e}")
+
+    async def send_summary(self):
+        """Report suppressed repeats and reset the per-admin caps"""
+        now = time.monotonic()
+        lines = []
+        for fingerprint, group in list(self._groups.items()):
+            if group['repeats']:
+                lines.append(f"×{group['repeats']} {fingerprint}: {group['error']}")
+                group['repeats'] = 0
+            elif now - group['last_seen'] >= self.interval:
+                del self._groups[fingerprint]
+
+        dropped = self._dropped
+        self._sent, self._dropped = {}, {}
+
+        minutes = max(1, self.interval // 60)
+        for admin_id in self.admin_users:
+            admin_lines = list(lines)
+            if dropped.get(admin_id):
+                admin_lines.append(f"×{dropped[admin_id]} notifications over the rate cap")
+            if admin_lines:
+                text = f"📊 Errors in the last {minutes}m\n\n" + "\n".join(admin_lines)
+                await self._send(admin_id, text[:MAX_MESSAGE_LENGTH])
+
+    async def _broadcast(self, text: str):
+        for admin_id in self.admin_users:
+            if self._sent.get(admin_id, 0) >= self.max_messages:
+                self._dropped[admin_id] = self._dropped.get(admin_id, 0) + 1
+                continue
+            await self._send(admin_id, text)
+
+    async def _send(self, admin_id: int, text: str):
+        self._sent[admin_id] = self._sent.get(admin_id, 0) + 1
+        try:
+            await self.bot.send_message(
+                chat_id=admin_id,
+                text=text,
+                rate_limit_args=PRIORITY_LOG
+            )
+        except TelegramError as e:
+            logger.error(f"Failed to notify admin {admin_id}: {e}")
@@ -23,6 +23,15 @@ def format_size(size_in_bytes: int) -> str:
         size_in_bytes /= 1024
     return f"{size_in_bytes:.1f}GB"
 
+def format_duration(seconds: float) -> str:
+    """Format a duration in human readable format"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
 def format_track_info(track_data: Dict[str, Any]) -> str:
     """Format track information message"""
     return (
@@ -0,0 +1,313 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import m3u8
+
+from config.config import (
+    HLS_CONNECT_TIMEOUT,
+    HLS_CONNECTIONS_PER_HOST,
+    HLS_KEEPALIVE_TIMEOUT,
+    HLS_MAX_CONNECTIONS,
+    HLS_REQUEST_TIMEOUT,
+    HLS_SEGMENT_CONCURRENCY,
+    HLS_SEGMENT_RETRIES,
+    HLS_SEGMENT_TIMEOUT
+)
+from .error_handler import DownloadError
+from .formatter import format_size
+
+logger = logging.getLogger(__name__)
+
+# (absolute URI, (offset, length) or None for the whole resource)
+Segment = Tuple[str, Optional[Tuple[int, int]]]
+
+def _parse_byterange(value: Optional[str], previous_end: int) -> Optional[Tuple[int, int]]:
+    """Turn an EXT-X-BYTERANGE "length[@offset]" into (offset, length)"""
+    if not value:
+        return None
+    length, _, offset = value.partition('@')
+    return (int(offset) if offset else previous_end, int(length))
+
+def playlist_segments(playlist: m3u8.M3U8) -> List[Segment]:
+    """List the init sections and media segments of a playlist in file order"""
+    segments: List[Segment] = []
+    ends = {}  # uri: end of the last byte range, for ranges without an offset
+    init_uri = None
+
+    for segment in playlist.segments:
+        init = segment.init_section
+        if init is not None and init.absolute_uri != init_uri:
+            init_uri = init.absolute_uri
+            segments.append((init_uri, _parse_byterange(init.byterange, 0)))
+
+        byterange = _parse_byterange(segment.byterange, ends.get(segment.absolute_uri, 0))
+        if byterange:
+            ends[segment.absolute_uri] = byterange[0] + byterange[1]
+        segments.append((segment.absolute_uri, byterange))
+
+    return segments
+
+class SegmentManifest:
+    """Checkpoint of the segments already verified on disk for one stream
+
+    Stored as JSON next to the partial file and replaced atomically after
+    every segment, so a retry (or a restarted worker) continues after the
+    last verified segment instead of starting over.
+    """
+
+    def __init__(self, path: Path, segment_count: int):
+        self.path = path
+        self.segment_count = segment_count
+        self.sizes: List[int] = []
+
+    @property
+    def offset(self) -> int:
+        return sum(self.sizes)
+
+    def load(self, part_size: int):
+        """Restore the checkpoint, dropping segments the partial file lacks"""
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if data.get('segment_count') != self.segment_count:
+            logger.info(f"Playlist changed since {self.path.name} was written, starting over")
+            return
+
+        end = 0
+        for size in data.get('sizes', []):
+            if end + size > part_size:
+                break
+            end += size
+            self.sizes.append(size)
+
+    def record(self, size: int):
+        self.sizes.append(size)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps({'segment_count': self.segment_count, 'sizes': self.sizes}))
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+class FetchStats:
+    """Counters of the segments fetched by this process"""
+
+    def __init__(self):
+        self.segments = 0
+        self.bytes = 0
+        self.seconds = 0.0  # Summed per segment, so parallel fetches overlap
+
+    def record(self, size: int, seconds: float):
+        self.segments += 1
+        self.bytes += size
+        self.seconds += seconds
+
+class SegmentFetcher:
+    """Process-wide HLS segment fetcher
+
+    gamdl calls `download` from worker threads or pool processes, so the
+    fetcher runs its own event loop on a background thread. All downloads
+    share one aiohttp connector, with keep-alive and per-host connection
+    limits. Within a track, up to `concurrency` segments are fetched at
+    once, but they are written in order into a file preallocated to the
+    stream's size (when its byte ranges give it away). That keeps the
+    manifest a simple prefix of verified segments.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = HLS_SEGMENT_CONCURRENCY,
+        max_connections: int = HLS_MAX_CONNECTIONS,
+        connections_per_host: int = HLS_CONNECTIONS_PER_HOST,
+        retries: int = HLS_SEGMENT_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.stats = FetchStats()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="hls-fetcher", daemon=True)
+        self._thread.start()
+        self._session: aiohttp.ClientSession = asyncio.run_coroutine_threadsafe(
+            self._create_session(max_connections, connections_per_host), self._loop
+        ).result()
+
+    @staticmethod
+    async def _create_session(max_connections: int, connections_per_host: int) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=max_connections,
+            limit_per_host=connections_per_host,
+            keepalive_timeout=HLS_KEEPALIVE_TIMEOUT
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            # Fields left out of a ClientTimeout are unlimited, not aiohttp's defaults
+            timeout=aiohttp.ClientTimeout(
+                total=HLS_REQUEST_TIMEOUT,
+                sock_connect=HLS_CONNECT_TIMEOUT,
+                sock_read=HLS_SEGMENT_TIMEOUT
+            )
+        )
+
+    def download(
+        self,
+        stream_url: str,
+        path: Path,
+        on_bytes: Optional[Callable[[int], None]] = None,
+        cancel: Optional[threading.Event] = None
+    ):
+        """Download a stream from a thread other than the fetcher's"""
+        asyncio.run_coroutine_threadsafe(
+            self.download_stream(stream_url, path, on_bytes, cancel), self._loop
+        ).result()
+
+    def close(self):
+        """Close the connections and stop the fetcher thread"""
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _fetch_segment(self, uri: str, byterange: Optional[Tuple[int, int]]) -> bytes:
+        """Fetch one segment and verify its length, retrying transient errors"""
+        headers = {}
+        if byterange:
+            offset, length = byterange
+            headers['Range'] = f"bytes={offset}-{offset + length - 1}"
+
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                async with self._session.get(uri, headers=headers) as response:
+                    response.raise_for_status()
+                    data = await response.read()
+                expected = byterange[1] if byterange else response.content_length
+                if expected is not None and len(data) != expected:
+                    raise aiohttp.ClientPayloadError(f"Got {len(data)} of {expected} bytes")
+                self.stats.record(len(data), time.monotonic() - started)
+                return data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Segment fetch failed ({e}), retrying")
+                await asyncio.sleep(2 ** attempt)
+
+    async def download_stream(
+        self,
+        stream_url: str,
+        path: Path,
+        on_bytes: Optional[Callable[[int], None]] = None,
+        cancel: Optional[threading.Event] = None
+    ):
+        """Download an HLS stream into `path`, resuming from its segment manifest
+
+        Segments go to `<path>.part`; the manifest records each one once it
+        is written, and the partial file is renamed into place when the
+        last segment arrives. A failure keeps both for the next attempt.
+        `on_bytes` is called on the fetcher thread with the size of every
+        segment written. Once `cancel` is set, no further segment is
+        written and DownloadError is raised.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = path.with_name(path.name + '.part')
+
+        async with self._session.get(stream_url) as response:
+            response.raise_for_status()
+            playlist = m3u8.loads(await response.text(), uri=stream_url)
+        segments = playlist_segments(playlist)
+
+        manifest = SegmentManifest(path.with_name(path.name + '.manifest.json'), len(segments))
+        if part_path.exists():
+            manifest.load(part_path.stat().st_size)
+        if manifest.sizes:
+            logger.info(f"Resuming {path.name} at segment {len(manifest.sizes)}/{len(segments)}")
+
+        fetched_bytes, started = self.stats.bytes, time.monotonic()
+        with open(part_path, 'r+b' if part_path.exists() else 'wb') as f:
+            total_size = self._stream_size(segments)
+            if total_size is not None:
+                self._preallocate(f, total_size)
+            else:
+                f.truncate(manifest.offset)
+            await self._fetch_in_order(f, segments, manifest, on_bytes, cancel)
+            f.truncate(manifest.offset)
+
+        os.replace(part_path, path)
+        manifest.remove()
+
+        size = self.stats.bytes - fetched_bytes
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Fetched {path.name}: {format_size(size)} in {elapsed:.1f}s "
+            f"({format_size(size / elapsed if elapsed else 0)}/s)"
+        )
+
+    async def _fetch_in_order(
+        self,
+        f,
+        segments: List[Segment],
+        manifest: SegmentManifest,
+        on_bytes: Optional[Callable[[int], None]],
+        cancel: Optional[threading.Event]
+    ):
+        """Fetch up to `concurrency` segments ahead and write them in order"""
+        pending: Dict[int, asyncio.Task] = {}
+        next_fetch = next_write = len(manifest.sizes)
+        try:
+            while next_write < len(segments):
+                while next_fetch < len(segments) and next_fetch < next_write + self.concurrency:
+                    pending[next_fetch] = asyncio.create_task(self._fetch_segment(*segments[next_fetch]))
+                    next_fetch += 1
+
+                data = await pending.pop(next_write)
+                if cancel and cancel.is_set():
+                    raise DownloadError("Download cancelled")
+                f.seek(manifest.offset)
+                f.write(data)
+                f.flush()
+                manifest.record(len(data))
+                if on_bytes:
+                    on_bytes(len(data))
+                next_write += 1
+        finally:
+            for task in pending.values():
+                task.cancel()
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+
+    @staticmethod
+    def _stream_size(segments: List[Segment]) -> Optional[int]:
+        """Size of the stream if every segment is a known byte range"""
+        if not all(byterange for _, byterange in segments):
+            return None
+        return sum(byterange[1] for _, byterange in segments)
+
+    @staticmethod
+    def _preallocate(f, size: int):
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass  # Not supported by the filesystem
+        if os.fstat(f.fileno()).st_size < size:
+            f.truncate(size)
+
+_fetcher: Optional[SegmentFetcher] = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher() -> SegmentFetcher:
+    """Get this process's fetcher, starting it on first use"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = SegmentFetcher()
+            atexit.register(_fetcher.close)
+        return _fetcher
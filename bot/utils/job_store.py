@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+class JobStore:
+    """Durable download job queue shared by the bot and worker processes
+
+    The bot enqueues jobs; workers claim them with a lease that they renew
+    while the job runs. A job whose lease ran out (its worker died) is
+    claimed again, up to JOB_MAX_ATTEMPTS times. Workers report each
+    finished track as a row in `job_files`, which the bot streams from.
+    Every process opens its own connection; SQLite's WAL mode and
+    BEGIN IMMEDIATE transactions keep concurrent claims consistent.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self._executor.submit(self._init_db).result()
+
+    def _init_db(self):
+        """Open the connection and initialize the queue tables"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                url TEXT,
+                quality TEXT,
+                output_path TEXT,
+                status TEXT,
+                worker_id TEXT,
+                lease_until REAL,
+                attempts INTEGER DEFAULT 0,
+                total_tracks INTEGER,
+                fetched_bytes INTEGER DEFAULT 0,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT,
+                position INTEGER,
+                path TEXT,
+                size INTEGER,
+                PRIMARY KEY (job_id, position)
+            );
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'fetched_bytes' not in columns:
+            # Queues created before workers reported fetched bytes
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN fetched_bytes INTEGER DEFAULT 0')
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        """Run a blocking query on the queue thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def close(self):
+        """Close the connection and stop the queue thread"""
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
+
+    # Bot side
+
+    async def enqueue(self, url: str, quality: str, output_path: Path) -> str:
+        """Add a job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await self._run(
+            self._conn.execute,
+            '''INSERT INTO jobs (job_id, url, quality, output_path, status, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'queued', ?, ?)''',
+            (job_id, url, quality, str(output_path), now, now)
+        )
+        return job_id
+
+    def _get_job(self, job_id: str) -> Optional[Dict]:
+        cursor = self._conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job's current state"""
+        return await self._run(self._get_job, job_id)
+
+    async def get_files(self, job_id: str, start: int = 0) -> List[Tuple[int, Path, int]]:
+        """Get (position, path, size) of reported tracks from `start` on"""
+        rows = await self._run(
+            lambda: self._conn.execute(
+                '''SELECT position, path, size FROM job_files
+                   WHERE job_id = ? AND position >= ? ORDER BY position''',
+                (job_id, start)
+            ).fetchall()
+        )
+        return [(position, Path(path), size) for position, path, size in rows]
+
+    async def cancel(self, job_id: str):
+        """Cancel a job; its worker notices at the next lease renewal"""
+        await self._run(
+            self._conn.execute,
+            '''UPDATE jobs SET status = 'cancelled', updated_at = ?
+               WHERE job_id = ? AND status IN ('queued', 'running')''',
+            (time.time(), job_id)
+        )
+
+    async def delete(self, job_id: str):
+        """Forget a job once the bot is done with it"""
+        def delete():
+            with self._transaction():
+                self._conn.execute('DELETE FROM job_files WHERE job_id = ?', (job_id,))
+                self._conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+        await self._run(delete)
+
+    # Worker side
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn)
+
+    def _claim(self, worker_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._transaction():
+            # Jobs whose lease ran out too often are given up on
+            self._conn.execute(
+                '''UPDATE jobs SET status = 'failed', error = 'Worker lease expired', updated_at = ?
+                   WHERE status = 'running' AND lease_until < ? AND attempts >= ?''',
+                (now, now, self.max_attempts)
+            )
+            row = self._conn.execute(
+                '''SELECT job_id FROM jobs
+                   WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                   ORDER BY created_at LIMIT 1''',
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                '''UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?,
+                   attempts = attempts + 1, updated_at = ? WHERE job_id = ?''',
+                (worker_id, now + self.lease_seconds, now, row[0])
+            )
+        return self._get_job(row[0])
+
+    async def claim(self, worker_id: str) -> Optional[Dict]:
+        """Lease the oldest runnable job, or return None"""
+        return await self._run(self._claim, worker_id)
+
+    async def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease; False means the job was cancelled or taken over"""
+        cursor = await self._run(
+            self._conn.execute,
+            '''UPDATE jobs SET lease_until = ?, updated_at = ?
+               WHERE job_id = ? AND worker_id = ? AND status = 'running' ''',
+            (time.time() + self.lease_seconds, time.time(), job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    async def set_total(self, job_id: str, total_tracks: int):
+        """Report how many tracks the job will produce"""
+        await self._run(
+            self._conn.execute,
+            'UPDATE jobs SET total_tracks = ?, updated_at = ? WHERE job_id = ?',
+            (total_tracks, time.time(), job_id)
+        )
+
+    async def set_fetched(self, job_id: str, worker_id: str, fetched_bytes: int):
+        """Report how many stream bytes the job has fetched so far"""
+        await self._run(
+            self._conn.execute,
+            '''UPDATE jobs SET fetched_bytes = ?, updated_at = ?
+               WHERE job_id = ? AND worker_id = ? AND status = 'running' ''',
+            (fetched_bytes, time.time(), job_id, worker_id)
+        )
+
+    async def add_file(self, job_id: str, position: int, path: Path, size: int):
+        """Report a finished track"""
+        await self._run(
+            self._conn.execute,
+            'INSERT OR REPLACE INTO job_files (job_id, position, path, size) VALUES (?, ?, ?, ?)',
+            (job_id, position, str(path), size)
+        )
+
+    async def finish(self, job_id: str, worker_id: str, error: Optional[str] = None):
+        """Mark a job completed, or failed with `error`"""
+        await self._run(
+            self._conn.execute,
+            '''UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ?
+               WHERE job_id = ? AND worker_id = ? AND status = 'running' ''',
+            ('failed' if error else 'completed', error, time.time(), job_id, worker_id)
+        )
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit connection"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -1,18 +1,128 @@
+import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from telegram import Bot
 from telegram.error import TelegramError
 
-from ...config.config import LOG_CHANNEL
+from config.config import (
+    LOG_DIGEST_ENABLED,
+    LOG_DIGEST_INTERVAL,
+    LOG_DIGEST_MAX_EVENTS,
+    LOG_DIGEST_MAX_MESSAGES,
+    MAX_MESSAGE_LENGTH
+)
+from .rate_limiter import PRIORITY_LOG
 
 logger = logging.getLogger(__name__)
 
 class LogChannelHandler:
-    def __init__(self, bot: Bot, log_channel_id: int):
+    """Posts activity to the log channel at the lowest send priority
+
+    In digest mode events are collected as one-line entries and sent
+    together every LOG_DIGEST_INTERVAL seconds or LOG_DIGEST_MAX_EVENTS
+    events, split at MAX_MESSAGE_LENGTH. A digest that would need more
+    than LOG_DIGEST_MAX_MESSAGES messages is attached as a text file
+    instead. Failed downloads flush the digest right away.
+
+    `bot` must be the application's ExtBot so that rate_limit_args reach
+    the TelegramRateLimiter.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        log_channel_id: int,
+        digest: bool = LOG_DIGEST_ENABLED,
+        digest_interval: int = LOG_DIGEST_INTERVAL,
+        digest_max_events: int = LOG_DIGEST_MAX_EVENTS
+    ):
         self.bot = bot
         self.log_channel_id = log_channel_id
+        self.digest = digest
+        self.digest_interval = digest_interval
+        self.digest_max_events = digest_max_events
+
+        self._events: List[str] = []
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the periodic digest flush"""
+        self._flush_lock = asyncio.Lock()
+        if self.digest:
+            self._flush_task = asyncio.create_task(self._periodic_flush())
+
+    async def stop(self):
+        """Stop the periodic flush and send what is buffered"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.digest_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush log digest: {e}")
+
+    async def _add_event(self, line: str, urgent: bool = False):
+        self._events.append(f"{datetime.utcnow().strftime('%H:%M:%S')} {line}")
+        if urgent or len(self._events) >= self.digest_max_events:
+            await self.flush()
+
+    async def flush(self):
+        """Send all buffered events as one digest"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._events:
+                return
+            events, self._events = self._events, []
+
+            header = (
+                f"🧾 Log Digest ({len(events)} events, "
+                f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')})\n\n"
+            )
+            chunks = self._split(header, events)
+
+            try:
+                if len(chunks) > LOG_DIGEST_MAX_MESSAGES:
+                    await self.bot.send_document(
+                        chat_id=self.log_channel_id,
+                        document="\n".join(events).encode(),
+                        filename=f"digest-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.txt",
+                        caption=header.strip(),
+                        rate_limit_args=PRIORITY_LOG
+                    )
+                else:
+                    for chunk in chunks:
+                        await self.bot.send_message(
+                            chat_id=self.log_channel_id,
+                            text=chunk,
+                            rate_limit_args=PRIORITY_LOG
+                        )
+            except TelegramError as e:
+                logger.error(f"Failed to send log digest: {e}")
+
+    @staticmethod
+    def _split(header: str, events: List[str]) -> List[str]:
+        """Pack event lines into messages no longer than MAX_MESSAGE_LENGTH"""
+        chunks = []
+        current = header
+        for line in events:
+            line = line[:MAX_MESSAGE_LENGTH - len(header) - 1]
+            if len(current) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+                chunks.append(current)
+                current = header
+            current += line + "\n"
+        chunks.append(current)
+        return chunks
 
     async def log_download(
         self,
@@ -22,8 +132,16 @@ class LogChannelHandler:
         error: Optional[str] = None
     ):
         """Log download activity to the log channel"""
+        if self.digest:
+            icon = "✅" if status == "completed" else "❌"
+            line = f"{icon} {user_id} {content_url}"
+            if error:
+                line += f" ({error})"
+            await self._add_event(line, urgent=status == "failed")
+            return
+
         current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-        
+
         log_message = (
             f"📥 Download Log\n\n"
             f"Time: {current_time}\n"
@@ -31,14 +149,15 @@ class LogChannelHandler:
             f"Content: {content_url}\n"
             f"Status: {status}\n"
         )
-        
+
         if error:
             log_message += f"Error: {error}\n"
-        
+
         try:
             await self.bot.send_message(
                 chat_id=self.log_channel_id,
-                text=log_message
+                text=log_message,
+                rate_limit_args=PRIORITY_LOG
             )
         except TelegramError as e:
             logger.error(f"Failed to send log message: {e}")
@@ -50,8 +169,12 @@ class LogChannelHandler:
         action: str
     ):
         """Log authorization events"""
+        if self.digest:
+            await self._add_event(f"🔐 {admin_id} {action} {target_user_id}")
+            return
+
         current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-        
+
         log_message = (
             f"🔐 Authorization Event\n\n"
             f"Time: {current_time}\n"
@@ -59,11 +182,12 @@ class LogChannelHandler:
             f"Target User: {target_user_id}\n"
             f"Action: {action}\n"
         )
-        
+
         try:
             await self.bot.send_message(
                 chat_id=self.log_channel_id,
-                text=log_message
+                text=log_message,
+                rate_limit_args=PRIORITY_LOG
             )
         except TelegramError as e:
             logger.error(f"Failed to send auth log message: {e}")
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from config.config import (
+    BASE_DIR,
+    LOOP_WATCHDOG_BUDGET,
+    LOOP_WATCHDOG_INTERVAL,
+    LOOP_WATCHDOG_REPORT_INTERVAL,
+    LOOP_WATCHDOG_THRESHOLD
+)
+from .metrics import LOOP_BLOCKS, LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (deadline of the overdue heartbeat, stack, name of the running task)
+Capture = Tuple[float, traceback.StackSummary, Optional[str]]
+
+def _task_name(task: Optional[asyncio.Task]) -> Optional[str]:
+    if task is None:
+        return None
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+def _trim_loop_frames(stack: traceback.StackSummary) -> traceback.StackSummary:
+    """Drop the event loop's own frames above the callback that is running
+
+    Without a running callback the loop is waiting on its selector, so the
+    stack says nothing about the block and an empty one is returned.
+    """
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index].filename.endswith(("asyncio/events.py", "asyncio\\events.py")):
+            return traceback.StackSummary.from_list(stack[index + 1:])
+    return traceback.StackSummary()
+
+def block_site(stack: traceback.StackSummary) -> str:
+    """Name the innermost frame of our own code in a stack, or the innermost frame"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(str(BASE_DIR)) and "site-packages" not in frame.filename:
+            filename = frame.filename[len(str(BASE_DIR)) + 1:]
+            return f"{filename}:{frame.lineno} in {frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+class LoopWatchdog:
+    """Measures event loop lag and pinpoints what blocks the loop
+
+    A heartbeat task wakes every `interval`; how late it wakes is the loop
+    lag, observed in LOOP_LAG_SECONDS. A monitor thread notices when a
+    heartbeat is overdue, i.e. while the loop is still blocked, and
+    captures the loop thread's stack and running task right then. Once
+    the loop recovers, the block is counted per call site in LOOP_BLOCKS
+    and `sites`, and logged with its stack at most once per
+    `report_interval` per site.
+
+    With a `budget` (strict mode, for benchmarks), blocks longer than it
+    are logged as errors and kept in `violations`.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_WATCHDOG_INTERVAL,
+        threshold: float = LOOP_WATCHDOG_THRESHOLD,
+        report_interval: float = LOOP_WATCHDOG_REPORT_INTERVAL,
+        budget: Optional[float] = LOOP_WATCHDOG_BUDGET
+    ):
+        self.interval = interval
+        # A budget below the threshold lowers it, so no violation goes unseen
+        self.threshold = min(threshold, budget) if budget is not None else threshold
+        self.report_interval = report_interval
+        self.budget = budget
+        self.sites: Dict[str, Dict] = {}  # site: {'count', 'seconds', 'max', 'task', 'stack'}
+        self.violations: List[Dict] = []
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._deadline = 0.0
+        self._capture: Optional[Capture] = None
+        self._reported: Dict[str, Tuple[float, int]] = {}  # site: (last report, count then)
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the heartbeat and the monitor thread"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        """Stop the heartbeat and the monitor thread"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread:
+            self._stopped.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            deadline = time.monotonic() + self.interval
+            self._deadline = deadline
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - deadline)
+            LOOP_LAG_SECONDS.observe(lag)
+
+            capture, self._capture = self._capture, None
+            if lag >= self.threshold:
+                if capture is not None and capture[0] != deadline:
+                    capture = None  # Taken during an earlier heartbeat
+                self._record(lag, capture)
+
+    def _monitor(self):
+        # Sample from half the threshold on, keeping the latest stack, so
+        # even a block that ends just past the threshold has one
+        poll = min(self.interval, self.threshold) / 4
+        while not self._stopped.wait(poll):
+            deadline = self._deadline
+            if time.monotonic() - deadline >= self.threshold / 2:
+                capture = self._snapshot(deadline)
+                previous = self._capture
+                # Once the callback returns, don't lose its stack to an idle one
+                if capture and (capture[1] or not previous or previous[0] != deadline):
+                    self._capture = capture
+
+    def _snapshot(self, deadline: float) -> Optional[Capture]:
+        """Capture what the loop thread is running (called from the monitor thread)"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = _trim_loop_frames(traceback.extract_stack(frame))
+        try:
+            task = _task_name(asyncio.current_task(self._loop))
+        except RuntimeError:
+            task = None
+        return deadline, stack, task
+
+    def _record(self, lag: float, capture: Optional[Capture]):
+        stack = capture[1] if capture else traceback.StackSummary()
+        task = capture[2] if capture else None
+        site = block_site(stack)
+        LOOP_BLOCKS.inc(site=site)
+
+        stats = self.sites.setdefault(
+            site, {'count': 0, 'seconds': 0.0, 'max': 0.0, 'task': None, 'stack': []}
+        )
+        stats['count'] += 1
+        stats['seconds'] += lag
+        if lag > stats['max']:
+            stats.update(max=lag, task=task, stack=traceback.format_list(stack))
+
+        formatted = "".join(traceback.format_list(stack)) or "  (no callback caught running; it ended first, or another thread held the GIL)\n"
+        if self.budget is not None and lag > self.budget:
+            self.violations.append({'site': site, 'seconds': lag, 'task': task, 'stack': formatted})
+            logger.error(
+                f"Event loop blocked for {lag:.3f}s (budget {self.budget:.3f}s) at {site}, "
+                f"task {task}:\n{formatted}"
+            )
+            return
+
+        now = time.monotonic()
+        last_report, count_then = self._reported.get(site, (None, 0))
+        if last_report is not None and now - last_report < self.report_interval:
+            return
+        repeats = stats['count'] - count_then - 1
+        self._reported[site] = (now, stats['count'])
+        logger.warning(
+            f"Event loop blocked for {lag:.3f}s at {site}, task {task}"
+            f"{f' ({repeats} more since the last report)' if repeats else ''}:\n{formatted}"
+        )
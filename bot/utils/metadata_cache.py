@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.config import (
+    METADATA_CACHE_PATH,
+    METADATA_CACHE_SIZE,
+    METADATA_DEFAULT_TTL,
+    METADATA_TTLS
+)
+from .apple_music import parse_url
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class MetadataCache:
+    """Catalog lookups cached in memory and on disk
+
+    Entries are keyed by storefront and catalog ID and expire after the TTL
+    of their type (METADATA_TTLS). The in-memory layer is an LRU of at most
+    METADATA_CACHE_SIZE entries; the SQLite layer at METADATA_CACHE_PATH
+    survives restarts and is shared with worker processes. Concurrent
+    misses for one key wait on a single lookup.
+    """
+
+    def __init__(
+        self,
+        path: Path = METADATA_CACHE_PATH,
+        max_entries: int = METADATA_CACHE_SIZE,
+        ttls: Dict[str, int] = METADATA_TTLS,
+        default_ttl: int = METADATA_DEFAULT_TTL
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lookups: Dict[str, asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata")
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self._executor.submit(self._init_db).result()
+
+    def _init_db(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS metadata (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL,
+                    value BLOB
+                )
+            ''')
+            self._conn.execute('DELETE FROM metadata WHERE expires_at < ?', (time.time(),))
+
+    async def _run(self, func: Callable, *args):
+        """Run a blocking query on the metadata thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    @staticmethod
+    def key_for(url: str) -> Optional[Tuple[str, str]]:
+        """Return (cache key, entity type) for a URL, or None if it is not cacheable"""
+        info = parse_url(url)
+        if not info:
+            return None
+        return f"{info['storefront']}:{info['type']}:{info['id']}", info['type']
+
+    def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        row = self._conn.execute(
+            'SELECT expires_at, value FROM metadata WHERE key = ? AND expires_at >= ?',
+            (key, time.time())
+        ).fetchone()
+        return (row[0], pickle.loads(row[1])) if row else None
+
+    def _write(self, key: str, expires_at: float, value: Any):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO metadata (key, expires_at, value) VALUES (?, ?, ?)',
+                (key, expires_at, pickle.dumps(value))
+            )
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, url: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for `url`, calling `fetch` on a miss"""
+        cache_key = self.key_for(url)
+        if cache_key is None:
+            return await fetch()
+        key, entity_type = cache_key
+
+        cached = self._memory.get(key)
+        if cached is not None and cached[0] >= time.time():
+            self._memory.move_to_end(key)
+            self._count(hit=True)
+            return cached[1]
+
+        lookup = self._lookups.get(key)
+        if lookup is not None:
+            self._count(hit=True)
+            return await asyncio.shield(lookup)
+
+        lookup = asyncio.get_running_loop().create_future()
+        self._lookups[key] = lookup
+        try:
+            stored = await self._run(self._read, key)
+            if stored is not None:
+                self._count(hit=True)
+                expires_at, value = stored
+            else:
+                self._count(hit=False)
+                value = await fetch()
+                expires_at = time.time() + self.ttls.get(entity_type, self.default_ttl)
+                await self._run(self._write, key, expires_at, value)
+            self._remember(key, expires_at, value)
+            lookup.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            lookup.cancel()
+            raise
+        except Exception as e:
+            lookup.set_exception(e)
+            # Waiters get the error; don't warn if nobody retrieved it
+            lookup.exception()
+            raise
+        finally:
+            del self._lookups[key]
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache='metadata', result='hit' if hit else 'miss')
+
+    def close(self):
+        """Close the disk layer"""
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
+
+class CachedDownloader:
+    """Puts a MetadataCache in front of a Downloader's (or DownloaderPool's) lookups"""
+
+    def __init__(self, downloader: Any, cache: MetadataCache):
+        self.downloader = downloader
+        self.cache = cache
+        # Downloads are not cached; keep the wrapped method (sync or async) as is
+        self.download_track = downloader.download_track
+
+    async def get_tracks(self, url: str) -> List:
+        """Resolve a URL to its tracks through the cache"""
+        async def fetch():
+            if asyncio.iscoroutinefunction(self.downloader.get_tracks):
+                return await self.downloader.get_tracks(url)
+            return await asyncio.to_thread(self.downloader.get_tracks, url)
+
+        return await self.cache.get(url, fetch)
+
+    async def prefetch(self, url: str):
+        """Warm the cache for a URL, e.g. while the user picks download options"""
+        try:
+            await self.get_tracks(url)
+        except Exception as e:
+            logger.debug(f"Metadata prefetch for {url} failed: {e}")
+
+    def close(self):
+        self.cache.close()
+        if hasattr(self.downloader, 'close'):
+            self.downloader.close()
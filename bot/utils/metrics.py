@@ -0,0 +1,239 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Value for one label set, or the sum over all when none are given"""
+        with self._lock:
+            if labels:
+                return self._values.get(self._key(labels), 0)
+            return sum(self._values.values())
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {value}"
+                for key, value in sorted(self._values.items())
+            ]
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a function when rendered"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {self._function()}"]
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {value}"
+                for key, value in sorted(self._values.items())
+            ]
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, List] = {}  # key: [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the block"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def summary(self, **labels) -> Tuple[int, float]:
+        """(count, sum) for one label set"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[-1], state[-2]) if state else (0, 0.0)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    le = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets=buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+QUEUE_DEPTH = REGISTRY.gauge("gamdl_queue_depth", "Jobs waiting for a download slot")
+ACTIVE_DOWNLOADS = REGISTRY.gauge("gamdl_active_downloads", "Jobs holding a download slot")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "gamdl_queue_wait_seconds", "Time jobs waited for a download slot"
+)
+JOBS = REGISTRY.counter("gamdl_jobs_total", "Finished download jobs", ["status"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "gamdl_stage_seconds",
+    "Duration of pipeline stages (download includes decryption, remuxing and tagging)",
+    ["stage"]
+)
+BYTES_IN = REGISTRY.counter("gamdl_bytes_in_total", "Bytes of finished tracks downloaded")
+BYTES_OUT = REGISTRY.counter("gamdl_bytes_out_total", "Bytes uploaded to Telegram")
+CACHE_REQUESTS = REGISTRY.counter(
+    "gamdl_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"]
+)
+TELEGRAM_ERRORS = REGISTRY.counter(
+    "gamdl_telegram_errors_total", "Failed Bot API calls by error", ["error"]
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "gamdl_loop_lag_seconds",
+    "How late the event loop ran the watchdog's heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+LOOP_BLOCKS = REGISTRY.counter(
+    "gamdl_loop_blocks_total", "Event loop blocks over the watchdog threshold by call site", ["site"]
+)
+
+def hit_ratio(cache: str) -> Optional[float]:
+    """Share of hits among lookups of a cache, or None before the first lookup"""
+    hits = CACHE_REQUESTS.value(cache=cache, result="hit")
+    total = hits + CACHE_REQUESTS.value(cache=cache, result="miss")
+    return hits / total if total else None
+
+class MetricsServer:
+    """Serves REGISTRY at /metrics for Prometheus to scrape"""
+
+    def __init__(self, listen: str, port: int, registry: MetricsRegistry = REGISTRY):
+        self.listen = listen
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Metrics available at http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain")
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from config.config import JOB_POLL_INTERVAL, PIPELINE_WINDOW
+from .error_handler import DownloadError
+from .job_store import JobStore
+from .metrics import BYTES_IN
+from .profiling import JobSpans
+from .progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+async def _call(func, *args, **kwargs):
+    """Await a DownloaderPool method, or run a blocking Downloader one in a thread"""
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+async def stream_tracks(
+    downloader,
+    url: str,
+    output_path: Path,
+    quality: str,
+    window: int = PIPELINE_WINDOW,
+    progress: Optional[ProgressReporter] = None,
+    spans: Optional[JobSpans] = None
+) -> AsyncIterator[Tuple[int, Path]]:
+    """Yield (index, path) for each track as soon as gamdl finishes it
+
+    Tracks are downloaded in a background task that runs at most `window`
+    tracks ahead of the consumer, so a slow upload applies backpressure
+    instead of letting the whole release pile up on disk.
+    """
+    spans = spans or JobSpans()
+    with spans.span('resolve'):
+        tracks = await _call(downloader.get_tracks, url)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=window)
+    loop = asyncio.get_running_loop()
+
+    def report_fetched(size: int):
+        # Called on the SegmentFetcher's thread, or on this loop for the DownloaderPool
+        loop.call_soon_threadsafe(progress.add_fetched, size)
+
+    if progress:
+        progress.set_items(len(tracks))
+    on_bytes = report_fetched if progress else None
+
+    async def download(track) -> Tuple[Path, int]:
+        with spans.span('download'):
+            path = Path(await _call(
+                downloader.download_track, track, output_path, quality, on_bytes=on_bytes
+            ))
+        size = (await asyncio.to_thread(path.stat)).st_size
+        spans.add_bytes('download', size)
+        BYTES_IN.inc(size)
+        return path, size
+
+    async def produce():
+        try:
+            for index, track in enumerate(tracks):
+                path, size = await download(track)
+                if progress:
+                    progress.item_ready(size)
+                await queue.put((index, path))
+            await queue.put(_DONE)
+        except Exception as e:
+            # Hand the failure to the consumer instead of losing it in the task
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+async def stream_remote_tracks(
+    job_store: JobStore,
+    url: str,
+    output_path: Path,
+    quality: str,
+    progress: Optional[ProgressReporter] = None,
+    poll_interval: float = JOB_POLL_INTERVAL,
+    spans: Optional[JobSpans] = None
+) -> AsyncIterator[Tuple[int, Path]]:
+    """Yield (index, path) for each track a worker process reports
+
+    The job is put in the shared JobStore and polled until a worker
+    finishes it. Leaving the iterator early cancels the job. The worker's
+    time isn't visible here, so `spans` only gets the downloaded bytes.
+    """
+    spans = spans or JobSpans()
+    job_id = await job_store.enqueue(url, quality, output_path)
+    position = 0
+    fetched_bytes = 0
+    finished = False
+    try:
+        while True:
+            # Read the status first: once it is final, every file is reported
+            job = await job_store.get_job(job_id)
+            if progress and job['total_tracks'] is not None and progress.total_items is None:
+                progress.set_items(job['total_tracks'])
+            if progress and job['fetched_bytes'] > fetched_bytes:
+                progress.add_fetched(job['fetched_bytes'] - fetched_bytes)
+                fetched_bytes = job['fetched_bytes']
+
+            for index, path, size in await job_store.get_files(job_id, position):
+                spans.add_bytes('download', size)
+                BYTES_IN.inc(size)
+                if progress:
+                    progress.item_ready(size)
+                position = index + 1
+                yield index, path
+
+            if job['status'] == 'completed':
+                finished = True
+                return
+            if job['status'] in ('failed', 'cancelled'):
+                finished = True
+                raise DownloadError(job['error'] or f"Download {job['status']}")
+            await asyncio.sleep(poll_interval)
+    finally:
+        if not finished:
+            await job_store.cancel(job_id)
+        await job_store.delete(job_id)
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from config.config import (
+    DOWNLOAD_PROCESSES,
+    DOWNLOAD_PROCESS_MAX_TASKS,
+    JOB_POLL_INTERVAL,
+    METADATA_TIMEOUT,
+    TRACK_TIMEOUT
+)
+from .error_handler import DownloadError
+
+logger = logging.getLogger(__name__)
+
+# The Downloader of the current pool process and its slot's fetched-bytes
+# counter, set once by _init_process
+_downloader = None
+_fetched = None
+
+def _init_process(fetched):
+    global _downloader, _fetched
+    from .downloader import GamdlDownloader
+    _downloader = GamdlDownloader()
+    _fetched = fetched
+
+def _add_fetched(size: int):
+    # Only the fetcher thread writes, and the bot only reads
+    _fetched.value += size
+
+def _get_tracks(url: str) -> List:
+    return _downloader.get_tracks(url)
+
+def _download_track(track: Any, output_path: Path, quality: str) -> Path:
+    return Path(_downloader.download_track(track, output_path, quality, on_bytes=_add_fetched))
+
+class _Slot:
+    """A single-process executor, the pid of its process and its fetched-bytes counter"""
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.fetched = context.RawValue('q', 0)
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=context,
+            initializer=_init_process,
+            initargs=(self.fetched,)
+        )
+        self.pid: Optional[int] = None
+        self.tasks = 0
+
+class DownloaderPool:
+    """Runs gamdl in worker processes that each keep a warm Downloader
+
+    Download, decryption, remuxing and tagging all happen inside
+    `download_track`, so each call runs in a pool process instead of a
+    thread of the bot's process. Every process is a slot with its own
+    single-process executor, and a call holds its slot until it returns.
+    A call that runs past its timeout kills only its own process, and the
+    slot gets a fresh executor. Python 3.9 has no max_tasks_per_child, so
+    a slot is also replaced after DOWNLOAD_PROCESS_MAX_TASKS calls.
+
+    A slot's process counts the stream bytes it writes in shared memory,
+    and `download_track` passes the growth of that count to `on_bytes`
+    every `poll_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        processes: int = DOWNLOAD_PROCESSES,
+        max_tasks: int = DOWNLOAD_PROCESS_MAX_TASKS,
+        metadata_timeout: float = METADATA_TIMEOUT,
+        track_timeout: float = TRACK_TIMEOUT,
+        poll_interval: float = JOB_POLL_INTERVAL
+    ):
+        self.processes = processes
+        self.max_tasks = max_tasks
+        self.metadata_timeout = metadata_timeout
+        self.track_timeout = track_timeout
+        self.poll_interval = poll_interval
+        self._slots = [_Slot() for _ in range(processes)]
+        self._free: Optional[asyncio.Queue] = None
+
+    def _replace(self, slot: _Slot) -> _Slot:
+        """Give the slot's place a fresh executor and let the old one wind down"""
+        fresh = _Slot()
+        self._slots[self._slots.index(slot)] = fresh
+        slot.executor.shutdown(wait=False)
+        return fresh
+
+    @staticmethod
+    def _kill(slot: _Slot):
+        if slot.pid is None:
+            return
+        try:
+            os.kill(slot.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    async def _watch_fetched(self, slot: _Slot, on_bytes: Callable[[int], None]):
+        reported = 0
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                fetched = slot.fetched.value
+                if fetched > reported:
+                    on_bytes(fetched - reported)
+                    reported = fetched
+        finally:
+            if slot.fetched.value > reported:
+                on_bytes(slot.fetched.value - reported)
+
+    async def _call(
+        self,
+        timeout: float,
+        func: Callable,
+        *args,
+        on_bytes: Optional[Callable[[int], None]] = None
+    ) -> Any:
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for slot in self._slots:
+                self._free.put_nowait(slot)
+
+        slot = await self._free.get()
+        try:
+            slot.tasks += 1
+            try:
+                if slot.pid is None:
+                    # Starts the process; its pid is what a timeout has to kill
+                    slot.pid = await asyncio.wrap_future(slot.executor.submit(os.getpid))
+                slot.fetched.value = 0
+                future: Future = slot.executor.submit(func, *args)
+                watcher = asyncio.create_task(self._watch_fetched(slot, on_bytes)) if on_bytes else None
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+                finally:
+                    if watcher:
+                        watcher.cancel()
+                        await asyncio.gather(watcher, return_exceptions=True)
+            except asyncio.TimeoutError:
+                logger.error(f"{func.__name__} timed out after {timeout}s, restarting its download process")
+                self._kill(slot)
+                slot = self._replace(slot)
+                raise DownloadError(f"Download step timed out after {timeout:.0f}s")
+            except asyncio.CancelledError:
+                # The process is still busy with the call, so the next one can't have it
+                logger.warning(f"{func.__name__} was cancelled, restarting its download process")
+                self._kill(slot)
+                slot = self._replace(slot)
+                raise
+            except BrokenProcessPool:
+                logger.error(f"Download process died during {func.__name__}, restarting it")
+                slot = self._replace(slot)
+                raise DownloadError("Download process died")
+        finally:
+            if slot.tasks >= self.max_tasks:
+                logger.info("Recycling a download process")
+                slot = self._replace(slot)
+            self._free.put_nowait(slot)
+
+    async def get_tracks(self, url: str) -> List:
+        """Resolve a URL to its tracks"""
+        return await self._call(self.metadata_timeout, _get_tracks, url)
+
+    async def download_track(
+        self,
+        track: Any,
+        output_path: Path,
+        quality: str,
+        on_bytes: Optional[Callable[[int], None]] = None
+    ) -> Path:
+        """Download, decrypt, remux and tag one track"""
+        return await self._call(
+            self.track_timeout, _download_track, track, output_path, quality, on_bytes=on_bytes
+        )
+
+    def close(self):
+        """Stop the processes, dropping calls that have not started"""
+        for slot in self._slots:
+            slot.executor.shutdown(wait=False, cancel_futures=True)
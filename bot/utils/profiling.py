@@ -0,0 +1,53 @@
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from .metrics import STAGE_SECONDS
+
+# Pipeline stages in the order a job passes through them
+STAGES = ('resolve', 'download', 'zip', 'upload')
+
+class JobSpans:
+    """Per-job time and bytes spent in each pipeline stage
+
+    Stages overlap (tracks upload while later ones download), so each
+    stage's time is the sum of its spans, not a slice of the job's wall
+    time. Every span is also observed in the STAGE_SECONDS histogram.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.bytes: Dict[str, int] = {}
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the block as part of `stage`"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+
+    def add_bytes(self, stage: str, size: int):
+        self.bytes[stage] = self.bytes.get(stage, 0) + size
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        """{stage: {'seconds': ..., 'bytes': ...}} for storage"""
+        return {
+            stage: {
+                'seconds': round(self.seconds.get(stage, 0.0), 3),
+                'bytes': self.bytes.get(stage, 0)
+            }
+            for stage in sorted(set(self.seconds) | set(self.bytes))
+        }
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`, or None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
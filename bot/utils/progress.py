@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import TelegramError
+
+from config.config import PROGRESS_EDIT_BUDGET, PROGRESS_UPDATE_INTERVAL
+from .formatter import format_duration, format_progress, format_size
+
+logger = logging.getLogger(__name__)
+
+class ProgressReporter:
+    """Streams a job's progress into its status message
+
+    Stages report counters (items ready, bytes fetched, items and bytes
+    sent) and a background task renders them with `format_progress` at most
+    once per PROGRESS_UPDATE_INTERVAL. Edits whose text did not change are
+    skipped, and a job never spends more than PROGRESS_EDIT_BUDGET edits:
+    the interval stretches so the budget lasts until the estimated end.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        interval: float = PROGRESS_UPDATE_INTERVAL,
+        max_edits: int = PROGRESS_EDIT_BUDGET
+    ):
+        self.message = message
+        self.interval = interval
+        self.max_edits = max_edits
+
+        self.total_items: Optional[int] = None
+        self.ready_items = 0
+        self.ready_bytes = 0
+        self.fetched_bytes = 0
+        self.sent_items = 0
+        self.sent_bytes = 0
+
+        self.edits = 0
+        self._started = time.monotonic()
+        self._last_text: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def set_items(self, total: int):
+        """Set how many files the job will deliver"""
+        self.total_items = total
+
+    def item_ready(self, size: int):
+        """A file finished downloading (or was found in the cache)"""
+        self.ready_items += 1
+        self.ready_bytes += size
+
+    def add_fetched(self, size: int):
+        """Raw bytes arrived from the network"""
+        self.fetched_bytes += size
+
+    def item_sent(self, size: int, items: int = 1):
+        """Files were delivered to the user (a ZIP part carries several)"""
+        self.sent_items += items
+        self.sent_bytes += size
+
+    def start(self):
+        """Start rendering in the background"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop rendering; the caller writes the final status itself"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _estimated_total_bytes(self) -> Optional[int]:
+        if not self.total_items or not self.ready_items:
+            return None
+        average = self.ready_bytes / self.ready_items
+        return int(self.ready_bytes + average * max(self.total_items - self.ready_items, 0))
+
+    def _eta(self, elapsed: float, fraction: float) -> Optional[float]:
+        if fraction <= 0:
+            return None
+        return elapsed * (1 - fraction) / fraction
+
+    def render(self) -> Optional[str]:
+        """Render the current state, or None while nothing is known yet"""
+        elapsed = time.monotonic() - self._started
+        throughput = (self.fetched_bytes + self.sent_bytes) / elapsed if elapsed > 0 else 0
+
+        total_bytes = self._estimated_total_bytes()
+        if total_bytes is None:
+            # No file is finished yet, so there is no size to show progress against
+            if not self.fetched_bytes:
+                return None
+            return (
+                f"📥 Downloading: {format_size(self.fetched_bytes)} fetched, "
+                f"{self.ready_items}/{self.total_items or '?'} done\n"
+                f"⚡ {format_size(throughput)}/s"
+            )
+
+        eta = self._eta(elapsed, self.sent_bytes / total_bytes if total_bytes else 0)
+
+        status = (
+            f"🎵 {self.ready_items}/{self.total_items} downloaded, "
+            f"{self.sent_items}/{self.total_items} sent\n"
+            f"⚡ {format_size(throughput)}/s"
+        )
+        if eta is not None:
+            status += f" · ETA {format_duration(eta)}"
+
+        return format_progress(self.sent_bytes, max(total_bytes, 1), status)
+
+    async def _run(self):
+        while self.edits < self.max_edits - 1:  # Keep one edit for the final status
+            await asyncio.sleep(self._next_interval())
+            text = self.render()
+            if text is None or text == self._last_text:
+                continue
+            try:
+                await self.message.edit_text(text)
+            except TelegramError as e:
+                logger.debug(f"Progress update failed: {e}")
+            self._last_text = text
+            self.edits += 1
+
+    def _next_interval(self) -> float:
+        """Stretch the interval so the remaining edits last until the ETA"""
+        remaining = self.max_edits - 1 - self.edits
+        total_bytes = self._estimated_total_bytes()
+        if not total_bytes or remaining <= 0:
+            return self.interval
+        elapsed = time.monotonic() - self._started
+        eta = self._eta(elapsed, self.sent_bytes / total_bytes)
+        if eta is None:
+            return self.interval
+        return max(self.interval, eta / remaining)
@@ -1,72 +1,380 @@
 import asyncio
+import itertools
 import logging
-from typing import Dict, Optional
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
 from datetime import datetime
 
+from config.config import MAX_DOWNLOADS_PER_USER, QUEUE_USER_WEIGHTS
+from .metrics import ACTIVE_DOWNLOADS, JOBS, QUEUE_DEPTH, QUEUE_WAIT_SECONDS
+
 logger = logging.getLogger(__name__)
 
 class DownloadQueue:
-    def __init__(self, max_concurrent: int = 5):
+    """Fair-share scheduler for download jobs
+
+    Jobs are picked in weighted fair queueing order: every job gets a
+    virtual finish tag of max(virtual clock, user's last tag) + 1 / weight,
+    and the pending job with the smallest tag among users below their
+    concurrency cap runs next. Users get weight 1 unless `user_weights`
+    says otherwise. Admin jobs bypass this in a priority lane.
+
+    Given a DatabaseManager, every state change of a job is written through
+    to the queue_jobs table, together with a checkpoint of the items already
+    delivered, so jobs can be restored after a restart. Requests waiting on
+    an identical job in flight are saved there too, with status 'waiting'.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 5,
+        per_user_limit: int = MAX_DOWNLOADS_PER_USER,
+        admin_users: Iterable[int] = (),
+        user_weights: Optional[Dict[int, float]] = None,
+        db=None
+    ):
         self.max_concurrent = max_concurrent
-        self.current_downloads: Dict[int, Dict] = {}  # user_id: download_info
-        self.queue = asyncio.Queue()
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.per_user_limit = per_user_limit
+        self.admin_users = set(admin_users)
+        self.db = db
+        self.jobs: Dict[str, Dict] = {}  # job_id: download_info
+        self.current_downloads: Dict[str, Dict] = {}  # job_id: download_info
+        self.user_weights: Dict[int, float] = dict(
+            QUEUE_USER_WEIGHTS if user_weights is None else user_weights
+        )
+        self.in_flight: Dict[Hashable, str] = {}  # coalescing key: job_id
+        self.waiters: Dict[str, Dict] = {}  # job_id: waiter record
+
+        self._priority: Deque[str] = deque()
+        self._pending: Dict[int, Deque[str]] = {}  # user_id: queued job IDs
+        self._active_per_user: Dict[int, int] = {}
+        self._last_tag: Dict[int, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._changed: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._avg_duration: Optional[float] = None
+
+        QUEUE_DEPTH.set_function(lambda: len(self.jobs) - len(self.current_downloads))
+        ACTIVE_DOWNLOADS.set_function(lambda: len(self.current_downloads))
+
+    def start(self):
+        """Start the worker tasks"""
+        self._changed = asyncio.Condition()
+        for i in range(self.max_concurrent):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+
+    async def stop(self):
+        """Cancel the worker tasks and the tasks waiting on their jobs"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+        # Their records stay 'waiting', so they are restored after a restart
+        waiters = [waiter['_task'] for waiter in self.waiters.values()]
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    async def add_waiter(
+        self,
+        user_id: int,
+        url: str,
+        quality: str,
+        message_id: int,
+        wait: Callable[[Dict], Awaitable[None]],
+        chat_id: Optional[int] = None,
+        zip_file: bool = False,
+        job_id: Optional[str] = None,
+        checkpoint: Optional[List[Tuple[str, str]]] = None
+    ) -> Dict:
+        """Save a request that waits on an identical job in flight and run `wait` for it
+
+        `wait` gets the waiter record and runs until it returns or stop()
+        cancels it. It ends the record with `finish_waiter`, or hands the
+        request on under the same `job_id` (to the queue or another leader).
+        """
+        waiter = {
+            'job_id': job_id or uuid.uuid4().hex[:12],
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'url': url,
+            'quality': quality,
+            'zip_file': zip_file,
+            'message_id': message_id,
+            'priority': False,
+            'status': 'waiting',
+            'queued_time': datetime.utcnow(),
+            'start_time': None,
+            'finish_time': None,
+            'checkpoint': list(checkpoint or [])
+        }
+        self.waiters[waiter['job_id']] = waiter
+        await self._save(waiter)
+
+        def forget(task: asyncio.Task):
+            # A request handed on to another leader is registered again under its job_id
+            if self.waiters.get(waiter['job_id']) is waiter:
+                del self.waiters[waiter['job_id']]
+
+        waiter['_task'] = asyncio.create_task(wait(waiter))
+        waiter['_task'].add_done_callback(forget)
+        return waiter
+
+    async def finish_waiter(self, waiter: Dict, status: str, error: Optional[str] = None):
+        """Record how a waiter's delivery ended"""
+        waiter['status'] = status
+        waiter['error'] = error
+        waiter['finish_time'] = datetime.utcnow()
+        await self._save(waiter)
 
     async def add_to_queue(
         self,
         user_id: int,
         url: str,
         quality: str,
-        message_id: int
-    ):
-        """Add download request to queue"""
+        message_id: int,
+        run: Callable[[Dict], Awaitable[None]],
+        chat_id: Optional[int] = None,
+        key: Optional[Hashable] = None,
+        zip_file: bool = False,
+        job_id: Optional[str] = None,
+        checkpoint: Optional[List[Tuple[str, str]]] = None,
+        resume: bool = False
+    ) -> Dict:
+        """Add download request to queue and return its job record
+
+        Jobs given a coalescing `key` are registered as in flight until they
+        finish, so identical requests can wait on `done` instead of
+        downloading the same content again. `done` resolves to the final
+        status, or to 'interrupted' when the queue stopped mid-download.
+        Restored jobs pass their `job_id` and `checkpoint`; with `resume`
+        they skip the line.
+        """
+        job_id = job_id or uuid.uuid4().hex[:12]
+        priority = resume or user_id in self.admin_users
+
+        start_tag = max(self._virtual_time, self._last_tag.get(user_id, 0.0))
+        tag = start_tag + 1.0 / self.user_weights.get(user_id, 1.0)
+        if not priority:
+            self._last_tag[user_id] = tag
+
         download_info = {
+            'job_id': job_id,
             'user_id': user_id,
+            'chat_id': chat_id,
             'url': url,
             'quality': quality,
+            'zip_file': zip_file,
             'message_id': message_id,
+            'priority': priority,
             'status': 'queued',
             'progress': 0,
+            'queued_time': datetime.utcnow(),
             'start_time': None,
-            'finish_time': None
+            'finish_time': None,
+            'checkpoint': list(checkpoint or []),
+            'key': key,
+            'done': asyncio.get_running_loop().create_future(),
+            '_start_tag': start_tag,
+            '_tag': tag,
+            '_seq': next(self._sequence),
+            '_run': run,
+            '_task': None
         }
-        
-        await self.queue.put(download_info)
-        return len(self.current_downloads) + self.queue.qsize()
+        self.jobs[job_id] = download_info
+        if key is not None:
+            self.in_flight[key] = job_id
+        await self._save(download_info)
+
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            if priority:
+                self._priority.append(job_id)
+            else:
+                self._pending.setdefault(user_id, deque()).append(job_id)
+            self._changed.notify()
+
+        return download_info
+
+    async def _save(self, download_info: Dict):
+        """Persist a job's state; the in-memory queue stays authoritative"""
+        if self.db is None:
+            return
+        try:
+            await self.db.save_queue_job(download_info)
+        except Exception as e:
+            logger.error(f"Failed to persist job {download_info['job_id']}: {e}")
+
+    async def checkpoint(self, job_id: str, delivered: List[Tuple[str, Any]]):
+        """Record the items delivered so far, so a resumed job skips them"""
+        job = self.jobs.get(job_id) or self.waiters.get(job_id)
+        if job is None:
+            return
+        job['checkpoint'] = list(delivered)
+        await self._save(job)
+
+    def get_position(self, job_id: str) -> int:
+        """Estimate how many jobs will start before this one (0 = next)"""
+        job = self.jobs.get(job_id)
+        if not job or job['status'] != 'queued':
+            return 0
+        if job['priority']:
+            return list(self._priority).index(job_id)
+
+        ahead = len(self._priority)
+        for queue in self._pending.values():
+            for other_id in queue:
+                other = self.jobs[other_id]
+                if (other['_tag'], other['_seq']) < (job['_tag'], job['_seq']):
+                    ahead += 1
+        return ahead
+
+    def get_in_flight(self, key: Hashable) -> Optional[Dict]:
+        """Get the queued or running job registered under a coalescing key"""
+        job_id = self.in_flight.get(key)
+        return self.jobs.get(job_id) if job_id else None
+
+    def _finish(self, download_info: Dict, status: Optional[str] = None):
+        """Retire a job and wake anyone waiting on it with `status` (default: the job's)"""
+        self.jobs.pop(download_info['job_id'], None)
+        if self.in_flight.get(download_info['key']) == download_info['job_id']:
+            del self.in_flight[download_info['key']]
+        if not download_info['done'].done():
+            download_info['done'].set_result(status or download_info['status'])
+
+    def estimate_wait(self, job_id: str) -> Optional[float]:
+        """Estimate seconds until the job starts, from recent job durations"""
+        if self._avg_duration is None:
+            return None
+        position = self.get_position(job_id)
+        busy = len(self.current_downloads) >= self.max_concurrent
+        rounds = position // self.max_concurrent + (1 if busy else 0)
+        return rounds * self._avg_duration
+
+    def _next_job(self) -> Optional[str]:
+        """Pop the next runnable job, honouring priority and per-user caps"""
+        if self._priority:
+            return self._priority.popleft()
+
+        best = None
+        for user_id, queue in self._pending.items():
+            if self._active_per_user.get(user_id, 0) >= self.per_user_limit:
+                continue
+            head = self.jobs[queue[0]]
+            if best is None or (head['_tag'], head['_seq']) < (best['_tag'], best['_seq']):
+                best = head
+        if best is None:
+            return None
+
+        queue = self._pending[best['user_id']]
+        queue.popleft()
+        if not queue:
+            del self._pending[best['user_id']]
+        self._virtual_time = max(self._virtual_time, best['_start_tag'])
+        return best['job_id']
+
+    async def _worker(self, worker_id: int):
+        while True:
+            async with self._changed:
+                job_id = None
+                while job_id is None:
+                    job_id = self._next_job()
+                    if job_id is None:
+                        await self._changed.wait()
+                user_id = self.jobs[job_id]['user_id']
+                self._active_per_user[user_id] = self._active_per_user.get(user_id, 0) + 1
 
-    async def start_download(self, download_info: Dict):
-        """Start a download"""
-        async with self.semaphore:
-            user_id = download_info['user_id']
-            download_info['status'] = 'downloading'
-            download_info['start_time'] = datetime.utcnow()
-            self.current_downloads[user_id] = download_info
-            
             try:
-                # Actual download logic here
-                await self._process_download(download_info)
-                
-                download_info['status'] = 'completed'
-            except Exception as e:
-                download_info['status'] = 'failed'
-                download_info['error'] = str(e)
-                logger.error(f"Download failed for user {user_id}: {e}")
+                await self.start_download(self.jobs[job_id])
             finally:
-                download_info['finish_time'] = datetime.utcnow()
-                del self.current_downloads[user_id]
+                async with self._changed:
+                    self._active_per_user[user_id] -= 1
+                    if not self._active_per_user[user_id]:
+                        del self._active_per_user[user_id]
+                    # A slot for this user opened up
+                    self._changed.notify_all()
+
+    async def start_download(self, download_info: Dict):
+        """Start a download"""
+        job_id = download_info['job_id']
+        user_id = download_info['user_id']
+        download_info['status'] = 'downloading'
+        download_info['start_time'] = datetime.utcnow()
+        QUEUE_WAIT_SECONDS.observe(
+            (download_info['start_time'] - download_info['queued_time']).total_seconds()
+        )
+        download_info['_task'] = asyncio.current_task()
+        self.current_downloads[job_id] = download_info
+        interrupted = False
+
+        try:
+            await self._save(download_info)
+            await self._process_download(download_info)
+
+            download_info['status'] = 'completed'
+        except asyncio.CancelledError:
+            # Only a cancelled job is swallowed; a stopping worker must exit,
+            # leaving the job persisted as running so it resumes on restart
+            if not download_info.get('cancel_requested'):
+                interrupted = True
+                raise
+            download_info['status'] = 'cancelled'
+        except Exception as e:
+            download_info['status'] = 'failed'
+            download_info['error'] = str(e)
+            logger.error(f"Download {job_id} failed for user {user_id}: {e}")
+        finally:
+            download_info['finish_time'] = datetime.utcnow()
+            download_info['_task'] = None
+            del self.current_downloads[job_id]
+            # An interrupted job stays 'downloading' so it resumes after a restart
+            self._finish(download_info, 'interrupted' if interrupted else None)
+            self._record_duration(download_info)
+            if not interrupted:
+                JOBS.inc(status=download_info['status'])
+                await self._save(download_info)
 
     async def _process_download(self, download_info: Dict):
         """Process the actual download"""
-        # Implement the actual download logic here
-        pass
+        await download_info['_run'](download_info)
 
-    def get_download_status(self, user_id: int) -> Optional[Dict]:
-        """Get current download status for user"""
-        return self.current_downloads.get(user_id)
+    def _record_duration(self, download_info: Dict):
+        duration = (download_info['finish_time'] - download_info['start_time']).total_seconds()
+        if self._avg_duration is None:
+            self._avg_duration = duration
+        else:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
 
-    def cancel_download(self, user_id: int) -> bool:
-        """Cancel download for user"""
-        if user_id in self.current_downloads:
-            self.current_downloads[user_id]['status'] = 'cancelled'
+    def get_download_status(self, user_id: int) -> List[Dict]:
+        """Get queued and running downloads for user"""
+        return [job for job in self.jobs.values() if job['user_id'] == user_id]
+
+    async def cancel_download(self, job_id: str) -> bool:
+        """Cancel a queued or running download"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+
+        if job['status'] == 'queued':
+            if job['priority']:
+                self._priority.remove(job_id)
+            else:
+                queue = self._pending[job['user_id']]
+                queue.remove(job_id)
+                if not queue:
+                    del self._pending[job['user_id']]
+            job['status'] = 'cancelled'
+            job['finish_time'] = datetime.utcnow()
+            self._finish(job)
+            await self._save(job)
             return True
-        return False
+
+        job['status'] = 'cancelled'
+        job['cancel_requested'] = True
+        if job['_task']:
+            job['_task'].cancel()
+        return True
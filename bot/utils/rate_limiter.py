@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from config.config import (
+    GLOBAL_RATE_LIMIT,
+    GROUP_CHAT_RATE_LIMIT,
+    PRIVATE_CHAT_RATE_LIMIT,
+    RATE_LIMIT_MAX_RETRIES
+)
+from .metrics import TELEGRAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Priority classes passed as rate_limit_args; lower is sent first
+PRIORITY_DELIVERY = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_LOG = 2
+
+DELIVERY_ENDPOINTS = {'sendAudio', 'sendVideo', 'sendDocument', 'sendMediaGroup'}
+COALESCED_ENDPOINTS = {'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+class TokenBucket:
+    """Classic token bucket; `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'key', 'callback', 'args', 'kwargs', 'futures', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, key, callback, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.futures: List[asyncio.Future] = []
+        self.attempts = 0
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """Routes every outbound Bot API call through one scheduler
+
+    Sending and editing calls wait for a token from the global bucket and
+    from their chat's bucket, and go out in priority order (deliveries,
+    then interactive messages, then log lines). A pending edit of a message
+    is replaced by a newer edit of the same message, and every caller gets
+    the result of the edit that was sent. RetryAfter pauses the chat (or
+    everything, for calls without a chat) for the requested time before the
+    call is retried.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE_LIMIT,
+        private_chat_rate: float = PRIVATE_CHAT_RATE_LIMIT,
+        group_chat_rate: float = GROUP_CHAT_RATE_LIMIT,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.max_retries = max_retries
+
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._pending: List[_Request] = []
+        self._pending_edits: Dict[Tuple, _Request] = {}
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        # ExtBot initializes its rate limiter again when the Updater initializes the bot
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int]
+    ) -> Any:
+        if not endpoint.startswith(LIMITED_PREFIXES) or self._dispatcher is None:
+            try:
+                return await callback(*args, **kwargs)
+            except TelegramError as e:
+                TELEGRAM_ERRORS.inc(error=type(e).__name__)
+                raise
+
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        elif endpoint in DELIVERY_ENDPOINTS:
+            priority = PRIORITY_DELIVERY
+        else:
+            priority = PRIORITY_INTERACTIVE
+
+        chat_id = data.get('chat_id')
+        future = asyncio.get_running_loop().create_future()
+
+        key = None
+        if endpoint in COALESCED_ENDPOINTS:
+            key = (endpoint, chat_id, data.get('message_id'), data.get('inline_message_id'))
+            superseded = self._pending_edits.get(key)
+            if superseded is not None:
+                # Only the latest text matters; send that in the older slot
+                superseded.callback, superseded.args, superseded.kwargs = callback, args, kwargs
+                superseded.futures.append(future)
+                return await future
+
+        request = _Request(priority, next(self._sequence), chat_id, key, callback, args, kwargs)
+        request.futures.append(future)
+        self._pending.append(request)
+        if key is not None:
+            self._pending_edits[key] = request
+        self._wakeup.set()
+
+        return await future
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_chat_rate, 1)
+            else:
+                # Groups, channels and @usernames share the stricter group limit
+                bucket = TokenBucket(self.group_chat_rate, max(1.0, self.group_chat_rate * 3))
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _pick(self, now: float) -> Tuple[Optional[_Request], float]:
+        """Choose the most urgent sendable request, or how long to wait for one"""
+        global_wait = self.global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        best = None
+        wait = float('inf')
+        for request in self._pending:
+            chat_wait = (
+                self._chat_bucket(request.chat_id).wait_time(now)
+                if request.chat_id is not None else 0.0
+            )
+            if chat_wait > 0:
+                wait = min(wait, chat_wait)
+            elif best is None or (request.priority, request.seq) < (best.priority, best.seq):
+                best = request
+        return best, wait
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            request, wait = self._pick(now)
+
+            if request is None:
+                self._wakeup.clear()
+                timeout = None if wait == float('inf') else wait
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._pending.remove(request)
+            if request.key is not None:
+                self._pending_edits.pop(request.key, None)
+            self.global_bucket.take(now)
+            if request.chat_id is not None:
+                self._chat_bucket(request.chat_id).take(now)
+
+            asyncio.create_task(self._execute(request))
+
+    async def _execute(self, request: _Request):
+        request.attempts += 1
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            TELEGRAM_ERRORS.inc(error=type(e).__name__)
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+
+            if request.attempts > self.max_retries:
+                self._resolve(request, exception=e)
+                return
+
+            logger.warning(f"Flood limit hit for chat {request.chat_id}, retrying in {retry_after}s")
+            bucket = (
+                self._chat_bucket(request.chat_id)
+                if request.chat_id is not None else self.global_bucket
+            )
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+
+            newer = self._pending_edits.get(request.key) if request.key is not None else None
+            if newer is not None:
+                # A newer edit of this message is already waiting; it wins
+                newer.futures.extend(request.futures)
+                return
+
+            self._pending.append(request)
+            if request.key is not None:
+                self._pending_edits[request.key] = request
+            self._wakeup.set()
+        except Exception as e:
+            if isinstance(e, TelegramError):
+                TELEGRAM_ERRORS.inc(error=type(e).__name__)
+            self._resolve(request, exception=e)
+        else:
+            self._resolve(request, result=result)
+
+    @staticmethod
+    def _resolve(request: _Request, result: Any = None, exception: Optional[BaseException] = None):
+        for future in request.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
@@ -0,0 +1,79 @@
+import hmac
+import json
+import logging
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """Embedded aiohttp server that feeds webhook updates to the application
+
+    Updates are put on the application's update queue, so they are
+    processed exactly as in polling mode (including concurrent_updates).
+    Requests without the configured secret token are rejected with 403.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        listen: str,
+        port: int,
+        path: str,
+        secret_token: Optional[str] = None
+    ):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._runner: Optional[web.AppRunner] = None
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+        return app
+
+    async def start(self):
+        """Start listening for updates"""
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting updates"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            # aiohttp decodes raw header bytes with surrogateescape; compare
+            # bytes, since compare_digest rejects non-ASCII str
+            received = request.headers.get(SECRET_TOKEN_HEADER, "").encode("utf-8", "surrogateescape")
+            if not hmac.compare_digest(received, self.secret_token.encode()):
+                logger.warning(f"Rejected webhook request from {request.remote}: bad secret token")
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400)
+
+        update = Update.de_json(data, self.application.bot)
+        if update is None:
+            return web.Response(status=400)
+
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from config.config import JOB_POLL_INTERVAL, JOB_QUEUE_PATH
+
+from .utils.downloader import GamdlDownloader
+from .utils.job_store import JobStore
+from .utils.metadata_cache import CachedDownloader, MetadataCache
+
+logger = logging.getLogger(__name__)
+
+class DownloadWorker:
+    """Claims jobs from the JobStore and downloads them with gamdl
+
+    Each finished track is reported to the store right away, so the bot can
+    upload it while the rest of the release downloads, and the stream bytes
+    fetched so far are reported every `poll_interval`. The lease is renewed
+    in the background; if that fails the job was cancelled or handed to
+    another worker, and this one stops working on it. The download thread
+    can't be cancelled like a task, so it is also told to stop before it
+    writes another segment into the job's partial directory, which now
+    belongs to the other worker.
+    """
+
+    def __init__(
+        self,
+        worker_id: str,
+        job_store: JobStore,
+        downloader: CachedDownloader,
+        poll_interval: float = JOB_POLL_INTERVAL
+    ):
+        self.worker_id = worker_id
+        self.job_store = job_store
+        self.downloader = downloader
+        self.poll_interval = poll_interval
+        self._lease_lost = False
+        self._cancel = threading.Event()
+        self._fetched = 0
+
+    async def run(self):
+        """Process jobs until cancelled"""
+        logger.info(f"Worker {self.worker_id} started")
+        while True:
+            job = await self.job_store.claim(self.worker_id)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._process(job)
+
+    async def _process(self, job: Dict):
+        job_id = job['job_id']
+        logger.info(f"Worker {self.worker_id} claimed job {job_id} (attempt {job['attempts']})")
+
+        self._lease_lost = False
+        self._cancel = threading.Event()
+        lease = asyncio.create_task(self._keep_lease(job_id, asyncio.current_task()))
+        try:
+            await self._download(job)
+        except asyncio.CancelledError:
+            if not self._lease_lost:
+                raise
+            logger.info(f"Worker {self.worker_id} dropped job {job_id}: cancelled or taken over")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await self.job_store.finish(job_id, self.worker_id, error=str(e))
+        else:
+            await self.job_store.finish(job_id, self.worker_id)
+        finally:
+            lease.cancel()
+            await asyncio.gather(lease, return_exceptions=True)
+
+    async def _keep_lease(self, job_id: str, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.job_store.lease_seconds / 3)
+            if not await self.job_store.renew(job_id, self.worker_id):
+                self._lease_lost = True
+                self._cancel.set()
+                task.cancel()
+                return
+
+    def _add_fetched(self, size: int):
+        self._fetched += size
+
+    async def _report_fetched(self, job_id: str):
+        reported = self._fetched
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._fetched != reported:
+                reported = self._fetched
+                await self.job_store.set_fetched(job_id, self.worker_id, reported)
+
+    async def _download(self, job: Dict):
+        job_id = job['job_id']
+        output_path = Path(job['output_path'])
+
+        tracks = await self.downloader.get_tracks(job['url'])
+        await self.job_store.set_total(job_id, len(tracks))
+
+        # A job taken over from a dead worker keeps the tracks it already reported
+        reported = {position for position, _, _ in await self.job_store.get_files(job_id)}
+
+        loop = asyncio.get_running_loop()
+
+        def on_bytes(size: int):
+            # Called on the SegmentFetcher's thread
+            loop.call_soon_threadsafe(self._add_fetched, size)
+
+        # Continue from the count of earlier attempts; the bot reports the growth
+        self._fetched = job['fetched_bytes']
+        reporter = asyncio.create_task(self._report_fetched(job_id))
+        try:
+            for index, track in enumerate(tracks):
+                if index in reported:
+                    continue
+                path = Path(await asyncio.to_thread(
+                    self.downloader.download_track,
+                    track, output_path, job['quality'], on_bytes, self._cancel
+                ))
+                await self.job_store.add_file(job_id, index, path, path.stat().st_size)
+        finally:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+
+def run_worker(index: int):
+    """Worker process entry point"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    job_store = JobStore(JOB_QUEUE_PATH)
+    downloader = CachedDownloader(GamdlDownloader(), MetadataCache())
+    worker = DownloadWorker(f"worker-{index}-{os.getpid()}", job_store, downloader)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        downloader.close()
+        job_store.close()
+
+def start_workers(count: int) -> List[multiprocessing.Process]:
+    """Start `count` worker processes"""
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        process = context.Process(target=run_worker, args=(index,), name=f"download-worker-{index}")
+        process.start()
+        processes.append(process)
+    return processes
+
+def stop_workers(processes: List[multiprocessing.Process], timeout: float = 10):
+    """Terminate worker processes; their jobs are re-claimed once the leases expire"""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(timeout)
@@ -6,26 +6,109 @@ BOT_TOKEN = "YOUR_BOT_TOKEN"
 ADMIN_USERS = [12345678]  # Add admin user IDs
 AUTH_CHANNELS = [-1001234567890]  # Add authorized channel IDs
 LOG_CHANNEL = -1001234567891  # Log channel ID
+UPDATE_CONCURRENCY = 16  # Updates processed at the same time
+
+# Metrics Configuration
+METRICS_ENABLED = False  # Serve Prometheus metrics over HTTP
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 9108
+PROFILE_WINDOW_HOURS = 24  # Default window of /profile
+PROFILE_MAX_WINDOW_HOURS = 24 * 365  # Longest window /profile accepts
+PROFILE_SLOWEST_JOBS = 5  # Slowest jobs listed by /profile
+LOOP_WATCHDOG_ENABLED = True  # Measure event loop lag and capture what blocks the loop
+LOOP_WATCHDOG_INTERVAL = 0.1  # Seconds between heartbeats
+LOOP_WATCHDOG_THRESHOLD = 0.25  # Lag in seconds that counts as a block
+LOOP_WATCHDOG_REPORT_INTERVAL = 300  # Seconds between log reports of one call site
+LOOP_WATCHDOG_BUDGET = None  # Strict mode (benchmarks): blocks longer than this many seconds fail the run
+
+# Webhook Configuration
+WEBHOOK_ENABLED = False  # Serve updates through a webhook instead of polling
+WEBHOOK_URL = "https://example.com/telegram"  # Public URL Telegram posts updates to
+WEBHOOK_LISTEN = "0.0.0.0"  # Address the embedded server binds to
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"  # Path the embedded server accepts updates on
+WEBHOOK_SECRET_TOKEN = ""  # Checked against X-Telegram-Bot-Api-Secret-Token; empty disables the check
+WEBHOOK_MAX_CONNECTIONS = 40  # Simultaneous connections Telegram may open
+
+# Log Channel Configuration
+LOG_DIGEST_ENABLED = True  # Batch log channel events into periodic digests
+LOG_DIGEST_INTERVAL = 60  # Seconds between digests
+LOG_DIGEST_MAX_EVENTS = 50  # Events that trigger an early digest
+LOG_DIGEST_MAX_MESSAGES = 3  # Longer digests are sent as a text file
+ERROR_SUMMARY_INTERVAL = 300  # Seconds repeats of an error are suppressed before a summary
+ERROR_ADMIN_MAX_MESSAGES = 10  # Error messages per admin per summary interval
 
 # Path Configuration
 BASE_DIR = Path(__file__).parent.parent
 DOWNLOAD_DIR = BASE_DIR / "data" / "downloads"
 CACHE_DIR = BASE_DIR / "data" / "cache"
 COOKIES_FILE = BASE_DIR / "config" / "cookies.txt"
+DB_PATH = BASE_DIR / "data" / "bot.db"
+PARTIAL_DOWNLOAD_DIR = DOWNLOAD_DIR / "partial"  # Unfinished downloads kept for retries, per release
+
+# Database Configuration
+DB_FLUSH_INTERVAL = 2  # Seconds between write-behind flushes
+DB_FLUSH_BATCH_SIZE = 200  # Buffered writes that trigger an early flush
 
 # Cache Configuration
 CACHE_CLEANUP_INTERVAL = 3600  # Cleanup interval in seconds (1 hour)
 MAX_CACHE_AGE = 24 * 3600  # Maximum cache age in seconds (24 hours)
+TRACK_CACHE_DIR = CACHE_DIR / "tracks"  # Finished downloads keyed by catalog ID and quality
+MAX_CACHE_SIZE = 20 * 1024 ** 3  # Track cache size budget in bytes (20 GB)
+MIN_FREE_DISK = 5 * 1024 ** 3  # Evict until at least this much disk space is free (5 GB)
+CACHE_INDEX_PATH = CACHE_DIR / "index.db"  # Size, last access and hits per cache entry
+EVICTION_SLICE_SIZE = 50  # Cache entries removed per eviction step
 
 # Download Configuration
 MAX_CONCURRENT_DOWNLOADS = 5
+MAX_DOWNLOADS_PER_USER = 2  # Jobs a single (non-admin) user may run at once
+QUEUE_USER_WEIGHTS = {}  # User ID: share of the download queue relative to the default of 1
+QUEUE_JOB_RETENTION = 7 * 24 * 3600  # Seconds finished jobs stay in the queue_jobs table
+WORKER_PROCESSES = 0  # Download worker processes; 0 downloads in the bot process
+JOB_QUEUE_PATH = BASE_DIR / "data" / "jobs.db"  # Queue shared with the worker processes
+JOB_LEASE_SECONDS = 60  # Workers renew their lease on a job within this time
+JOB_MAX_ATTEMPTS = 3  # Claims of a job before a worker that keeps dying fails it
+JOB_POLL_INTERVAL = 0.5  # Seconds between queue polls
+DOWNLOAD_PROCESSES = 2  # Processes running gamdl for the bot; 0 runs it in threads
+DOWNLOAD_PROCESS_MAX_TASKS = 50  # Calls per process before it is replaced
+METADATA_TIMEOUT = 60  # Seconds allowed to resolve a URL to its tracks
+TRACK_TIMEOUT = 600  # Seconds allowed to download, decrypt, remux and tag a track
 ALLOWED_TYPES = ["song", "album", "playlist", "music-video"]
 DEFAULT_QUALITY = "HIGH"  # HIGH, MEDIUM, LOW
+PIPELINE_WINDOW = 3  # Downloaded tracks allowed to wait for upload per job
+
+# HLS Configuration
+HLS_SEGMENT_RETRIES = 3  # Retries per HLS segment before the track fails
+HLS_SEGMENT_TIMEOUT = 60  # Seconds a segment read may stall
+HLS_CONNECT_TIMEOUT = 30  # Seconds allowed to open a connection
+HLS_REQUEST_TIMEOUT = 300  # Seconds a playlist or segment request may take in total
+HLS_SEGMENT_CONCURRENCY = 4  # Segments of one track fetched at once
+HLS_MAX_CONNECTIONS = 32  # Connections per process, shared by all tracks
+HLS_CONNECTIONS_PER_HOST = 8  # Connections per process to a single CDN host
+HLS_KEEPALIVE_TIMEOUT = 30  # Seconds idle connections are kept for reuse
+
+# Metadata Cache Configuration
+METADATA_CACHE_PATH = CACHE_DIR / "metadata.db"  # Resolved catalog lookups
+METADATA_CACHE_SIZE = 1000  # Lookups kept in memory
+METADATA_TTLS = {  # Seconds a lookup stays valid, per entity type
+    "song": 7 * 24 * 3600,
+    "album": 24 * 3600,
+    "music-video": 7 * 24 * 3600,
+    "playlist": 15 * 60
+}
+METADATA_DEFAULT_TTL = 3600  # Seconds for entity types not listed above
 
 # Telegram Configuration
 MAX_MESSAGE_LENGTH = 4096
 MAX_CAPTION_LENGTH = 1024
 PROGRESS_UPDATE_INTERVAL = 5  # seconds
+PROGRESS_EDIT_BUDGET = 30  # Maximum progress edits per job, including the final status
+GLOBAL_RATE_LIMIT = 30  # Outgoing messages per second across all chats
+PRIVATE_CHAT_RATE_LIMIT = 1  # Messages per second to one private chat
+GROUP_CHAT_RATE_LIMIT = 20 / 60  # Messages per second to one group or channel
+RATE_LIMIT_MAX_RETRIES = 3  # Retries of a call after Telegram answered with retry_after
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # Bot API upload limit; ZIPs are split below this
+ZIP_WORKERS = 2  # Threads building ZIP archives
 
 # Apple Music Configuration
 AM_QUALITY_OPTIONS = {
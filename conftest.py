@@ -0,0 +1 @@
+# Lets the tests import bot, config and benchmarks from the repository root
@@ -4,12 +4,14 @@ from datetime import datetime
 from pathlib import Path
 
 from bot.bot import GamdlBot
+from bot.worker import start_workers, stop_workers
 from config.config import (
     BOT_TOKEN,
     ADMIN_USERS,
     AUTH_CHANNELS,
     LOG_CHANNEL,
-    CACHE_CLEANUP_INTERVAL
+    CACHE_CLEANUP_INTERVAL,
+    WORKER_PROCESSES
 )
 
 # Setup logging
@@ -32,6 +34,7 @@ def main():
 
     logger.info(f"Starting bot at {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}")
     
+    workers = []
     try:
         bot = GamdlBot(
             token=BOT_TOKEN,
@@ -40,10 +43,15 @@ def main():
             log_channel=LOG_CHANNEL,
             cache_cleanup_interval=CACHE_CLEANUP_INTERVAL
         )
+        if WORKER_PROCESSES:
+            workers = start_workers(WORKER_PROCESSES)
+            logger.info(f"Started {len(workers)} download workers")
         bot.run()
     except Exception as e:
         logger.error(f"Error starting bot: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        stop_workers(workers)
 
 if __name__ == "__main__":
     main()
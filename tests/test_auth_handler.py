@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiohttp")
+
+from bot.handlers import auth_handler, download_handler
+
+ADMIN = 1
+ALICE = 10
+STRANGER = 99
+CHANNEL = -1001
+OTHER_GROUP = -1002
+
+@pytest.fixture(autouse=True)
+def grants(monkeypatch):
+    monkeypatch.setattr(auth_handler, "admin_users", {ADMIN})
+    monkeypatch.setattr(auth_handler, "authorized_users", {ALICE})
+    monkeypatch.setattr(auth_handler, "authorized_channels", {CHANNEL})
+
+def test_check_auth():
+    async def main():
+        assert await auth_handler.check_auth(ADMIN)
+        assert await auth_handler.check_auth(ALICE, OTHER_GROUP)
+        assert await auth_handler.check_auth(STRANGER, CHANNEL)
+        assert not await auth_handler.check_auth(STRANGER)
+        assert not await auth_handler.check_auth(STRANGER, OTHER_GROUP)
+
+    asyncio.run(main())
+
+def send(user_id: int, chat_id: int) -> str:
+    """Send an Apple Music link to handle_download and return the bot's reply"""
+    message = SimpleNamespace(
+        text="https://music.apple.com/us/album/release/1000",
+        from_user=SimpleNamespace(id=user_id, username="user"),
+        reply_text=AsyncMock()
+    )
+    update = SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=chat_id))
+    context = SimpleNamespace(bot_data={'db': AsyncMock(), 'downloader': None})
+    asyncio.run(download_handler.handle_download(update, context))
+    return message.reply_text.call_args.args[0]
+
+def test_messages_in_an_authorized_channel_are_served():
+    assert send(STRANGER, CHANNEL) == "Please choose download options:"
+    assert send(STRANGER, OTHER_GROUP).startswith("❌ You are not authorized")
@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The bot's own dependencies; gamdl is not needed, the benchmarks bring a synthetic downloader
+for module in ("telegram", "aiohttp", "m3u8"):
+    pytest.importorskip(module)
+
+def test_smoke_scenario(tmp_path):
+    """`python -m benchmarks.run smoke` runs the real bot from the checkout and completes every request"""
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "smoke", "--output", str(tmp_path)],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    (path,) = tmp_path.glob("smoke-*.json")
+    results = json.loads(path.read_text())["results"]
+    assert results["requests"] > 0
+    assert results["completed"] == results["requests"]
+    assert results["upload_bytes"] > 0
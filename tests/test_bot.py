@@ -0,0 +1,73 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+for module in ("telegram", "aiohttp", "m3u8"):
+    pytest.importorskip(module)
+
+# Runs in a fresh interpreter, since the bot modules copy their settings
+# at import time and isolate_config has to come first
+RUN_BOT = '''
+import asyncio
+import os
+import signal
+import sys
+from pathlib import Path
+
+from benchmarks.run import isolate_config
+isolate_config(Path(sys.argv[1]), {})
+
+from benchmarks.fake_telegram import FakeBotAPI
+from benchmarks.synthetic import SyntheticDownloader
+from bot.bot import GamdlBot
+from bot.utils.metadata_cache import CachedDownloader, MetadataCache
+
+api = FakeBotAPI()
+loop = asyncio.get_event_loop()
+loop.run_until_complete(api.start())
+
+# Like main.py: the bot is built before its loop runs
+bot = GamdlBot(
+    token="123456:TEST",
+    admin_users=[1],
+    auth_channels=[],
+    log_channel=-100,
+    cache_cleanup_interval=3600,
+    downloader=CachedDownloader(SyntheticDownloader(), MetadataCache()),
+    base_url=api.base_url
+)
+
+async def exercise():
+    try:
+        while not bot.app.running:
+            await asyncio.sleep(0.05)
+
+        async def run(job):
+            pass
+
+        job = await bot.download_queue.add_to_queue(2, "https://music.apple.com/us/song/x/1", "256", 1, run)
+        print("queue:", await asyncio.wait_for(job["done"], 10))
+    finally:
+        os.kill(os.getpid(), signal.SIGTERM)
+
+loop.create_task(exercise())
+bot.run()
+loop.run_until_complete(api.stop())
+'''
+
+def run_bot(tmp_path: Path) -> str:
+    """Run the bot the way main.py does until the exercise above ends, and return its output"""
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_BOT, str(tmp_path)],
+        cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+def test_bot_built_outside_the_loop(tmp_path):
+    """The bot's asyncio primitives work on the loop it runs on, not just the one current when it was built"""
+    assert "queue: completed" in run_bot(tmp_path)
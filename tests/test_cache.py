@@ -0,0 +1,114 @@
+import asyncio
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from bot.utils import cache as cache_module
+from bot.utils.cache import CacheManager
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "PARTIAL_DOWNLOAD_DIR", tmp_path / "partial")
+    manager = CacheManager(cleanup_interval=3600, max_size=10_000)
+    manager.track_cache_dir = tmp_path / "tracks"
+    manager.index_path = tmp_path / "index.db"
+    manager.min_free_disk = 0
+    return manager
+
+async def store(cache: CacheManager, catalog_key: str, sizes: List[int], quality: str = "256") -> List[Path]:
+    """Stage files of the given sizes as one cache entry"""
+    entry = cache.open_entry(catalog_key, quality)
+    source = cache.track_cache_dir.parent / "downloads" / catalog_key
+    source.mkdir(parents=True, exist_ok=True)
+    for index, size in enumerate(sizes):
+        file = source / f"{index + 1:02d}.m4a"
+        file.write_bytes(bytes([index]) * size)
+        await entry.add(file)
+    return await entry.commit()
+
+def run(cache: CacheManager, test):
+    """Run a test coroutine with the cache's index open and its evictor running"""
+    async def main():
+        await cache.start_cleanup_task()
+        try:
+            await test()
+        finally:
+            cache._cleanup_task.cancel()
+            await asyncio.gather(cache._cleanup_task, return_exceptions=True)
+
+    asyncio.run(main())
+
+def test_linked_files_survive_eviction(cache, tmp_path):
+    async def test():
+        await store(cache, "song-1", [100, 200])
+        files = await cache.get_cached_files("song-1", "256", link_dir=tmp_path / "job")
+        assert [f.parent for f in files] == [tmp_path / "job"] * 2
+
+        cache.max_size = 0
+        await cache.cleanup_old_files()
+
+        assert await cache.get_cached_files("song-1", "256") is None
+        assert [f.read_bytes() for f in files] == [b"\0" * 100, b"\1" * 200]
+
+    run(cache, test)
+
+def test_cache_built_outside_the_loop(cache):
+    async def test():
+        # Over budget: the store wakes the evictor instead of waiting an interval
+        await store(cache, "song-1", [20_000])
+        await asyncio.sleep(0.1)
+        assert await cache.get_cached_files("song-1", "256") is None
+
+    # Like the bot: built in one asyncio.run(), used in another
+    asyncio.run(asyncio.sleep(0))
+    run(cache, test)
+
+def test_least_recently_used_entries_go_first(cache):
+    async def test():
+        cache.max_size = 1000
+        await store(cache, "song-1", [400])
+        await store(cache, "song-2", [400])
+        await asyncio.sleep(0.01)
+        assert await cache.get_cached_files("song-1", "256") is not None
+
+        await store(cache, "song-3", [400])
+        await asyncio.sleep(0.1)
+        assert await cache.get_cached_files("song-2", "256") is None
+        assert await cache.get_cached_files("song-1", "256") is not None
+        assert await cache.get_cached_files("song-3", "256") is not None
+        assert cache._total_size == 800
+
+    run(cache, test)
+
+def test_low_disk_space_evicts_within_the_size_budget(cache):
+    async def test():
+        await store(cache, "song-1", [100])
+        await store(cache, "song-2", [100])
+        await cache.cleanup_old_files()
+        assert cache._total_size == 200
+
+        cache.min_free_disk = float("inf")
+        await cache.cleanup_old_files()
+        assert cache._total_size == 0
+        assert not (cache.track_cache_dir / "256" / "song-1").exists()
+
+    run(cache, test)
+
+def test_idle_entries_are_evicted(cache, monkeypatch):
+    monkeypatch.setattr(cache_module, "MAX_CACHE_AGE", 3600)
+
+    async def test():
+        await store(cache, "song-1", [100])
+        await store(cache, "song-2", [100])
+
+        def age(conn, key):
+            with conn:
+                conn.execute("UPDATE entries SET last_access = last_access - 7200 WHERE key = ?", (key,))
+        await cache._run(age, cache._index, "256/song-1")
+
+        await cache.cleanup_old_files()
+        assert await cache.get_cached_files("song-1", "256") is None
+        assert await cache.get_cached_files("song-2", "256") is not None
+
+    run(cache, test)
@@ -0,0 +1,51 @@
+import asyncio
+import zipfile
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from bot.utils.compress import ZipPartWriter
+from bot.utils.error_handler import DownloadError
+
+def test_parts_stay_below_the_limit(tmp_path):
+    files = []
+    for index in range(5):
+        file = tmp_path / f"{index + 1:02d}.m4a"
+        file.write_bytes(bytes([index]) * 3000)
+        files.append(file)
+    output = tmp_path / "zips"
+    output.mkdir()
+
+    async def build():
+        writer = ZipPartWriter(output, max_part_size=8000)
+        parts = []
+        for file in files:
+            parts += await writer.add(file)
+        parts += await writer.close()
+        return writer, parts
+
+    writer, parts = asyncio.run(build())
+
+    assert len(parts) == 3
+    assert writer.part_members == [2, 2, 1]
+    assert all(part.stat().st_size <= 8000 for part in parts)
+    names = [name for part in parts for name in zipfile.ZipFile(part).namelist()]
+    assert names == [file.name for file in files]
+
+def test_file_above_the_limit_fails(tmp_path):
+    small = tmp_path / "01.m4a"
+    small.write_bytes(b"\0" * 1000)
+    large = tmp_path / "02.m4a"
+    large.write_bytes(b"\0" * 9000)
+
+    async def build():
+        writer = ZipPartWriter(tmp_path, max_part_size=8000)
+        assert await writer.add(small) == []
+        with pytest.raises(DownloadError, match="02.m4a"):
+            await writer.add(large)
+        # The part that was open keeps what it had
+        return await writer.close()
+
+    (part,) = asyncio.run(build())
+    assert zipfile.ZipFile(part).namelist() == ["01.m4a"]
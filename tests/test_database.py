@@ -0,0 +1,154 @@
+import asyncio
+import sqlite3
+
+from bot.utils import database
+from bot.utils.database import DatabaseManager
+
+URL = "https://music.apple.com/us/album/release/1000"
+
+def count_downloads(db_path) -> int:
+    """Rows on disk, read through a separate connection like another process would"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_writes_wait_for_the_flush(tmp_path):
+    db_path = tmp_path / "bot.db"
+
+    async def main():
+        db = DatabaseManager(db_path)
+        db.start()
+        await db.add_user(10, "alice")
+        await db.log_download(10, URL, "album", "256", "completed", file_size=100)
+        assert count_downloads(db_path) == 0
+
+        # Reads flush first, so they see their own writes
+        assert (await db.get_user_stats(10))['successful_downloads'] == 1
+        assert count_downloads(db_path) == 1
+        await db.close()
+
+    asyncio.run(main())
+
+def test_a_full_batch_flushes_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FLUSH_INTERVAL", 3600)
+    monkeypatch.setattr(database, "DB_FLUSH_BATCH_SIZE", 3)
+    db_path = tmp_path / "bot.db"
+
+    async def main():
+        db = DatabaseManager(db_path)
+        db.start()
+        for _ in range(2):
+            await db.log_download(10, URL, "album", "256", "failed")
+        await asyncio.sleep(0.1)
+        assert count_downloads(db_path) == 0
+
+        await db.log_download(10, URL, "album", "256", "failed")
+        await asyncio.sleep(0.1)
+        assert count_downloads(db_path) == 3
+        await db.close()
+
+    asyncio.run(main())
+
+def test_close_flushes_what_is_left(tmp_path):
+    db_path = tmp_path / "bot.db"
+
+    async def main():
+        # Never started: nothing flushes until close()
+        db = DatabaseManager(db_path)
+        await db.log_download(10, URL, "album", "256", "completed", file_size=100)
+        await db.close()
+
+    asyncio.run(main())
+    assert count_downloads(db_path) == 1
+
+# The schema and rows of a database from before the migrations
+UNVERSIONED_SCHEMA = '''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_seen DATETIME,
+        last_active DATETIME,
+        total_downloads INTEGER DEFAULT 0,
+        is_authorized BOOLEAN DEFAULT 0
+    );
+
+    CREATE TABLE downloads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        url TEXT,
+        file_type TEXT,
+        quality TEXT,
+        status TEXT,
+        started_at DATETIME,
+        completed_at DATETIME,
+        file_size INTEGER,
+        error_message TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+
+    INSERT INTO users (user_id, username, first_seen, last_active, total_downloads)
+    VALUES (10, 'alice', '2024-01-01 10:00:00', '2024-01-02 10:00:00', 2);
+
+    INSERT INTO downloads (user_id, url, file_type, quality, status, started_at, file_size)
+    VALUES
+        (10, 'a', 'album', '256', 'completed', '2024-01-01 10:00:00.000000', 100),
+        (10, 'b', 'album', '256', 'completed', '2024-01-02 10:00:00.000000', 50),
+        (10, 'c', 'album', '256', 'failed', '2024-01-02 11:00:00.000000', NULL),
+        (20, 'd', 'song', '256', 'failed', '2024-01-02 12:00:00.000000', NULL);
+'''
+
+def test_migrations_backfill_the_counters(tmp_path):
+    db_path = tmp_path / "bot.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(UNVERSIONED_SCHEMA)
+    conn.close()
+
+    async def main():
+        db = DatabaseManager(db_path)
+        stats = await db.get_user_stats(10)
+        assert (stats['successful_downloads'], stats['failed_downloads'], stats['total_bytes']) == (2, 1, 150)
+        all_time = (await db.get_bot_stats())['all_time']
+        assert (all_time['successful_downloads'], all_time['failed_downloads'], all_time['total_bytes']) == (2, 2, 150)
+        await db.close()
+
+    asyncio.run(main())
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+        assert conn.execute("SELECT day, successful_downloads, failed_downloads, total_bytes FROM daily_stats ORDER BY day").fetchall() == [
+            ('2024-01-01', 1, 0, 100),
+            ('2024-01-02', 1, 2, 50)
+        ]
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(downloads)")]
+        assert columns[-2:] == ['duration', 'stage_spans']
+        assert conn.execute("SELECT COUNT(*) FROM queue_jobs").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+def test_counters_follow_new_downloads(tmp_path):
+    db_path = tmp_path / "bot.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(UNVERSIONED_SCHEMA)
+    conn.close()
+
+    async def main():
+        db = DatabaseManager(db_path)
+        await db.log_download(10, URL, "album", "256", "completed", file_size=25)
+        await db.log_download(10, URL, "album", "256", "failed")
+        await db.close()
+
+        # Reopening doesn't migrate, or backfill, a second time
+        db = DatabaseManager(db_path)
+        stats = await db.get_user_stats(10)
+        assert (stats['successful_downloads'], stats['failed_downloads'], stats['total_bytes']) == (3, 2, 175)
+        assert stats['total_downloads'] == 3
+        bot_stats = await db.get_bot_stats()
+        assert bot_stats['all_time']['successful_downloads'] == 3
+        assert bot_stats['today']['successful_downloads'] == 1
+        assert bot_stats['today']['failed_downloads'] == 1
+        await db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiohttp")
+
+from bot.handlers import download_handler
+from bot.utils.database import DatabaseManager
+from bot.utils.queue_manager import DownloadQueue
+
+URL = "https://music.apple.com/us/album/release/1000"
+USERS = [10, 20, 30]
+
+@pytest.fixture
+def application(tmp_path):
+    """What the handlers use of the Application: the bot and the shared services"""
+    db = DatabaseManager(tmp_path / "bot.db")
+    return SimpleNamespace(
+        bot=AsyncMock(),
+        bot_data={
+            'db': db,
+            'download_queue': DownloadQueue(db=db),
+            'cache_manager': SimpleNamespace(get_cached_files=AsyncMock(return_value=None))
+        }
+    )
+
+def request(user_id: int) -> dict:
+    return {
+        'user_id': user_id,
+        'chat_id': user_id,
+        'message_id': 1,
+        'url': URL,
+        'quality': "256",
+        'zip_file': False
+    }
+
+def test_waiters_of_an_undeliverable_leader_share_one_download(application):
+    queue = application.bot_data['download_queue']
+
+    async def main():
+        leader = {'job_id': "leader", 'done': asyncio.get_running_loop().create_future()}
+        waiters = [
+            await queue.add_waiter(
+                user_id, URL, "256", 1,
+                lambda waiter: download_handler.wait_for_download(application, leader, waiter),
+                chat_id=user_id
+            )
+            for user_id in USERS
+        ]
+
+        # Completed, but neither file_ids nor the track cache can serve the waiters
+        leader['done'].set_result('completed')
+        await asyncio.gather(*[waiter['_task'] for waiter in waiters])
+        await asyncio.sleep(0)
+
+        # The first to get there downloads, the others wait on it
+        (job,) = queue.jobs.values()
+        assert queue.get_in_flight((download_handler.catalog_key(URL), "256")) is job
+        assert sorted([job['job_id'], *queue.waiters]) == sorted(waiter['job_id'] for waiter in waiters)
+        await queue.stop()
+        await application.bot_data['db'].close()
+
+    asyncio.run(main())
+
+def saved_job(job_id: str, message_id: int, user_id: int, url: str, status: str, queued_at: datetime, checkpoint=()) -> dict:
+    """A queue job as the database holds it after a restart"""
+    return {
+        **request(user_id),
+        'job_id': job_id,
+        'message_id': message_id,
+        'url': url,
+        'priority': False,
+        'status': status,
+        'checkpoint': list(checkpoint),
+        'queued_time': queued_at,
+        'start_time': queued_at if status == 'downloading' else None,
+        'finish_time': None
+    }
+
+def test_restart_restores_jobs_and_waiters(application):
+    queue = application.bot_data['download_queue']
+    db = application.bot_data['db']
+    other_url = "https://music.apple.com/us/album/other/2000"
+    orphan_url = "https://music.apple.com/us/album/orphan/3000"
+
+    async def main():
+        now = datetime.utcnow()
+        for job in (
+            saved_job("queued", 101, 20, other_url, 'queued', now),
+            saved_job("leader", 102, 10, URL, 'downloading', now + timedelta(seconds=1), [("01.m4a", "file-1")]),
+            saved_job("waiter", 103, 30, URL, 'waiting', now + timedelta(seconds=2)),
+            # Its leader finished before the restart
+            saved_job("orphan", 104, 10, orphan_url, 'waiting', now + timedelta(seconds=3))
+        ):
+            await db.save_queue_job(job)
+
+        await download_handler.resume_downloads(application)
+
+        assert sorted(queue.jobs) == ["leader", "orphan", "queued"]
+        assert list(queue.waiters) == ["waiter"]
+        # The running job goes first and skips what it delivered
+        assert queue.get_position("leader") == 0
+        assert queue.get_position("queued") > 0
+        assert queue.jobs["leader"]['checkpoint'] == [("01.m4a", "file-1")]
+        assert queue.get_in_flight((download_handler.catalog_key(orphan_url), "256")) is queue.jobs["orphan"]
+
+        texts = {
+            call.kwargs['message_id']: call.args[0]
+            for call in application.bot.edit_message_text.await_args_list
+        }
+        assert texts[102].startswith("🔄 The bot restarted, resuming")
+        assert texts[101].startswith("⏳ The bot restarted, your download is still queued")
+        assert texts[103].startswith("⏳ This release is already being downloaded")
+        assert texts[104].startswith("⏳ Queued")
+        await queue.stop()
+        await db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,157 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import create_autospec
+
+import pytest
+
+pytest.importorskip("gamdl.downloader")
+pytest.importorskip("aiohttp")
+pytest.importorskip("m3u8")
+pytest.importorskip("telegram")
+
+from gamdl.apple_music_api import AppleMusicApi
+from gamdl.downloader_music_video import DownloaderMusicVideo
+from gamdl.downloader_song_legacy import DownloaderSongLegacy
+from gamdl.enums import SongCodec
+from gamdl.itunes_api import ItunesApi
+from gamdl.models import DownloadQueue, Lyrics, StreamInfo, UrlInfo
+
+from bot.utils import downloader as downloader_module
+from bot.utils.error_handler import DownloadError
+
+SONG = {'id': "1", 'type': "songs", 'attributes': {'name': "Song", 'playParams': {'id': "1"}}}
+MUSIC_VIDEO = {'id': "3", 'type': "music-videos", 'attributes': {'name': "Video", 'playParams': {'id': "3"}}}
+
+@pytest.fixture
+def gamdl(monkeypatch):
+    """GamdlDownloader over autospecced gamdl classes, so calls must match gamdl's real API"""
+    downloader_cls = create_autospec(downloader_module.ResumableDownloader)
+    song_cls = create_autospec(DownloaderSongLegacy)
+    music_video_cls = create_autospec(DownloaderMusicVideo)
+    monkeypatch.setattr(downloader_module, "ResumableDownloader", downloader_cls)
+    monkeypatch.setattr(downloader_module, "DownloaderSongLegacy", song_cls)
+    monkeypatch.setattr(downloader_module, "DownloaderMusicVideo", music_video_cls)
+
+    downloader_cls.return_value.cdm = "cdm"
+    adapter = downloader_module.GamdlDownloader(
+        apple_music_api=create_autospec(AppleMusicApi, instance=True),
+        itunes_api=create_autospec(ItunesApi, instance=True)
+    )
+    return SimpleNamespace(
+        adapter=adapter,
+        downloader_cls=downloader_cls,
+        downloader=downloader_cls.return_value,
+        song_cls=song_cls,
+        song=song_cls.return_value,
+        music_video=music_video_cls.return_value
+    )
+
+def test_get_tracks_skips_unstreamable_tracks(gamdl):
+    unavailable = {'id': "2", 'type': "songs", 'attributes': {'name': "Gone"}}
+    music_video = {'id': "3", 'type': "music-videos", 'attributes': {'playParams': {'id': "3"}}}
+    gamdl.downloader.get_url_info.return_value = UrlInfo("us", "album", "10")
+    gamdl.downloader.get_download_queue.return_value = DownloadQueue(
+        tracks_metadata=[SONG, unavailable, music_video]
+    )
+
+    assert gamdl.adapter.get_tracks("https://music.apple.com/us/album/x/10") == [SONG]
+    gamdl.downloader.set_cdm.assert_called_once_with()
+
+def test_download_song(gamdl, tmp_path):
+    temp_path = tmp_path / downloader_module.TEMP_DIR_NAME
+    final_path = tmp_path / "Artist" / "Album" / "01 Song.m4a"
+    paths = {
+        name: temp_path / f"1_{name}.m4a" for name in ("encrypted", "decrypted", "remuxed")
+    }
+    gamdl.song.get_lyrics.return_value = Lyrics(unsynced="la la")
+    gamdl.song.get_tags.return_value = {'title': "Song"}
+    gamdl.song.get_stream_info.return_value = StreamInfo(
+        stream_url="https://example.com/song.m3u8", widevine_pssh="pssh"
+    )
+    gamdl.song.get_decryption_key.return_value = "key"
+    gamdl.song.get_encrypted_path.return_value = paths['encrypted']
+    gamdl.song.get_decrypted_path.return_value = paths['decrypted']
+    gamdl.song.get_remuxed_path.return_value = paths['remuxed']
+    gamdl.downloader.get_final_path.return_value = final_path
+    gamdl.downloader.get_cover_url.return_value = "https://example.com/cover.jpg"
+
+    assert gamdl.adapter.download_track(SONG, tmp_path, "64") == final_path
+
+    gamdl.downloader_cls.assert_called_with(
+        gamdl.adapter.apple_music_api,
+        gamdl.adapter.itunes_api,
+        output_path=tmp_path,
+        temp_path=temp_path,
+        silent=True
+    )
+    gamdl.song_cls.assert_called_once_with(gamdl.downloader, SongCodec.AAC_HE_LEGACY)
+    gamdl.song.get_tags.assert_called_once_with(
+        gamdl.adapter.apple_music_api.get_webplayback.return_value, "la la"
+    )
+    gamdl.downloader.download.assert_called_once_with(
+        paths['encrypted'], "https://example.com/song.m3u8"
+    )
+    gamdl.song.remux.assert_called_once_with(
+        paths['encrypted'], paths['decrypted'], paths['remuxed'], "key"
+    )
+    gamdl.downloader.apply_tags.assert_called_once_with(
+        paths['remuxed'], {'title': "Song"}, "https://example.com/cover.jpg"
+    )
+    gamdl.downloader.move_to_output_path.assert_called_once_with(paths['remuxed'], final_path)
+
+def test_download_song_finished_earlier(gamdl, tmp_path):
+    final_path = tmp_path / "01 Song.m4a"
+    final_path.touch()
+    gamdl.downloader.get_final_path.return_value = final_path
+
+    assert gamdl.adapter.download_track(SONG, tmp_path, "256") == final_path
+    gamdl.song_cls.assert_called_once_with(gamdl.downloader, SongCodec.AAC_LEGACY)
+    gamdl.downloader.download.assert_not_called()
+
+def test_download_song_cancelled(gamdl, tmp_path):
+    gamdl.downloader.get_final_path.return_value = tmp_path / "01 Song.m4a"
+    gamdl.song.get_stream_info.return_value = StreamInfo(
+        stream_url="https://example.com/song.m3u8", widevine_pssh="pssh"
+    )
+    cancel = threading.Event()
+    cancel.set()
+
+    with pytest.raises(DownloadError):
+        gamdl.adapter.download_track(SONG, tmp_path, "256", cancel=cancel)
+    gamdl.song.remux.assert_not_called()
+    gamdl.downloader.move_to_output_path.assert_not_called()
+
+def test_download_music_video(gamdl, tmp_path):
+    final_path = tmp_path / "Artist" / "Video.m4v"
+    paths = {
+        name: tmp_path / downloader_module.TEMP_DIR_NAME / f"3_{name}"
+        for name in ("encrypted_video", "encrypted_audio", "decrypted_video", "decrypted_audio", "remuxed")
+    }
+    video = StreamInfo(stream_url="https://example.com/video.m3u8", widevine_pssh="video-pssh", codec="avc1")
+    audio = StreamInfo(stream_url="https://example.com/audio.m3u8", widevine_pssh="audio-pssh", codec="mp4a")
+    mv = gamdl.music_video
+    mv.get_music_video_id_alt.return_value = "alt"
+    mv.get_stream_url_from_itunes_page.return_value = "https://example.com/master.m3u8"
+    mv.get_tags.return_value = {'title': "Video"}
+    mv.get_stream_info_video.return_value = video
+    mv.get_stream_info_audio.return_value = audio
+    mv.get_encrypted_path_video.return_value = paths['encrypted_video']
+    mv.get_encrypted_path_audio.return_value = paths['encrypted_audio']
+    mv.get_decrypted_path_video.return_value = paths['decrypted_video']
+    mv.get_decrypted_path_audio.return_value = paths['decrypted_audio']
+    mv.get_remuxed_path.return_value = paths['remuxed']
+    gamdl.downloader.get_final_path.return_value = final_path
+    gamdl.downloader.get_decryption_key.side_effect = lambda pssh, track_id: f"{pssh}-key"
+
+    assert gamdl.adapter.download_track(MUSIC_VIDEO, tmp_path, "256") == final_path
+
+    itunes_page = gamdl.adapter.itunes_api.get_itunes_page.return_value
+    gamdl.adapter.itunes_api.get_itunes_page.assert_called_once_with("music-video", "alt")
+    mv.get_stream_url_from_itunes_page.assert_called_once_with(itunes_page)
+    mv.get_m3u8_master_data.assert_called_once_with("https://example.com/master.m3u8")
+    mv.decrypt.assert_any_call(paths['encrypted_video'], "video-pssh-key", paths['decrypted_video'])
+    mv.decrypt.assert_any_call(paths['encrypted_audio'], "audio-pssh-key", paths['decrypted_audio'])
+    mv.remux.assert_called_once_with(
+        paths['decrypted_video'], paths['decrypted_audio'], paths['remuxed'], "avc1", "mp4a"
+    )
+    gamdl.downloader.move_to_output_path.assert_called_once_with(paths['remuxed'], final_path)
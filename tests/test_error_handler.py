@@ -0,0 +1,66 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiohttp")
+
+from bot.utils.error_handler import ErrorNotifier, error_fingerprint
+
+ADMINS = [1, 2]
+
+def fail(value: str):
+    raise ValueError(value)
+
+def fail_elsewhere(value: str):
+    raise ValueError(value)
+
+def fail_again(value: str):
+    raise ValueError(value)
+
+def caught(func, value: str) -> BaseException:
+    try:
+        func(value)
+    except ValueError as e:
+        return e
+
+def texts(bot: AsyncMock, admin_id: int):
+    return [
+        call.kwargs['text'] for call in bot.send_message.await_args_list
+        if call.kwargs['chat_id'] == admin_id
+    ]
+
+def test_fingerprint_ignores_the_message():
+    assert error_fingerprint(caught(fail, "a")) == error_fingerprint(caught(fail, "b"))
+    assert error_fingerprint(caught(fail, "a")) != error_fingerprint(caught(fail_elsewhere, "a"))
+
+def test_repeats_are_folded_into_the_summary():
+    notifier = ErrorNotifier(AsyncMock(), ADMINS, interval=300)
+
+    async def main():
+        for value in ("first", "second", "third"):
+            await notifier.notify(caught(fail, value))
+        await notifier.notify(caught(fail_elsewhere, "other"))
+        await notifier.send_summary()
+
+    asyncio.run(main())
+    for admin_id in ADMINS:
+        first, other, summary = texts(notifier.bot, admin_id)
+        assert "Error: first" in first
+        assert "Error: other" in other
+        assert summary.startswith("📊 Errors in the last 5m")
+        assert "×2" in summary and "first" in summary
+
+def test_notifications_over_the_cap_are_counted():
+    notifier = ErrorNotifier(AsyncMock(), ADMINS[:1], interval=300, max_messages=2)
+
+    async def main():
+        for func in (fail, fail_elsewhere, fail_again):
+            await notifier.notify(caught(func, "x"))
+        await notifier.send_summary()
+
+    asyncio.run(main())
+    *errors, summary = texts(notifier.bot, ADMINS[0])
+    assert len(errors) == 2
+    assert "×1 notifications over the rate cap" in summary
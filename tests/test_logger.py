@@ -0,0 +1,61 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiohttp")
+
+from bot.utils.logger import LogChannelHandler
+from config.config import MAX_MESSAGE_LENGTH
+
+CHANNEL = -100
+URL = "https://music.apple.com/us/album/release/1000"
+
+def log(handler: LogChannelHandler, count: int, status: str = "completed"):
+    async def main():
+        handler.start()
+        for user_id in range(count):
+            await handler.log_download(user_id, URL, status)
+        await handler.stop()
+
+    asyncio.run(main())
+
+def test_handler_built_outside_the_loop():
+    # Like the bot: built after another loop has come and gone
+    asyncio.run(asyncio.sleep(0))
+    handler = LogChannelHandler(AsyncMock(), CHANNEL, digest=True)
+    log(handler, 1)
+    assert handler.bot.send_message.await_count == 1
+
+def test_digest_is_split_at_the_message_length():
+    handler = LogChannelHandler(AsyncMock(), CHANNEL, digest=True, digest_max_events=1000)
+    log(handler, 100)
+
+    texts = [call.kwargs['text'] for call in handler.bot.send_message.await_args_list]
+    assert len(texts) == 2
+    assert all(len(text) <= MAX_MESSAGE_LENGTH for text in texts)
+    assert all(text.startswith("🧾 Log Digest (100 events") for text in texts)
+    assert sum(text.count(URL) for text in texts) == 100
+
+def test_long_digest_is_sent_as_a_file():
+    handler = LogChannelHandler(AsyncMock(), CHANNEL, digest=True, digest_max_events=1000)
+    log(handler, 300)
+
+    handler.bot.send_message.assert_not_awaited()
+    document = handler.bot.send_document.await_args.kwargs
+    assert document['filename'].endswith(".txt")
+    assert document['document'].decode().count(URL) == 300
+
+def test_failed_download_flushes_right_away():
+    handler = LogChannelHandler(AsyncMock(), CHANNEL, digest=True)
+
+    async def main():
+        handler.start()
+        await handler.log_download(1, URL, "completed")
+        handler.bot.send_message.assert_not_awaited()
+        await handler.log_download(2, URL, "failed", error="boom")
+        assert handler.bot.send_message.await_args.kwargs['text'].count(URL) == 2
+        await handler.stop()
+
+    asyncio.run(main())
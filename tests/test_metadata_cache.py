@@ -0,0 +1,87 @@
+import asyncio
+from typing import List
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from bot.utils.metadata_cache import MetadataCache
+
+ALBUM = "https://music.apple.com/us/album/release/1000"
+SONG = "https://music.apple.com/us/song/track/2000"
+
+def fetcher(value, calls: List[str], delay: float = 0):
+    """A lookup that records each call"""
+    async def fetch():
+        calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+
+    return fetch
+
+def test_concurrent_misses_share_one_lookup(tmp_path):
+    cache = MetadataCache(tmp_path / "metadata.db")
+    calls = []
+
+    async def main():
+        return await asyncio.gather(*[cache.get(ALBUM, fetcher("tracks", calls, 0.05)) for _ in range(3)])
+
+    assert asyncio.run(main()) == ["tracks"] * 3
+    assert calls == ["tracks"]
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.close()
+
+def test_lookups_survive_a_restart(tmp_path):
+    calls = []
+    cache = MetadataCache(tmp_path / "metadata.db")
+    asyncio.run(cache.get(ALBUM, fetcher(["track-1", "track-2"], calls)))
+    cache.close()
+
+    cache = MetadataCache(tmp_path / "metadata.db")
+    assert asyncio.run(cache.get(ALBUM, fetcher(None, calls))) == ["track-1", "track-2"]
+    assert len(calls) == 1
+    cache.close()
+
+def test_expired_lookups_are_fetched_again(tmp_path):
+    cache = MetadataCache(tmp_path / "metadata.db", ttls={'album': -1, 'song': 3600})
+    calls = []
+
+    async def main():
+        for _ in range(2):
+            await cache.get(ALBUM, fetcher("album", calls))
+            await cache.get(SONG, fetcher("song", calls))
+
+    asyncio.run(main())
+    assert calls == ["album", "song", "album"]
+    cache.close()
+
+def test_memory_keeps_the_most_recent_entries(tmp_path):
+    cache = MetadataCache(tmp_path / "metadata.db", max_entries=2)
+    urls = [f"https://music.apple.com/us/album/release/{catalog_id}" for catalog_id in (1, 2, 3)]
+
+    async def main():
+        for url in urls:
+            await cache.get(url, fetcher(url, []))
+        await cache.get(urls[1], fetcher(None, []))
+
+    asyncio.run(main())
+    assert list(cache._memory) == ["us:album:3", "us:album:2"]
+    cache.close()
+
+def test_failed_lookups_are_not_cached(tmp_path):
+    cache = MetadataCache(tmp_path / "metadata.db")
+    calls = []
+
+    async def fail():
+        calls.append("fail")
+        await asyncio.sleep(0.05)
+        raise ValueError("catalog unavailable")
+
+    async def main():
+        results = await asyncio.gather(cache.get(ALBUM, fail), cache.get(ALBUM, fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        return await cache.get(ALBUM, fetcher("tracks", calls))
+
+    assert asyncio.run(main()) == "tracks"
+    assert calls == ["fail", "tracks"]
+    cache.close()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+import aiohttp
+
+from bot.utils.metrics import CACHE_REQUESTS, MetricsRegistry, MetricsServer, hit_ratio
+
+def test_render_in_prometheus_text_format():
+    registry = MetricsRegistry()
+    jobs = registry.counter("jobs_total", "Finished jobs", ["status"])
+    depth = registry.gauge("queue_depth", "Waiting jobs")
+    wait = registry.histogram("wait_seconds", "Queue wait", buckets=(1, 5))
+
+    jobs.inc(status="completed")
+    jobs.inc(2, status="failed")
+    depth.set_function(lambda: 3)
+    for seconds in (0.5, 2, 10):
+        wait.observe(seconds)
+
+    assert registry.render().splitlines() == [
+        "# HELP jobs_total Finished jobs",
+        "# TYPE jobs_total counter",
+        'jobs_total{status="completed"} 1',
+        'jobs_total{status="failed"} 2',
+        "# HELP queue_depth Waiting jobs",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+        "# HELP wait_seconds Queue wait",
+        "# TYPE wait_seconds histogram",
+        'wait_seconds_bucket{le="1"} 1',
+        'wait_seconds_bucket{le="5"} 2',
+        'wait_seconds_bucket{le="+Inf"} 3',
+        "wait_seconds_sum 12.5",
+        "wait_seconds_count 3"
+    ]
+    assert jobs.value() == 3
+    assert wait.summary() == (3, 12.5)
+
+def test_hit_ratio():
+    assert hit_ratio("test") is None
+    for result in ("hit", "hit", "hit", "miss"):
+        CACHE_REQUESTS.inc(cache="test", result=result)
+    assert hit_ratio("test") == 0.75
+
+def test_server_serves_the_registry():
+    registry = MetricsRegistry()
+    registry.counter("jobs_total", "Finished jobs").inc()
+
+    async def main():
+        server = MetricsServer("127.0.0.1", 0, registry)
+        await server.start()
+        try:
+            port = server._runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return response.status, await response.text()
+        finally:
+            await server.stop()
+
+    status, text = asyncio.run(main())
+    assert status == 200
+    assert "jobs_total 1" in text.splitlines()
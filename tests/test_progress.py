@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from benchmarks.synthetic import SyntheticDownloader
+from bot.utils.pipeline import stream_tracks
+from bot.utils.progress import ProgressReporter
+
+def status_message() -> SimpleNamespace:
+    return SimpleNamespace(edit_text=AsyncMock())
+
+def test_edits_stay_within_the_budget():
+    message = status_message()
+
+    async def main():
+        progress = ProgressReporter(message, interval=0.01, max_edits=4)
+        progress.set_items(2)
+        progress.start()
+        for _ in range(30):
+            progress.add_fetched(1000)
+            await asyncio.sleep(0.01)
+        await progress.stop()
+
+    asyncio.run(main())
+    # One edit of the budget is left for the final status
+    assert message.edit_text.await_count == 3
+
+def test_fetched_bytes_reach_the_progress(tmp_path):
+    downloader = SyntheticDownloader(
+        tracks_per_release=3, track_size=3000, resolve_latency=0, track_latency=0, jitter=0
+    )
+
+    async def main():
+        progress = ProgressReporter(status_message())
+        paths = [
+            path async for _, path in stream_tracks(
+                downloader, "https://music.apple.com/us/album/release/1000", tmp_path, "256", progress=progress
+            )
+        ]
+        await asyncio.sleep(0)  # Let the reports queued from the download threads run
+        assert len(paths) == 3
+        assert (progress.total_items, progress.ready_items) == (3, 3)
+        assert progress.fetched_bytes == progress.ready_bytes == 9000
+
+    asyncio.run(main())
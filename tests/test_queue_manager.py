@@ -0,0 +1,111 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from bot.utils.queue_manager import DownloadQueue
+
+ADMIN = 1
+ALICE = 10
+BOB = 20
+
+async def add(queue: DownloadQueue, user_id: int, name: str, ran: List[str], **kwargs) -> Dict:
+    """Queue a job that records its name when it runs"""
+    async def run(job: Dict):
+        ran.append(name)
+
+    return await queue.add_to_queue(user_id, f"https://music.apple.com/us/song/{name}/1", "256", 1, run, **kwargs)
+
+async def run_all(queue: DownloadQueue, jobs: List[Dict]):
+    queue.start()
+    try:
+        statuses = await asyncio.wait_for(asyncio.gather(*[job['done'] for job in jobs]), 5)
+        assert statuses == ['completed'] * len(jobs)
+    finally:
+        await queue.stop()
+
+def test_queue_built_outside_the_loop():
+    queue = DownloadQueue(max_concurrent=1)
+    ran = []
+
+    async def main():
+        await run_all(queue, [await add(queue, ALICE, "a1", ran)])
+
+    asyncio.run(main())
+    assert ran == ["a1"]
+
+def test_users_take_turns():
+    queue = DownloadQueue(max_concurrent=1)
+    ran = []
+
+    async def main():
+        jobs = [await add(queue, ALICE, f"a{i}", ran) for i in range(1, 5)]
+        jobs += [await add(queue, BOB, f"b{i}", ran) for i in range(1, 3)]
+        assert queue.get_position(jobs[4]['job_id']) == 1  # Bob's first job is next after Alice's first
+        await run_all(queue, jobs)
+
+    asyncio.run(main())
+    assert ran == ["a1", "b1", "a2", "b2", "a3", "a4"]
+
+def test_weights_give_a_larger_share():
+    queue = DownloadQueue(max_concurrent=1, user_weights={BOB: 2})
+    ran = []
+
+    async def main():
+        jobs = [await add(queue, ALICE, f"a{i}", ran) for i in range(1, 4)]
+        jobs += [await add(queue, BOB, f"b{i}", ran) for i in range(1, 4)]
+        await run_all(queue, jobs)
+
+    asyncio.run(main())
+    assert ran == ["b1", "a1", "b2", "b3", "a2", "a3"]
+
+def test_per_user_limit():
+    queue = DownloadQueue(max_concurrent=2, per_user_limit=1)
+    release = {}
+    started = []
+
+    async def add_blocking(user_id: int, name: str) -> Dict:
+        release[name] = asyncio.Event()
+
+        async def run(job: Dict):
+            started.append(name)
+            await release[name].wait()
+
+        return await queue.add_to_queue(user_id, "https://music.apple.com/us/song/x/1", "256", 1, run)
+
+    async def main():
+        jobs = [await add_blocking(ALICE, "a1"), await add_blocking(ALICE, "a2"), await add_blocking(BOB, "b1")]
+        queue.start()
+        try:
+            await asyncio.sleep(0.05)
+            # Alice's second job waits for her first, though a worker is free
+            assert sorted(started) == ["a1", "b1"]
+            release["b1"].set()
+            await asyncio.sleep(0.05)
+            assert sorted(started) == ["a1", "b1"]
+
+            release["a1"].set()
+            await asyncio.sleep(0.05)
+            assert started[-1] == "a2"
+            release["a2"].set()
+            await asyncio.wait_for(asyncio.gather(*[job['done'] for job in jobs]), 5)
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
+
+def test_priority_lane():
+    queue = DownloadQueue(max_concurrent=1, admin_users=[ADMIN])
+    ran = []
+
+    async def main():
+        jobs = [await add(queue, ALICE, "a1", ran), await add(queue, BOB, "b1", ran)]
+        jobs.append(await add(queue, ADMIN, "admin", ran))
+        jobs.append(await add(queue, BOB, "resumed", ran, resume=True))
+        assert queue.get_position(jobs[2]['job_id']) == 0
+        await run_all(queue, jobs)
+
+    asyncio.run(main())
+    assert ran == ["admin", "resumed", "a1", "b1"]
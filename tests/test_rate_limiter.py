@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import RetryAfter
+
+from bot.utils.rate_limiter import TelegramRateLimiter
+
+def run(limiter: TelegramRateLimiter, test):
+    async def main():
+        await limiter.initialize()
+        try:
+            await test()
+        finally:
+            await limiter.shutdown()
+
+    asyncio.run(main())
+
+def send(limiter: TelegramRateLimiter, chat_id: int, sent: List[Tuple[int, float]], endpoint: str = "sendMessage", **data):
+    """Send through the limiter, recording when the call went out"""
+    async def callback():
+        sent.append((chat_id, time.monotonic()))
+        return data.get('text', chat_id)
+
+    return limiter.process_request(callback, (), {}, endpoint, {'chat_id': chat_id, **data}, None)
+
+def test_sends_to_one_chat_are_spaced():
+    limiter = TelegramRateLimiter(global_rate=100, private_chat_rate=10)
+    sent = []
+
+    async def test():
+        await asyncio.gather(*[send(limiter, chat_id, sent) for chat_id in (5, 5, 5, 6)])
+
+    run(limiter, test)
+    times: Dict[int, List[float]] = {}
+    for chat_id, at in sent:
+        times.setdefault(chat_id, []).append(at)
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times[5], times[5][1:]))
+    # Another chat doesn't wait behind the first one's spacing
+    assert times[6][0] - times[5][0] < 0.05
+
+def test_retry_after_pauses_only_that_chat():
+    limiter = TelegramRateLimiter(global_rate=100, private_chat_rate=100)
+    sent = []
+    attempts = []
+
+    async def flooded():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(0.3)
+        return "sent"
+
+    async def test():
+        start = time.monotonic()
+        flood = asyncio.ensure_future(limiter.process_request(flooded, (), {}, "sendMessage", {'chat_id': 5}, None))
+        await asyncio.sleep(0.05)
+        await send(limiter, 6, sent)
+        assert sent[0][1] - start < 0.2
+        assert await flood == "sent"
+        assert attempts[1] - attempts[0] >= 0.29
+
+    run(limiter, test)
+
+def test_retry_after_gives_up_after_max_retries():
+    limiter = TelegramRateLimiter(global_rate=100, private_chat_rate=100, max_retries=2)
+    attempts = []
+
+    async def flooded():
+        attempts.append(time.monotonic())
+        raise RetryAfter(0.01)
+
+    async def test():
+        with pytest.raises(RetryAfter):
+            await limiter.process_request(flooded, (), {}, "sendMessage", {'chat_id': 5}, None)
+
+    run(limiter, test)
+    assert len(attempts) == 3
+
+def test_pending_edits_of_a_message_are_coalesced():
+    limiter = TelegramRateLimiter(global_rate=100, private_chat_rate=1)
+    sent = []
+
+    async def test():
+        # The first send takes the chat's token, so the edits queue up behind it
+        await send(limiter, 5, sent)
+        results = await asyncio.gather(*[
+            send(limiter, 5, sent, "editMessageText", message_id=1, text=f"{percent}%")
+            for percent in (10, 20, 30)
+        ])
+        assert results == ["30%"] * 3
+
+    run(limiter, test)
+    assert len(sent) == 2
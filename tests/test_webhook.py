@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiohttp")
+
+from aiohttp.test_utils import TestServer
+
+from bot.utils.webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+SECRET = "s3cret"
+UPDATE = b'{"update_id": 1}'
+
+def post(secret: Optional[bytes] = None) -> Tuple[int, asyncio.Queue]:
+    """POST an update with the given raw secret header, returning the status and the update queue"""
+    async def main():
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        server = WebhookServer(application, listen="127.0.0.1", port=0, path="/webhook", secret_token=SECRET)
+        async with TestServer(server._build_app()) as test_server:
+            reader, writer = await asyncio.open_connection(test_server.host, test_server.port)
+            writer.write(
+                b"POST /webhook HTTP/1.1\r\n"
+                b"Host: localhost\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: " + str(len(UPDATE)).encode() + b"\r\n"
+                + (SECRET_TOKEN_HEADER.encode() + b": " + secret + b"\r\n" if secret is not None else b"")
+                + b"Connection: close\r\n\r\n" + UPDATE
+            )
+            status_line = await reader.readline()
+            writer.close()
+            return int(status_line.split()[1]), application.update_queue
+
+    return asyncio.run(main())
+
+def test_updates_with_the_secret_are_queued():
+    status, update_queue = post(SECRET.encode())
+    assert status == 200
+    assert update_queue.get_nowait().update_id == 1
+
+@pytest.mark.parametrize("secret", [None, b"wrong", "sécret".encode(), b"s3cre\xff"], ids=["missing", "wrong", "non-ascii", "non-utf8"])
+def test_updates_without_the_secret_are_rejected(secret):
+    status, update_queue = post(secret)
+    assert status == 403
+    assert update_queue.empty()